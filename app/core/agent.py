@@ -1,49 +1,97 @@
-import os
+import time
 from langchain.agents import create_agent
-from langchain_openai import ChatOpenAI
 from langchain_core.tools import tool
-from langchain_core.messages import HumanMessage, ToolMessage, SystemMessage
+from langchain_core.messages import ToolMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 from app.core.rag import RAGManager
 from app.core.keyword_matcher import KeywordMatcher
 from app.core.few_shot_manager import FewShotManager
+from app.core.config_watcher import ConfigWatcher
+from app.core.prompt_builder import PromptBuilder, messages_text, observe_prompt_cache
+from app.core.llm_provider import get_provider_pool
+from app.core.metrics import RequestTrace
+from app.core.token_accounting import build_usage, get_token_ledger, usage_from_message
 from dotenv import load_dotenv
 
 load_dotenv()
 
+
+class RequestState:
+    """
+    单次请求的检索与生成信息（检索到的文档、token 统计、提示词前缀等）
+
+    每个请求一份：并发请求在各自的工作线程中运行，SSE metadata 从本请求的 state 读取，
+    不会读到其它请求的结果
+    """
+
+    def __init__(self, keyword_matched=False):
+        self.retrieved_docs = []
+        self.used_knowledge_base = False
+        self.used_direct_retrieval = False
+        self.used_few_shot = False
+        self.keyword_matched = keyword_matched
+        self.token_usage = None
+        self.prompt_parts = {}  # 提示词的组成部分（few_shot / context / query）
+        self.prompt_prefix = None  # 提示词的静态前缀（名称和 hash）
+        self.trace = None  # 分阶段耗时
+
+    def retrieval_info(self):
+        """检索信息（SSE metadata / 命令行展示）"""
+        return {
+            "used_knowledge_base": self.used_knowledge_base,
+            "used_direct_retrieval": self.used_direct_retrieval,
+            "used_few_shot": self.used_few_shot,
+            "keyword_matched": self.keyword_matched,  # 是否命中关键词
+            "retrieved_docs_count": len(self.retrieved_docs),
+            "token_usage": self.token_usage,
+            "prompt_prefix": self.prompt_prefix,
+            "sources": [
+                {
+                    "source": doc.metadata.get("source", "未知"),
+                    "page": doc.metadata.get("page", "未知"),
+                    "chapter": doc.metadata.get("chapter_title", ""),
+                    "preview": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
+                }
+                for doc in self.retrieved_docs
+            ]
+        }
+
+
 class AgentManager:
     def __init__(self, enable_few_shot=True, enable_direct_retrieval=False):
-        # 获取模型提供商配置
-        provider = os.getenv("MODEL_PROVIDER", "aliyun").lower()
-        self.provider = provider
+        # 获取模型提供商配置（连接池进程内共享，带重试预算和对冲请求）
+        self.llm_pool = get_provider_pool()
+        self.provider = self.llm_pool.primary
+        self.model_name = self.llm_pool.model_name()
+        # Agent 模式直接调用模型，使用带 SDK 重试的客户端
+        self.llm = self.llm_pool.get_agent_llm()
         self.enable_few_shot = enable_few_shot
         self.enable_direct_retrieval = enable_direct_retrieval  # 新增：是否启用直接检索
         
-        # 根据提供商初始化 LLM
-        if provider == "groq":
-            self.llm = ChatOpenAI(
-                model=os.getenv("GROQ_LLM_MODEL", "llama-3.3-70b-versatile"),
-                openai_api_base="https://api.groq.com/openai/v1",
-                openai_api_key=os.getenv("GROQ_API_KEY")
-            )
-            print(f"✅ 使用 Groq 模型: {os.getenv('GROQ_LLM_MODEL', 'llama-3.3-70b-versatile')}")
+        if self.provider == "groq":
+            print(f"✅ 使用 Groq 模型: {self.model_name}")
             print("ℹ️  Groq 使用简化的 RAG 模式（不使用 Agent）")
         else:  # 默认使用阿里云
-            self.llm = ChatOpenAI(
-                model=os.getenv("LLM_MODEL", "qwen-plus"),
-                openai_api_base="https://dashscope.aliyuncs.com/compatible-mode/v1",
-                openai_api_key=os.getenv("DASHSCOPE_API_KEY")
-            )
-            print(f"✅ 使用阿里云模型: {os.getenv('LLM_MODEL', 'qwen-plus')}")
+            print(f"✅ 使用阿里云模型: {self.model_name}")
+        if self.llm_pool.secondary:
+            print(f"🔀 备用提供商: {self.llm_pool.display_name(self.llm_pool.secondary)}")
         
         self.rag = RAGManager()
         self.keyword_matcher = KeywordMatcher()
-        self.few_shot_manager = FewShotManager() if enable_few_shot else None
-        self.last_retrieved_docs = []
-        self.used_knowledge_base = False
-        self.used_direct_retrieval = False
-        self.used_few_shot = False
-        self.keyword_matched = False  # 新增：标记是否命中关键词
+        # Few-Shot 示例按向量相似度选择，复用检索时计算的问题向量
+        self.few_shot_manager = FewShotManager(embeddings=self.rag.embeddings) if enable_few_shot else None
+        self.prompt_builder = PromptBuilder(self.few_shot_manager)
+        # 最近一次请求的信息（命令行等单请求场景使用；并发的 Web 请求各自传入 RequestState）
+        self.last_state = RequestState()
+        self.token_ledger = get_token_ledger()
+        
+        # 配置热加载（服务启动时调用 self.config_watcher.start() 开始后台轮询）
+        self.config_watcher = ConfigWatcher()
+        self.config_watcher.register("keywords", self.keyword_matcher.config_path, self._reload_keywords)
+        self.config_watcher.register("document_tags", self.rag.tagger.config_path, self.rag.tagger.reload)
+        if self.few_shot_manager:
+            self.config_watcher.register("few_shot_examples", self.few_shot_manager.config_path,
+                                         self.few_shot_manager.reload)
         
         # 打印关键词统计
         stats = self.keyword_matcher.get_statistics()
@@ -59,7 +107,21 @@ class AgentManager:
             print(f"📝 已加载 {few_shot_stats['总示例数']} 个 Few-Shot 示例")
             print("💡 Few-Shot 将统一回答格式和风格")
 
-    def create_agent(self):
+    def _reload_keywords(self):
+        """关键词配置变化：关键词匹配表和实体识别正则一起更新"""
+        self.rag.reload_entities()
+        self.keyword_matcher.reload()
+
+    def _begin(self, state=None, keyword_matched=False):
+        """本次请求的 state（未传入时新建），同时记为最近一次请求"""
+        state = state or RequestState()
+        state.keyword_matched = keyword_matched
+        self.last_state = state
+        return state
+
+    def create_agent(self, state=None):
+        """state: 检索工具写入的 RequestState（未传入时新建）"""
+        state = state or RequestState()
         # 1. 创建检索器
         retriever = self.rag.get_retriever()
         
@@ -69,8 +131,8 @@ class AgentManager:
             """搜索本地知识库中的信息。对于任何问题，都应该先使用此工具搜索知识库，看是否有相关内容。知识库中可能包含书籍、文档、技术资料等各种内容。"""
             docs = retriever.invoke(query)
             # 记录检索到的文档
-            self.last_retrieved_docs = docs
-            self.used_knowledge_base = True
+            state.retrieved_docs = docs
+            state.used_knowledge_base = True
             return "\n\n".join([d.page_content for d in docs])
 
         tools = [search_knowledge_base]
@@ -82,70 +144,82 @@ class AgentManager:
             system_prompt="你是一个智能助手。对于用户的任何问题，你都应该先使用 search_knowledge_base 工具搜索本地知识库。如果知识库中有相关内容，请基于知识库内容回答；如果知识库中没有相关内容，再使用你的通用知识回答。"
         )
 
-    def run_simple_rag(self, query: str, keyword_matched=False, book_filter=None):
+    def _retrieve_and_build_prompt(self, query: str, keyword_matched: bool, book_filter, trace: RequestTrace,
+                                   state: RequestState):
         """
-        简化的 RAG 实现，不使用 Agent（适用于 Groq）
+        检索相关文档并构建提示词（run_simple_rag 和 run_simple_rag_stream 共用），结果写入 state
         
-        参数:
-            query: 用户查询
-            keyword_matched: 是否命中关键词（用于优化检索策略）
-            book_filter: 书名过滤（如 "红楼梦"），只检索指定书籍
+        返回:
+            消息列表 [SystemMessage（可缓存前缀）, HumanMessage（知识库内容 + 问题）]
         """
-        # 重置状态
-        self.last_retrieved_docs = []
-        self.used_knowledge_base = False
-        self.used_few_shot = False
-        self.keyword_matched = keyword_matched  # 记录是否命中关键词
+        state.prompt_parts = {"few_shot": "", "context": "", "query": query}
         
         # 1. 检索相关文档
         # 如果命中关键词，增加检索数量以获得更全面的信息
         k = 8 if keyword_matched else 5
+        trace.set("k", k)
         
         # 如果指定了书名过滤
-        if book_filter:
-            print(f"📚 限定检索范围：{book_filter}")
-            docs = self.rag.search_by_book(query, book_filter, k=k)
-        else:
-            retriever = self.rag.get_retriever(k=k)
-            docs = retriever.invoke(query)
+        docs = None
+        query_vector = None
+        if keyword_matched and not book_filter:
+            # 命中关键词：优先使用导入时预计算的检索结果（不计算问题向量）
+            docs = self.rag.cached_search(query, k=k, trace=trace)
+            if docs is not None:
+                print("⚡ 命中关键词检索缓存")
+        if docs is None:
+            # 问题向量只算一次：检索和 Few-Shot 示例选择共用
+            query_vector = self.rag.embed_query(query, trace)
+            if book_filter:
+                print(f"📚 限定检索范围：{book_filter}")
+                docs = self.rag.search_by_book(query, book_filter, k=k, trace=trace, query_vector=query_vector)
+            else:
+                docs = self.rag.search(query, k=k, trace=trace, query_vector=query_vector)
         
-        self.last_retrieved_docs = docs
+        state.retrieved_docs = docs
         
         if keyword_matched:
             print(f"🎯 命中关键词，使用增强检索（k={k}）")
         
-        # 2. 构建提示词
-        if docs:
-            self.used_knowledge_base = True
-            context = "\n\n".join([doc.page_content for doc in docs])
-            
-            # 使用 Few-Shot（如果启用）
-            if self.few_shot_manager:
-                self.used_few_shot = True
-                prompt = self.few_shot_manager.build_few_shot_prompt(query, context)
-            else:
-                prompt = f"""你是一个智能助手。请基于以下知识库内容回答用户的问题。
-
-知识库内容：
-{context}
-
-用户问题：{query}
-
-请基于上述知识库内容回答问题。如果知识库内容不足以回答问题，可以结合你的通用知识补充。"""
-        else:
-            prompt = f"""你是一个智能助手。
-
-用户问题：{query}
+        # 2. 构建提示词（固定说明和示例在系统消息中作为可缓存前缀，知识库内容和问题在用户消息中）
+        with trace.span("prompt_build"):
+            context = ""
+            if docs:
+                state.used_knowledge_base = True
+                state.used_few_shot = self.few_shot_manager is not None
+                context = "\n\n".join([doc.page_content for doc in docs])
+                trace.set("context_chars", len(context))
+            messages, state.prompt_parts, state.prompt_prefix = self.prompt_builder.build(
+                query, context, query_vector=query_vector
+            )
+        
+        return messages
 
-请回答用户的问题。"""
+    def run_simple_rag(self, query: str, keyword_matched=False, book_filter=None, trace=None, state=None):
+        """
+        简化的 RAG 实现，不使用 Agent（适用于 Groq）
+        
+        参数:
+            query: 用户查询
+            keyword_matched: 是否命中关键词（用于优化检索策略）
+            book_filter: 书名过滤（如 "红楼梦"），只检索指定书籍
+            trace: 可选 RequestTrace，记录各阶段耗时
+            state: 可选 RequestState，接收本次请求的检索信息
+        """
+        state = self._begin(state, keyword_matched)
+        state.trace = trace = trace or RequestTrace()
+        messages = self._retrieve_and_build_prompt(query, keyword_matched, book_filter, trace, state)
         
         # 3. 调用 LLM
-        messages = [HumanMessage(content=prompt)]
-        response = self.llm.invoke(messages)
+        with trace.span("llm_total"):
+            response = self.llm_pool.invoke(messages)
         
+        self._record_token_usage(state, messages_text(messages), response.content, usage_from_message(response),
+                                 mode="simple_rag")
         return response.content
     
-    def run_simple_rag_stream(self, query: str, keyword_matched=False, book_filter=None):
+    def run_simple_rag_stream(self, query: str, keyword_matched=False, book_filter=None, cancel_event=None, trace=None,
+                              state=None):
         """
         简化的 RAG 实现（流式版本）
         
@@ -153,90 +227,92 @@ class AgentManager:
             query: 用户查询
             keyword_matched: 是否命中关键词（用于优化检索策略）
             book_filter: 书名过滤（如 "红楼梦"），只检索指定书籍
+            cancel_event: 可选 threading.Event，被设置后停止检索后的 LLM 调用并中断上游流
+            trace: 可选 RequestTrace，记录各阶段耗时（含首 token 时间和输出速率）
+            state: 可选 RequestState，生成结束后含本次请求的检索信息和 token 统计
         
         返回:
             生成器，逐个返回文本块
         """
-        # 重置状态
-        self.last_retrieved_docs = []
-        self.used_knowledge_base = False
-        self.used_few_shot = False
-        self.keyword_matched = keyword_matched
+        state = self._begin(state, keyword_matched)
+        state.trace = trace = trace or RequestTrace()
+        messages = self._retrieve_and_build_prompt(query, keyword_matched, book_filter, trace, state)
         
-        # 1. 检索相关文档
-        k = 8 if keyword_matched else 5
-        
-        if book_filter:
-            print(f"📚 限定检索范围：{book_filter}")
-            docs = self.rag.search_by_book(query, book_filter, k=k)
-        else:
-            retriever = self.rag.get_retriever(k=k)
-            docs = retriever.invoke(query)
-        
-        self.last_retrieved_docs = docs
-        
-        if keyword_matched:
-            print(f"🎯 命中关键词，使用增强检索（k={k}）")
-        
-        # 2. 构建提示词
-        if docs:
-            self.used_knowledge_base = True
-            context = "\n\n".join([doc.page_content for doc in docs])
-            
-            if self.few_shot_manager:
-                self.used_few_shot = True
-                prompt = self.few_shot_manager.build_few_shot_prompt(query, context)
-            else:
-                prompt = f"""你是一个智能助手。请基于以下知识库内容回答用户的问题。
-
-知识库内容：
-{context}
-
-用户问题：{query}
-
-请基于上述知识库内容回答问题。如果知识库内容不足以回答问题，可以结合你的通用知识补充。"""
-        else:
-            prompt = f"""你是一个智能助手。
-
-用户问题：{query}
-
-请回答用户的问题。"""
+        # 客户端已断开：检索完成后不再发起 LLM 调用
+        if cancel_event is not None and cancel_event.is_set():
+            return
         
         # 3. 流式调用 LLM
-        messages = [HumanMessage(content=prompt)]
-        for chunk in self.llm.stream(messages):
-            if hasattr(chunk, 'content') and chunk.content:
-                yield chunk.content
+        started = time.perf_counter()
+        first_token_at = None
+        token_count = 0
+        completion = []
+        provider_usage = None
+        stream = self.llm_pool.stream(messages, cancel_event=cancel_event)
+        try:
+            for chunk in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                # 提供商 usage 通常在最后一个（空内容）块中
+                provider_usage = usage_from_message(chunk) or provider_usage
+                if hasattr(chunk, 'content') and chunk.content:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        trace.record("llm_ttft", first_token_at - started)
+                    token_count += 1
+                    completion.append(chunk.content)
+                    yield chunk.content
+        finally:
+            # 关闭上游流（释放 HTTP 连接，停止继续消耗 token）
+            stream.close()
+            if first_token_at is not None:
+                generate_seconds = time.perf_counter() - first_token_at
+                trace.record("llm_generate", generate_seconds)
+                if generate_seconds > 0:
+                    trace.set("tokens_per_second", token_count / generate_seconds)
+                # 中途取消时已产生的 token 同样计费，照样记账
+                self._record_token_usage(state, messages_text(messages), "".join(completion), provider_usage,
+                                         mode="simple_rag_stream", ttft=first_token_at - started)
+    
+    def _record_token_usage(self, state, prompt: str, completion: str, provider_usage, mode: str, ttft=None):
+        """记录单次请求的 token 统计（写入 state、账本和指标，含前缀缓存命中情况）"""
+        usage = build_usage(prompt, completion, state.prompt_parts, provider_usage)
+        state.token_usage = usage
+        self.token_ledger.record(usage, self.provider, self.model_name, mode)
+        observe_prompt_cache((state.prompt_prefix or {}).get("name"), usage, ttft)
     
-    def run_stream(self, query: str):
-        """流式运行（入口方法）"""
+    def run_stream(self, query: str, cancel_event=None, trace=None, state=None):
+        """流式运行（入口方法）；state 为本次请求的 RequestState，生成结束后读取 retrieval_info()"""
+        trace = trace or RequestTrace()
         # 检查是否启用直接检索
         if self.enable_direct_retrieval:
-            should_direct, reason = self.keyword_matcher.should_use_direct_retrieval(query)
+            with trace.span("keyword_match"):
+                should_direct, reason = self.keyword_matcher.should_use_direct_retrieval(query)
             
             if should_direct:
                 print(f"🎯 {reason}")
-                return self.run_simple_rag_stream(query, keyword_matched=True)
+                return self.run_simple_rag_stream(query, keyword_matched=True, cancel_event=cancel_event, trace=trace,
+                                                  state=state)
             else:
                 print(f"🤖 {reason}")
         
         # 未命中关键词或未启用直接检索
-        return self.run_simple_rag_stream(query, keyword_matched=False)
+        return self.run_simple_rag_stream(query, keyword_matched=False, cancel_event=cancel_event, trace=trace,
+                                          state=state)
 
     def direct_retrieval(self, query: str) -> str:
         """
         直接检索模式 - 不使用 LLM，直接返回向量库检索结果
         适用于命中关键词的简单查询
         """
-        # 重置状态
-        self.last_retrieved_docs = []
-        self.used_knowledge_base = True
-        self.used_direct_retrieval = True
+        state = self._begin()
+        state.used_knowledge_base = True
+        state.used_direct_retrieval = True
         
         # 检索相关文档
         retriever = self.rag.get_retriever()
         docs = retriever.invoke(query)
-        self.last_retrieved_docs = docs
+        state.retrieved_docs = docs
         
         if not docs:
             return "抱歉，在知识库中没有找到相关内容。"
@@ -247,6 +323,10 @@ class AgentManager:
         for i, doc in enumerate(docs[:3], 1):
             content = doc.page_content.strip()
             source = doc.metadata.get("source", "未知")
+            if "page" not in doc.metadata and doc.metadata.get("chapter_title"):
+                # EPUB 按章加载，没有页码
+                result_parts.append(f"【片段 {i}】（来源：{source}，章节：{doc.metadata['chapter_title']}）\n{content}")
+                continue
             page = doc.metadata.get("page", "未知")
             
             result_parts.append(f"【片段 {i}】（来源：{source}，页码：{page}）\n{content}")
@@ -282,35 +362,33 @@ class AgentManager:
     
     def run_agent_mode(self, query: str):
         """阿里云 Agent 模式"""
-        # 重置状态
-        self.last_retrieved_docs = []
-        self.used_knowledge_base = False
-        self.used_direct_retrieval = False
-        
-        graph = self.create_agent()
+        state = self._begin()
+        graph = self.create_agent(state)
         # 调用图，输入消息列表
         inputs = {"messages": [{"role": "user", "content": query}]}
         result = graph.invoke(inputs)
         # 获取最后一条 AI 消息的内容
         messages = result.get("messages", [])
         if messages:
+            self._record_agent_token_usage(state, query, messages)
             return messages[-1].content
         return "未能生成回复。"
     
+    def _record_agent_token_usage(self, state, query: str, messages):
+        """Agent 模式会多次调用 LLM：累加每条 AI 消息的 usage"""
+        provider_usage = None
+        for message in messages:
+            usage = usage_from_message(message)
+            if usage:
+                provider_usage = provider_usage or {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+                for key, value in usage.items():
+                    provider_usage[key] += value
+        
+        tool_outputs = [m.content for m in messages if isinstance(m, ToolMessage)]
+        state.prompt_parts = {"few_shot": "", "context": "\n\n".join(tool_outputs), "query": query}
+        prompt = "\n".join(str(m.content) for m in messages[:-1])
+        self._record_token_usage(state, prompt, messages[-1].content, provider_usage, mode="agent")
+    
     def get_last_retrieval_info(self):
-        """获取最后一次检索的详细信息"""
-        return {
-            "used_knowledge_base": self.used_knowledge_base,
-            "used_direct_retrieval": self.used_direct_retrieval,
-            "used_few_shot": self.used_few_shot,
-            "keyword_matched": self.keyword_matched,  # 新增：是否命中关键词
-            "retrieved_docs_count": len(self.last_retrieved_docs),
-            "sources": [
-                {
-                    "source": doc.metadata.get("source", "未知"),
-                    "page": doc.metadata.get("page", "未知"),
-                    "preview": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
-                }
-                for doc in self.last_retrieved_docs
-            ]
-        }
+        """获取最近一次请求的检索信息（并发场景请读取各自 RequestState 的 retrieval_info()）"""
+        return self.last_state.retrieval_info()
@@ -0,0 +1,109 @@
+"""
+配置热加载
+后台线程按 mtime 轮询 config/ 下的 JSON 文件（关键词、Few-Shot 示例、文档标签），
+文件变化后在后台线程里重新解析并构建派生结构，再整体替换引用（读者要么看到旧配置，要么看到新配置），
+无需重启服务（不重新加载 Embedding 模型，也不中断进行中的 SSE 流）
+
+解析失败（如 JSON 写了一半）时保留旧配置并记录错误，文件再次变化时重试
+由 CONFIG_RELOAD_INTERVAL 控制轮询间隔（秒，默认 2，0 表示不轮询）
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+def file_version(path: str) -> Optional[str]:
+    """配置版本：文件内容的 sha1 前 12 位"""
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()[:12]
+    except OSError:
+        return None
+
+
+def _stat_key(path: str):
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+class ConfigWatcher:
+    def __init__(self, interval: float = None):
+        self.interval = interval if interval is not None else float(os.getenv("CONFIG_RELOAD_INTERVAL", "2"))
+        self._entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(self, name: str, path: str, reload: Callable[[], None]):
+        """
+        注册配置文件
+
+        参数:
+            reload: 重新加载函数；应先完整构建新状态再一次性替换，抛出异常表示加载失败（保留旧配置）
+        """
+        self._entries[name] = {
+            "path": path,
+            "reload": reload,
+            "stat": _stat_key(path),
+            "version": file_version(path),
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "reloads": 0,
+            "error": None,
+        }
+
+    def check(self) -> List[str]:
+        """检查一次，返回重新加载的配置名"""
+        reloaded = []
+        with self._lock:
+            for name, entry in self._entries.items():
+                stat = _stat_key(entry["path"])
+                if stat == entry["stat"]:
+                    continue
+                entry["stat"] = stat
+                version = file_version(entry["path"])
+                if version == entry["version"] and entry["error"] is None:
+                    continue
+                try:
+                    entry["reload"]()
+                except Exception as e:
+                    entry["error"] = f"{type(e).__name__}: {e}"
+                    print(f"⚠️  配置 {name} 重新加载失败，继续使用版本 {entry['version']}: {entry['error']}")
+                    continue
+                print(f"🔄 配置 {name} 已重新加载: {entry['version']} → {version}")
+                entry.update(version=version, loaded_at=time.strftime("%Y-%m-%dT%H:%M:%S"), error=None)
+                entry["reloads"] += 1
+                reloaded.append(name)
+        return reloaded
+
+    def start(self):
+        """启动后台轮询线程（interval 为 0 时不启动）"""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"⚠️  配置轮询出错: {e}")
+
+    def status(self) -> Dict:
+        """各配置文件当前加载的版本"""
+        return {
+            "interval_seconds": self.interval,
+            "watching": self._thread is not None and self._thread.is_alive(),
+            "configs": {
+                name: {key: entry[key] for key in ("path", "version", "loaded_at", "reloads", "error")}
+                for name, entry in self._entries.items()
+            },
+        }
@@ -0,0 +1,114 @@
+"""
+导入时的近似重复切片检测
+data/ 下同一部书常有多个版本（批注本与白文本、节选本），几乎相同的切片会各自 Embedding、入库，
+检索时前 k 个被同一段文字的多个副本占满。
+
+每个切片去掉空白和标点后取字符 shingle（默认 5 字），计算 MinHash 签名，用 LSH 分桶找候选，
+估计 Jaccard 相似度不低于 DEDUP_THRESHOLD（默认 0.85）即视为重复，在 Embedding 之前跳过
+（保留先导入的那一份）。跨文件检测：先导入的版本保留
+
+由 CHUNK_DEDUP=true 开启（默认关闭：被跳过的切片不入库，批注本中与白文本重合的段落
+只能从先导入的版本检索到，书名过滤检索后到的版本时会缺少这些段落）
+"""
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_NOISE = re.compile(r"[\W_]+")
+
+
+class NearDuplicateDetector:
+    """
+    MinHash + LSH 近似重复检测
+
+    参数:
+        threshold: 估计 Jaccard 相似度阈值
+        shingle: shingle 长度（字）
+        num_perm: MinHash 哈希函数个数
+        bands: LSH 分段数（每段 num_perm / bands 行；阈值约为 (1/bands)^(bands/num_perm)，低于 threshold 才不漏检）
+    """
+
+    def __init__(self, threshold: Optional[float] = None, shingle: Optional[int] = None,
+                 num_perm: Optional[int] = None, bands: Optional[int] = None, seed: int = 1):
+        self.threshold = threshold or float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+        self.shingle = shingle or int(os.getenv("DEDUP_SHINGLE", "5"))
+        self.num_perm = num_perm or int(os.getenv("DEDUP_NUM_PERM", "64"))
+        self.bands = bands or int(os.getenv("DEDUP_BANDS", "16"))
+        self.rows = self.num_perm // self.bands
+        rng = np.random.default_rng(seed)
+        # (a * x + b) mod p，a、b 取满 [0, p) 范围；uint64 乘法溢出回绕不影响作为哈希使用
+        self._a = rng.integers(1, MERSENNE_PRIME, self.num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, MERSENNE_PRIME, self.num_perm, dtype=np.uint64)
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        # 已保留切片的签名（取低 32 位存储，足够估计相似度）和来源
+        self._signatures: List[np.ndarray] = []
+        self._sources: List[str] = []
+        self.checked = 0
+        self.dropped = 0
+        self.dropped_chars = 0
+        self.pairs: Counter = Counter()
+
+    def signature(self, text: str) -> np.ndarray:
+        text = _NOISE.sub("", text)
+        size = self.shingle
+        shingles = {text[i:i + size] for i in range(max(len(text) - size + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % MERSENNE_PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def find(self, signature: np.ndarray) -> Optional[int]:
+        """已保留切片中与之近似重复的一个（下标），没有时返回 None"""
+        seen = set()
+        for band, key in self._band_keys(signature):
+            for index in self._buckets[band].get(key, ()):
+                if index in seen:
+                    continue
+                seen.add(index)
+                if (self._signatures[index] == signature).mean() >= self.threshold:
+                    return index
+        return None
+
+    def add(self, signature: np.ndarray, source: str = ""):
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        self._sources.append(source)
+        for band, key in self._band_keys(signature):
+            self._buckets[band].setdefault(key, []).append(index)
+
+    def filter(self, chunks) -> Tuple[list, list]:
+        """返回 (保留的切片, 跳过的切片)；保留的切片加入索引，供后续文件比对"""
+        kept, dropped = [], []
+        for chunk in chunks:
+            self.checked += 1
+            signature = self.signature(chunk.page_content)
+            source = os.path.basename(chunk.metadata.get("source", ""))
+            match = self.find(signature)
+            if match is None:
+                self.add(signature, source)
+                kept.append(chunk)
+                continue
+            self.dropped += 1
+            self.dropped_chars += len(chunk.page_content)
+            self.pairs[(source, self._sources[match])] += 1
+            dropped.append(chunk)
+        return kept, dropped
+
+    def statistics(self, top: int = 10) -> Dict:
+        return {
+            "threshold": self.threshold,
+            "checked": self.checked,
+            "dropped": self.dropped,
+            "dropped_chars": self.dropped_chars,
+            "signature_mb": round(len(self._signatures) * self.num_perm * 4 / 1024 / 1024, 2),
+            # 重复切片（前）与保留的那一份（后）所在文件
+            "pairs": {f"{dup} → {orig}": count for (dup, orig), count in self.pairs.most_common(top)},
+        }
@@ -4,14 +4,23 @@
 """
 import json
 import os
-from pathlib import Path
 
 class DocumentTagger:
     def __init__(self, config_path="config/document_tags.json"):
         self.config_path = config_path
         self.tags_config = self._load_config()
-        self.file_mapping = self.tags_config.get("文件名映射", {})
-        self.doc_tags = self.tags_config.get("文档标签映射", {})
+    
+    def reload(self):
+        """重新加载标签配置（热加载时由后台线程调用，解析完成后整体替换引用）"""
+        self.tags_config = self._load_config()
+    
+    @property
+    def file_mapping(self) -> dict:
+        return self.tags_config.get("文件名映射", {})
+    
+    @property
+    def doc_tags(self) -> dict:
+        return self.tags_config.get("文档标签映射", {})
     
     def _load_config(self):
         """加载标签配置"""
@@ -33,26 +42,31 @@ class DocumentTagger:
         # 提取文件名
         filename = os.path.basename(file_path)
         
+        # 同一次查找使用同一份配置（热加载可能在中途替换 tags_config）
+        config = self.tags_config
+        file_mapping = config.get("文件名映射", {})
+        doc_tags = config.get("文档标签映射", {})
+        
         # 查找映射
-        book_name = self.file_mapping.get(filename)
+        book_name = file_mapping.get(filename)
         
         if not book_name:
             # 尝试模糊匹配
-            for key in self.file_mapping.keys():
+            for key in file_mapping.keys():
                 if key in filename or filename in key:
-                    book_name = self.file_mapping[key]
+                    book_name = file_mapping[key]
                     break
         
         if not book_name:
             # 尝试从文件名中提取书名
-            for book in self.doc_tags.keys():
+            for book in doc_tags.keys():
                 if book in filename:
                     book_name = book
                     break
         
         # 返回标签
-        if book_name and book_name in self.doc_tags:
-            return self.doc_tags[book_name]
+        if book_name and book_name in doc_tags:
+            return doc_tags[book_name]
         
         return {"book": "未知", "category": ["其他"]}
     
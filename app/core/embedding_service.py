@@ -0,0 +1,232 @@
+"""
+共享 Embedding 服务
+多个 uvicorn worker 时，由一个独立进程加载 Embedding 模型，
+各 worker 通过 Unix socket 或本机 HTTP 调用，避免每个 worker 各占一份模型内存
+
+- 服务端：EmbeddingServer，把并发请求合并成批次后一次性调用模型
+- 客户端：EmbeddingServiceClient，实现 LangChain Embeddings 接口，可直接交给 Chroma
+"""
+import base64
+import http.client
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from array import array
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+from urllib.parse import urlparse
+
+from langchain_core.embeddings import Embeddings
+
+
+def _encode_vectors(vectors: List[List[float]]) -> dict:
+    """向量编码为 base64(float32)，比 JSON 浮点数组小约 5 倍"""
+    dim = len(vectors[0]) if vectors else 0
+    flat = array("f")
+    for vector in vectors:
+        flat.extend(vector)
+    return {"dim": dim, "count": len(vectors), "data": base64.b64encode(flat.tobytes()).decode("ascii")}
+
+
+def _decode_vectors(payload: dict) -> List[List[float]]:
+    flat = array("f")
+    flat.frombytes(base64.b64decode(payload["data"]))
+    dim = payload["dim"]
+    return [flat[i * dim:(i + 1) * dim].tolist() for i in range(payload["count"])]
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """通过 Unix socket 连接的 HTTPConnection"""
+
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class EmbeddingServiceClient(Embeddings):
+    """
+    Embedding 服务客户端
+
+    参数:
+        url: "unix:///tmp/kb_embedding.sock" 或 "http://127.0.0.1:8765"
+    """
+
+    def __init__(self, url: str, timeout: float = 60.0):
+        self.url = url
+        self.timeout = timeout
+        self._parsed = urlparse(url)
+        self._local = threading.local()  # 每个线程一个长连接
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self._parsed.scheme == "unix":
+                conn = _UnixHTTPConnection(self._parsed.path, self.timeout)
+            else:
+                conn = http.client.HTTPConnection(self._parsed.hostname, self._parsed.port or 80, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _request(self, method: str, path: str, payload=None) -> dict:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body else {}
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = json.loads(response.read())
+                if response.status != 200:
+                    raise RuntimeError(f"Embedding 服务返回错误: {data.get('error', response.status)}")
+                return data
+            except (ConnectionError, http.client.HTTPException, OSError):
+                # 长连接被服务端关闭：重建连接后重试一次
+                conn.close()
+                self._local.conn = None
+                if attempt == 1:
+                    raise
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return _decode_vectors(self._request("POST", "/embed", {"texts": list(texts)}))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def health(self) -> dict:
+        return self._request("GET", "/health")
+
+
+class EmbeddingServer:
+    """
+    Embedding 服务端：持有模型，合并并发请求成批计算
+
+    参数:
+        embeddings: LangChain Embeddings 实例（通常是本地 bge 模型）
+        max_batch: 单批最多文本数
+        max_wait_ms: 凑批最多等待的毫秒数
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str = "", max_batch: int = 64, max_wait_ms: float = 5.0):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: queue.Queue = queue.Queue()
+        self.batches = 0
+        self.texts = 0
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+
+    def submit(self, texts: List[str]) -> Future:
+        future: Future = Future()
+        self._queue.put((texts, future))
+        return future
+
+    def _batch_loop(self):
+        while True:
+            pending = [self._queue.get()]
+            count = len(pending[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while count < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                count += len(item[0])
+
+            texts = [text for item_texts, _ in pending for text in item_texts]
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.texts += len(texts)
+            offset = 0
+            for item_texts, future in pending:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def address_string(self):
+                # Unix socket 没有客户端地址
+                return self.client_address[0] if self.client_address else "unix"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/health":
+                    self._send(200, {
+                        "model": server.model_name,
+                        "batches": server.batches,
+                        "texts": server.texts,
+                        "avg_batch_size": round(server.texts / server.batches, 2) if server.batches else 0,
+                    })
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def do_POST(self):
+                if self.path != "/embed":
+                    self._send(404, {"error": "not found"})
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    texts = json.loads(self.rfile.read(length))["texts"]
+                    vectors = server.submit(texts).result()
+                    self._send(200, _encode_vectors(vectors))
+                except Exception as e:
+                    self._send(500, {"error": str(e)})
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def serve(self, url: str):
+        """在 url 上提供服务（阻塞）"""
+        parsed = urlparse(url)
+        if parsed.scheme == "unix":
+            if os.path.exists(parsed.path):
+                os.remove(parsed.path)
+            httpd = _ThreadingUnixHTTPServer(parsed.path, self.make_handler())
+        else:
+            httpd = ThreadingHTTPServer((parsed.hostname, parsed.port or 80), self.make_handler())
+        httpd.daemon_threads = True
+        try:
+            httpd.serve_forever()
+        finally:
+            httpd.server_close()
+            if parsed.scheme == "unix" and os.path.exists(parsed.path):
+                os.remove(parsed.path)
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """基于 Unix socket 的多线程 HTTP 服务器"""
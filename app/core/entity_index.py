@@ -0,0 +1,128 @@
+"""
+实体级切片标签与倒排索引
+导入时用 config/keywords.json 中各书的人物、地点、物品、诗词等词条扫描每个切片，
+把命中的实体写入切片元数据（entities 字段），并建立 实体 → 切片 id 的倒排索引
+（<persist_dir>/entity_index.json，随向量库版本一起切换）
+
+检索时问题中提到已知实体（如 林黛玉）：
+- boost：照常检索更多候选，提到该实体的切片排在前面（默认）
+- restrict：只在提到该实体的切片中做精确检索，候选过多时退回 boost
+
+由 ENTITY_RETRIEVAL=off|boost|restrict 控制（默认 off）
+"""
+import json
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Set
+
+ENTITY_INDEX_FILE = "entity_index.json"
+# 每个切片最多记录的实体数（按出现次数）
+MAX_ENTITIES_PER_CHUNK = 20
+ENTITY_SEPARATOR = ", "
+
+
+class EntityExtractor:
+    """按 keywords.json 中的词条在文本里查找实体（最长匹配优先，如 贾宝玉 不会被拆成 宝玉）"""
+
+    def __init__(self, config_path: str = "config/keywords.json"):
+        self.config_path = config_path
+        self.entities: Dict[str, Dict] = {}
+        if os.path.exists(config_path):
+            with open(config_path, "r", encoding="utf-8") as f:
+                keywords = json.load(f)
+            for book, categories in keywords.get("四大名著", {}).items():
+                for category, words in categories.items():
+                    for word in words:
+                        self.entities.setdefault(word, {"book": book, "category": category})
+        # 一个交替正则一次扫描完所有词条；按长度降序保证最长匹配
+        names = sorted(self.entities, key=len, reverse=True)
+        self._pattern = re.compile("|".join(map(re.escape, names))) if names else None
+
+    def find(self, text: str) -> Counter:
+        """文本中出现的实体及次数"""
+        if self._pattern is None or not text:
+            return Counter()
+        return Counter(self._pattern.findall(text))
+
+    def tag_chunks(self, chunks) -> None:
+        """把切片中出现的实体写入 metadata["entities"]（逗号分隔，Chroma 不支持列表）"""
+        for chunk in chunks:
+            found = self.find(chunk.page_content)
+            chunk.metadata["entities"] = ENTITY_SEPARATOR.join(
+                name for name, _ in found.most_common(MAX_ENTITIES_PER_CHUNK)
+            )
+
+
+def parse_entities(value) -> List[str]:
+    """metadata["entities"] → 实体列表"""
+    return [name for name in (value or "").split(ENTITY_SEPARATOR) if name]
+
+
+class EntityIndex:
+    """实体 → 切片 id 倒排索引"""
+
+    def __init__(self, postings: Dict[str, List[str]] = None):
+        self.postings: Dict[str, List[str]] = postings or {}
+
+    def add(self, chunk_id: str, entities: Iterable[str]):
+        for name in entities:
+            self.postings.setdefault(name, []).append(chunk_id)
+
+    def add_chunks(self, ids: List[str], chunks):
+        for chunk_id, chunk in zip(ids, chunks):
+            self.add(chunk_id, parse_entities(chunk.metadata.get("entities")))
+
+    def lookup(self, entities: Iterable[str]) -> Set[str]:
+        """提到任一实体的切片 id"""
+        result = set()
+        for name in entities:
+            result.update(self.postings.get(name, ()))
+        return result
+
+    def save(self, directory: str):
+        path = os.path.join(directory, ENTITY_INDEX_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"postings": self.postings}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory: str):
+        path = os.path.join(directory, ENTITY_INDEX_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["postings"])
+
+    @classmethod
+    def from_collection(cls, collection, extractor: EntityExtractor = None, batch_size: int = 1000):
+        """
+        从已有集合重建倒排索引
+
+        传入 extractor 时重新扫描切片文本并回写 entities 元数据（用于导入前没有实体标签的旧向量库）
+        """
+        from app.core.quantized_store import iter_collection
+
+        index = cls()
+        include = ("documents", "metadatas") if extractor else ("metadatas",)
+        for batch in iter_collection(collection, batch_size, include=include):
+            metadatas = [metadata or {} for metadata in batch["metadatas"]]
+            if extractor:
+                for text, metadata in zip(batch["documents"], metadatas):
+                    found = extractor.find(text)
+                    metadata["entities"] = ENTITY_SEPARATOR.join(
+                        name for name, _ in found.most_common(MAX_ENTITIES_PER_CHUNK)
+                    )
+                collection.update(ids=batch["ids"], metadatas=metadatas)
+            for chunk_id, metadata in zip(batch["ids"], metadatas):
+                index.add(chunk_id, parse_entities(metadata.get("entities")))
+        return index
+
+    def statistics(self, top: int = 10) -> Dict:
+        sizes = sorted(((len(ids), name) for name, ids in self.postings.items()), reverse=True)
+        return {
+            "entities": len(self.postings),
+            "postings": sum(size for size, _ in sizes),
+            "top": {name: size for size, name in sizes[:top]},
+        }
@@ -0,0 +1,130 @@
+"""
+EPUB 章节加载器
+直接用 ebooklib 按 spine 顺序逐章读取 XHTML，用正则去掉标签（不经过 unstructured / pandoc），
+每一章（回）输出一个 Document，元数据记录章节序号和标题：
+
+    chapter_index  spine 中的章节顺序（从 0 开始）
+    chapter        章回号（「第一百二十回」→ 120），标题中没有时不设置
+    chapter_title  章节标题（取正文第一个 h1~h3，其次目录中的标题、<title>）
+
+切片按 Document 进行，因此切片不会跨章；small-to-big 时每章即一个父文本。
+没有标题的 XHTML（长章节被拆成多个文件时的后续部分）并入上一章
+
+由 EPUB_LOADER=native|unstructured 选择加载器（默认 native）
+"""
+import html
+import re
+from typing import Dict, Iterator, Optional
+
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+
+CHINESE_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4,
+                  "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+CHINESE_UNITS = {"十": 10, "百": 100, "千": 1000}
+CHAPTER_PATTERN = re.compile(r"第\s*([0-9０-９零〇一二两三四五六七八九十百千]+)\s*[回章节卷]")
+
+_DROP = re.compile(r"<(script|style|head)\b.*?</\1\s*>", re.S | re.I)
+_BLOCK_END = re.compile(r"<(?:br|/p|/div|/h[1-6]|/li|/tr|/blockquote|/section)\b[^>]*>", re.I)
+_TAG = re.compile(r"<[^>]+>")
+_HEADING = re.compile(r"<h([1-3])\b[^>]*>(.*?)</h\1\s*>", re.S | re.I)
+_TITLE = re.compile(r"<title\b[^>]*>(.*?)</title\s*>", re.S | re.I)
+
+
+def chinese_to_int(text: str) -> Optional[int]:
+    """中文或阿拉伯数字 → 整数（「一百二十」→ 120，「十一」→ 11，「一〇五」→ 105），无法识别时返回 None"""
+    text = text.strip()
+    if text.isdigit():
+        return int(text)
+    if not text or any(ch not in CHINESE_DIGITS and ch not in CHINESE_UNITS for ch in text):
+        return None
+    if not any(ch in CHINESE_UNITS for ch in text):
+        # 逐位写法
+        return int("".join(str(CHINESE_DIGITS[ch]) for ch in text))
+    total, current = 0, 0
+    for ch in text:
+        if ch in CHINESE_DIGITS:
+            current = CHINESE_DIGITS[ch]
+        else:
+            total += (current or 1) * CHINESE_UNITS[ch]
+            current = 0
+    return total + current
+
+
+def chapter_number(title: str) -> Optional[int]:
+    """标题中的章回号（「第三回 贾雨村夤缘复旧职」→ 3）"""
+    match = CHAPTER_PATTERN.search(title or "")
+    return chinese_to_int(match.group(1)) if match else None
+
+
+def _inline_text(fragment: str) -> str:
+    return " ".join(html.unescape(_TAG.sub("", fragment)).split())
+
+
+def html_to_text(content: str) -> str:
+    """XHTML → 纯文本：去掉 script / style / head，块级标签换行，每段一行"""
+    content = _DROP.sub("", content)
+    content = _BLOCK_END.sub("\n", content)
+    text = html.unescape(_TAG.sub("", content))
+    lines = (line.strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def html_title(content: str) -> str:
+    """正文第一个 h1~h3，其次 <title>"""
+    match = _HEADING.search(content) or _TITLE.search(content)
+    return _inline_text(match.group(match.lastindex)) if match else ""
+
+
+def _toc_titles(toc, titles: Dict[str, str] = None) -> Dict[str, str]:
+    """目录 → {文件 href: 标题}（同一文件取第一个条目）"""
+    titles = {} if titles is None else titles
+    for entry in toc:
+        if isinstance(entry, (tuple, list)):
+            section, children = entry
+            _toc_titles([section], titles)
+            _toc_titles(children, titles)
+        elif getattr(entry, "href", None):
+            titles.setdefault(entry.href.split("#")[0], entry.title)
+    return titles
+
+
+class EpubChapterLoader(BaseLoader):
+    """EPUB → 每章一个 Document"""
+
+    def __init__(self, file_path: str):
+        self.file_path = str(file_path)
+
+    def lazy_load(self) -> Iterator[Document]:
+        import ebooklib
+        from ebooklib import epub
+
+        book = epub.read_epub(self.file_path)
+        toc_titles = _toc_titles(book.toc)
+        chapter = None
+        index = 0
+        for idref, _ in book.spine:
+            item = book.get_item_with_id(idref)
+            if item is None or item.get_type() != ebooklib.ITEM_DOCUMENT:
+                continue
+            content = item.get_content().decode("utf-8", errors="ignore")
+            text = html_to_text(content)
+            if not text:
+                continue
+            title = html_title(content) or toc_titles.get(item.get_name(), "")
+            if chapter is not None and not title:
+                chapter["texts"].append(text)
+                continue
+            if chapter is not None:
+                yield self._document(chapter)
+            chapter = {"index": index, "title": title, "texts": [text]}
+            index += 1
+        if chapter is not None:
+            yield self._document(chapter)
+
+    def _document(self, chapter: Dict) -> Document:
+        metadata = {"source": self.file_path, "chapter_index": chapter["index"], "chapter_title": chapter["title"]}
+        number = chapter_number(chapter["title"])
+        if number is not None:
+            metadata["chapter"] = number
+        return Document(page_content="\n".join(chapter["texts"]), metadata=metadata)
@@ -1,15 +1,124 @@
 """
 Few-Shot 示例管理器
-根据问题类型自动选择合适的示例
+传入 Embedding 时按向量相似度为每个问题挑选最相近的示例（在 token 预算内），
+示例向量加载时计算一次并缓存到 .cache/；否则根据问题类型关键词选择示例
 """
+import hashlib
 import json
 import os
 from typing import List, Dict, Optional
 
+from app.core.token_accounting import estimate_tokens
+
 class FewShotManager:
-    def __init__(self, config_path="config/few_shot_examples.json"):
+    def __init__(self, config_path="config/few_shot_examples.json", embeddings=None):
         self.config_path = config_path
-        self.examples = self._load_examples()
+        self.embeddings = embeddings
+        self.cache_dir = os.getenv("FEW_SHOT_CACHE_DIR", ".cache")
+        self.max_examples = int(os.getenv("FEW_SHOT_MAX_EXAMPLES", "2"))
+        self.token_budget = int(os.getenv("FEW_SHOT_TOKEN_BUDGET", "600"))
+        self.min_similarity = float(os.getenv("FEW_SHOT_MIN_SIMILARITY", "0"))
+        self.reload()
+    
+    def reload(self):
+        """重新加载示例和示例向量（热加载时由后台线程调用，全部构建完成后再替换引用）"""
+        examples = self._load_examples()
+        index = self._build_vector_index(examples)
+        self.examples, self._vector_index = examples, index
+    
+    def _build_vector_index(self, examples: Dict):
+        """
+        示例向量：按 (模型, 示例问题) 的哈希缓存到 .cache/，示例不变时不重新计算
+        
+        返回:
+            (示例列表, 归一化后的向量矩阵, 各示例的类型)，没有 Embedding 或示例时为 None
+        """
+        flat = [example for items in examples.values() for example in items]
+        categories = [category for category, items in examples.items() for _ in items]
+        if self.embeddings is None or not flat:
+            return None
+        import numpy as np
+        
+        queries = [example["query"] for example in flat]
+        model = os.getenv("LOCAL_EMBEDDING_MODEL", "BAAI/bge-large-zh-v1.5")
+        digest = hashlib.sha1(json.dumps([model, queries], ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+        cache_path = os.path.join(self.cache_dir, f"few_shot_vectors_{digest}.npy")
+        if os.path.exists(cache_path):
+            vectors = np.load(cache_path)
+        else:
+            vectors = np.asarray(self.embeddings.embed_documents(queries), dtype=np.float32)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.save(cache_path + ".tmp.npy", vectors)
+            os.replace(cache_path + ".tmp.npy", cache_path)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return flat, vectors, categories
+    
+    def select_examples(self, query_vector, max_examples: int = None, token_budget: int = None) -> List[Dict]:
+        """
+        按与问题向量的余弦相似度选择示例，累计 token 不超过预算
+        
+        参数:
+            query_vector: 检索时已经计算好的问题向量（不再额外调用模型）
+        """
+        index = self._vector_index
+        if index is None or query_vector is None:
+            return []
+        import numpy as np
+        
+        flat, vectors, _ = index
+        max_examples = max_examples or self.max_examples
+        budget = token_budget if token_budget is not None else self.token_budget
+        query = np.asarray(query_vector, dtype=np.float32)
+        if query.shape[0] != vectors.shape[1]:
+            return []
+        scores = vectors @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        ranked = [flat[i] for i in np.argsort(-scores) if scores[i] >= self.min_similarity]
+        return self._within_budget(ranked, max_examples, budget)
+    
+    def _within_budget(self, examples: List[Dict], max_examples: int = None, budget: int = None) -> List[Dict]:
+        """按顺序取示例，最多 max_examples 个，累计估算 token 不超过预算"""
+        max_examples = max_examples or self.max_examples
+        budget = budget if budget is not None else self.token_budget
+        selected, used = [], 0
+        for example in examples:
+            if len(selected) >= max_examples:
+                break
+            cost = estimate_tokens(self.format_examples_for_prompt([example]))
+            if used + cost > budget:
+                continue
+            selected.append(example)
+            used += cost
+        return selected
+    
+    def _nearest_type(self, query_vector) -> Optional[str]:
+        """与问题向量最相近的示例所属的类型"""
+        index = self._vector_index
+        if index is None or query_vector is None:
+            return None
+        import numpy as np
+        
+        _, vectors, categories = index
+        query = np.asarray(query_vector, dtype=np.float32)
+        if query.shape[0] != vectors.shape[1]:
+            return None
+        scores = vectors @ query
+        best = int(np.argmax(scores))
+        return categories[best] if scores[best] >= self.min_similarity * float(np.linalg.norm(query)) else None
+    
+    def prefix_examples(self, query: str, query_vector=None):
+        """
+        放进系统消息前缀的示例：先确定问题类型（有示例向量时取最相近示例的类型，否则按关键词判断），
+        再取该类型的固定示例，同一类型每次逐字节相同，便于提供商缓存前缀
+        
+        返回:
+            (问题类型, 示例列表)
+        """
+        question_type = self._nearest_type(query_vector) or self.detect_question_type(query)
+        if question_type in self.examples:
+            candidates = self.examples[question_type]
+        else:
+            candidates = self.get_examples(None, max_examples=self.max_examples)
+        return question_type, self._within_budget(candidates)
     
     def _load_examples(self) -> Dict:
         """加载 Few-Shot 示例配置"""
@@ -89,23 +198,24 @@ class FewShotManager:
         formatted += "---\n\n现在请回答用户的问题：\n"
         return formatted
     
-    def build_few_shot_prompt(self, query: str, context: str, auto_detect: bool = True) -> str:
+    def build_few_shot_prompt(self, query: str, context: str, auto_detect: bool = True, query_vector=None) -> str:
         """
-        构建包含 Few-Shot 示例的完整提示词
+        构建包含 Few-Shot 示例的完整提示词（单条文本；服务端的提示词由 PromptBuilder 组装）
         
         参数:
             query: 用户问题
             context: 从知识库检索到的内容
             auto_detect: 是否自动检测问题类型
+            query_vector: 可选问题向量；有示例向量时按相似度选择示例，否则按问题类型
         
         返回:
             完整的提示词
         """
-        # 检测问题类型
-        question_type = self.detect_question_type(query) if auto_detect else None
-        
-        # 获取示例
-        examples = self.get_examples(question_type, max_examples=2)
+        examples = self.select_examples(query_vector) if query_vector is not None else []
+        if not examples:
+            # 检测问题类型
+            question_type = self.detect_question_type(query) if auto_detect else None
+            examples = self.get_examples(question_type, max_examples=self.max_examples)
         
         # 构建提示词
         prompt = ""
@@ -0,0 +1,196 @@
+"""
+向量库导出 / 导入（便携包）
+新节点无需重新计算 Embedding：导出切片文本、元数据和向量到一个 zip 包，导入时批量写入 Chroma
+
+包内容:
+    manifest.json   格式版本、向量数 / 维度、Embedding 模型、各文件的 sha256
+    vectors.npy     float32 向量矩阵（N × D）
+    ids.json        切片 id
+    documents.json  切片文本
+    metadata.json   按列存储的元数据 {字段: [值, ...]}，缺失为 null
+    parents/...     可选附件：父文本库（small-to-big），原样打包
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from typing import Dict, Optional
+
+import numpy as np
+
+from app.core.quantized_store import iter_collection
+
+BUNDLE_FORMAT = 1
+# 常用字段排在前面；其它元数据字段同样按列导出
+METADATA_FIELDS = ("book", "author", "dynasty", "genre", "category", "keywords", "entities", "source", "page",
+                   "chapter", "chapter_title")
+HASH_BLOCK = 1024 * 1024
+
+
+class BundleError(Exception):
+    """包格式错误或校验失败"""
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def export_bundle(collection, path: str, embedding_model: str = "", index_version: Optional[str] = None,
+                  batch_size: int = 1000, attachments: Optional[Dict[str, str]] = None) -> Dict:
+    """
+    把集合导出为便携包
+
+    向量按批写入磁盘上的 .npy（memmap），不会把整个矩阵放进内存
+
+    参数:
+        attachments: 额外打包的文件 {包内路径: 本地路径}（如父文本库）
+    返回 manifest
+    """
+    count = collection.count()
+    if not count:
+        raise BundleError("向量库为空，无需导出")
+
+    workdir = tempfile.mkdtemp(prefix="kb_export_")
+    try:
+        vectors = None
+        ids, documents, rows = [], [], []
+        for batch in iter_collection(collection, batch_size, include=("embeddings", "documents", "metadatas")):
+            embeddings = np.asarray(batch["embeddings"], dtype=np.float32)
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(os.path.join(workdir, "vectors.npy"), mode="w+",
+                                                    dtype=np.float32, shape=(count, embeddings.shape[1]))
+            vectors[len(ids):len(ids) + len(embeddings)] = embeddings
+            ids.extend(batch["ids"])
+            documents.extend(batch["documents"])
+            rows.extend(metadata or {} for metadata in batch["metadatas"])
+        if len(ids) != count:
+            raise BundleError(f"导出过程中向量库发生变化（{count} → {len(ids)}）")
+        dim = int(vectors.shape[1])
+        vectors.flush()
+        del vectors
+
+        present = {key for row in rows for key in row}
+        fields = [field for field in METADATA_FIELDS if field in present] + sorted(present - set(METADATA_FIELDS))
+        columns = {field: [row.get(field) for row in rows] for field in fields}
+        for name, data in (("ids.json", ids), ("documents.json", documents), ("metadata.json", columns)):
+            with open(os.path.join(workdir, name), "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+
+        files = ("vectors.npy", "ids.json", "documents.json", "metadata.json")
+        attachments = attachments or {}
+        manifest = {
+            "format": BUNDLE_FORMAT,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "count": count,
+            "dim": dim,
+            "embedding_model": embedding_model,
+            "index_version": index_version,
+            "metadata_fields": fields,
+            "attachments": sorted(attachments),
+            "sha256": {name: file_sha256(os.path.join(workdir, name)) for name in files},
+        }
+        manifest["sha256"].update((name, file_sha256(local)) for name, local in attachments.items())
+
+        tmp_path = path + ".tmp"
+        with zipfile.ZipFile(tmp_path, "w") as bundle:
+            bundle.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+            # 向量几乎不可压缩，直接存储；文本和元数据压缩
+            bundle.write(os.path.join(workdir, "vectors.npy"), "vectors.npy", compress_type=zipfile.ZIP_STORED)
+            for name in files[1:]:
+                bundle.write(os.path.join(workdir, name), name, compress_type=zipfile.ZIP_DEFLATED)
+            for name, local in attachments.items():
+                bundle.write(local, name, compress_type=zipfile.ZIP_DEFLATED)
+        os.replace(tmp_path, path)
+        return manifest
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def read_manifest(path: str) -> Dict:
+    with zipfile.ZipFile(path) as bundle:
+        try:
+            manifest = json.loads(bundle.read("manifest.json"))
+        except KeyError:
+            raise BundleError(f"{path} 不是向量库导出包（缺少 manifest.json）")
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise BundleError(f"不支持的包格式版本: {manifest.get('format')}")
+    return manifest
+
+
+def attachment_path(root: str, name: str) -> str:
+    """附件在 root 下的路径；名称为绝对路径、含 .. 或解析后不在 root 内时抛出 BundleError"""
+    parts = name.replace("\\", "/").split("/")
+    if not name or os.path.isabs(name) or os.path.splitdrive(name)[0] or ".." in parts:
+        raise BundleError(f"附件名不合法: {name!r}")
+    root = os.path.realpath(root)
+    target = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, target]) != root or target == root:
+        raise BundleError(f"附件路径超出目标目录: {name!r}")
+    return target
+
+
+def import_bundle(path: str, collection, batch_size: int = 5000, verify: bool = True,
+                  attachments_dir: Optional[str] = None) -> Dict:
+    """
+    把便携包批量写入集合（直接写入向量，不调用 Embedding 模型）
+
+    参数:
+        collection: 目标 Chroma 集合（通常是新建的空版本）
+        verify: 写入前校验各文件的 sha256
+        attachments_dir: 附件解压到的目录（通常是新版本目录），None 表示忽略附件
+    返回 manifest
+    """
+    manifest = read_manifest(path)
+    # 附件名来自包内的 manifest，写入前先确认不会落到版本目录之外
+    attachments = manifest.get("attachments", []) if attachments_dir else []
+    for name in attachments:
+        attachment_path(attachments_dir, name)
+    workdir = tempfile.mkdtemp(prefix="kb_import_")
+    try:
+        with zipfile.ZipFile(path) as bundle:
+            for name, expected in manifest["sha256"].items():
+                bundle.extract(name, workdir)
+                if verify and file_sha256(os.path.join(workdir, name)) != expected:
+                    raise BundleError(f"{name} 校验失败（sha256 不一致），导出包可能已损坏")
+
+        vectors = np.load(os.path.join(workdir, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(workdir, "ids.json"), encoding="utf-8") as f:
+            ids = json.load(f)
+        with open(os.path.join(workdir, "documents.json"), encoding="utf-8") as f:
+            documents = json.load(f)
+        with open(os.path.join(workdir, "metadata.json"), encoding="utf-8") as f:
+            columns = json.load(f)
+        if not (len(ids) == len(documents) == vectors.shape[0] == manifest["count"]):
+            raise BundleError("包内各文件的条目数不一致")
+
+        # Chroma 单批大小有上限
+        max_batch = getattr(getattr(collection, "_client", None), "get_max_batch_size", lambda: batch_size)()
+        batch_size = min(batch_size, max_batch)
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            metadatas = [
+                {field: values[i] for field, values in columns.items() if values[i] is not None}
+                for i in range(start, min(end, len(ids)))
+            ]
+            collection.add(
+                ids=ids[start:end],
+                embeddings=np.asarray(vectors[start:end]).tolist(),
+                documents=documents[start:end],
+                metadatas=[metadata or None for metadata in metadatas],
+            )
+        del vectors
+
+        for name in attachments:
+            target = attachment_path(attachments_dir, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(attachment_path(workdir, name), target)
+        return manifest
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
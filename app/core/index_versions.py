@@ -0,0 +1,137 @@
+"""
+向量库版本管理（蓝绿构建）
+每次重建写入新的版本目录 vector_store/versions/<时间戳>/，校验通过后原子地切换
+vector_store/CURRENT 指针（写临时文件再 os.replace），运行中的服务检测到指针变化后
+重新打开新版本，无需重启；旧版本按 INDEX_KEEP_VERSIONS 保留最近几个，其余删除
+
+没有 CURRENT 文件时沿用旧布局（Chroma 文件直接放在 vector_store/ 下）；切换到版本化布局后
+旧布局的 Chroma 文件不会自动删除，需显式调用 remove_legacy_store()（rebuild_db.py --remove-legacy）
+"""
+import os
+import re
+import shutil
+import time
+from typing import Dict, List, Optional
+
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+# 旧布局中 Chroma 自己的文件：chroma.sqlite3（及其日志）和以 UUID 命名的段目录
+LEGACY_CHROMA_FILES = ("chroma.sqlite3", "chroma.sqlite3-journal", "chroma.sqlite3-wal", "chroma.sqlite3-shm")
+_UUID_DIR = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+
+def current_version(root: str) -> Optional[str]:
+    """当前版本名；未使用版本化布局时返回 None"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def resolve_store_dir(root: str) -> str:
+    """实际的 Chroma 目录：有 CURRENT 时为当前版本目录，否则为 root 本身"""
+    version = current_version(root)
+    if version is None:
+        return root
+    return os.path.join(root, VERSIONS_DIR, version)
+
+
+def list_versions(root: str) -> List[str]:
+    """所有版本名（按时间从旧到新）"""
+    versions_dir = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return []
+    names = [name for name in os.listdir(versions_dir) if os.path.isdir(os.path.join(versions_dir, name))]
+    # 同一秒内的多个版本带序号后缀（_1、_2 ... _10），按 (时间戳, 序号) 排序
+    return sorted(names, key=lambda name: (name[:15], int(name[16:] or 0) if name[16:].isdigit() else 0))
+
+
+def new_version_dir(root: str) -> str:
+    """创建新的版本目录（名称为时间戳，同一秒内重复构建时加序号）"""
+    base = time.strftime("%Y%m%d_%H%M%S")
+    name, suffix = base, 1
+    while os.path.exists(os.path.join(root, VERSIONS_DIR, name)):
+        name = f"{base}_{suffix}"
+        suffix += 1
+    path = os.path.join(root, VERSIONS_DIR, name)
+    os.makedirs(path)
+    return path
+
+
+def validate_version(store, probe_query: str = "测试", min_vectors: int = 1) -> Dict:
+    """
+    校验新版本：向量数量达到下限，且能正常执行一次检索
+
+    参数:
+        store: 新版本的 Chroma 实例
+    """
+    errors = []
+    count = 0
+    try:
+        count = store._collection.count()
+        if count < min_vectors:
+            errors.append(f"向量数 {count} 少于 {min_vectors}")
+        elif not store.similarity_search(probe_query, k=1):
+            errors.append("探测查询没有返回结果")
+    except Exception as e:
+        errors.append(f"无法打开或检索新版本: {e}")
+    return {"ok": not errors, "vectors": count, "errors": errors}
+
+
+def activate_version(root: str, version: str):
+    """原子地把 CURRENT 指向 version（读者要么看到旧指针，要么看到新指针）"""
+    if not os.path.isdir(os.path.join(root, VERSIONS_DIR, version)):
+        raise FileNotFoundError(f"版本不存在: {version}")
+    tmp_path = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+
+def gc_versions(root: str, keep: int = 2) -> List[str]:
+    """
+    删除旧版本，保留最近 keep 个（当前版本始终保留，便于回滚）
+
+    只处理 versions/ 下的目录，root 下的其它文件不动
+    返回被删除的条目
+    """
+    current = current_version(root)
+    if current is None:
+        return []
+    removed = []
+    versions = list_versions(root)
+    for name in versions[:max(len(versions) - keep, 0)]:
+        if name != current:
+            shutil.rmtree(os.path.join(root, VERSIONS_DIR, name), ignore_errors=True)
+            removed.append(os.path.join(VERSIONS_DIR, name))
+    return removed
+
+
+def remove_legacy_store(root: str) -> List[str]:
+    """
+    删除旧布局遗留在 root 下的 Chroma 文件（chroma.sqlite3 和 UUID 命名的段目录）
+
+    只在已切换到版本化布局（有 CURRENT）时执行；其它文件和目录一律保留
+    返回被删除的条目
+    """
+    if current_version(root) is None:
+        return []
+    removed = []
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if name in LEGACY_CHROMA_FILES and os.path.isfile(path):
+            os.remove(path)
+        elif _UUID_DIR.match(name) and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            continue
+        removed.append(name)
+    return removed
+
+
+def discard_version(path: str):
+    """删除构建失败或校验未通过的版本目录"""
+    shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,224 @@
+"""
+文档导入报告
+记录每个文件的加载耗时、页数、字符数、切片数、Embedding 耗时和写入向量库的字节数，
+以及整个导入过程的峰值内存和吞吐量，保存为 JSON（默认 reports/ingest_<时间>.json）
+
+用于找出异常文件（如扫描版 PDF、超大 EPUB），并跟踪导入性能的变化
+"""
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+def dir_size(path: str) -> int:
+    """目录总字节数（不存在时为 0）"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def current_rss() -> int:
+    """当前进程 RSS（字节），非 Linux 时退回到历史峰值"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class TimedEmbeddings(Embeddings):
+    """包装 Embedding，累计 embed_documents 的耗时和文本数"""
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+        self.seconds = 0.0
+        self.texts = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        started = time.perf_counter()
+        vectors = self.embeddings.embed_documents(texts)
+        self.seconds += time.perf_counter() - started
+        self.texts += len(texts)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+
+class PeakRSSSampler:
+    """后台线程定期采样 RSS，记录峰值"""
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+class IngestReport:
+    """
+    导入报告
+
+    用法:
+        report = IngestReport(data_dir, persist_dir)
+        with report.running():
+            entry = report.start_file(path, "pdf")
+            ...  # 填写 entry 的各项指标
+        report.save()
+    """
+
+    def __init__(self, data_dir: str, persist_dir: str):
+        self.data_dir = data_dir
+        self.persist_dir = persist_dir
+        self.files: List[Dict] = []
+        self.started_at = datetime.now()
+        self.seconds = 0.0
+        self.peak_rss = 0
+        self.store_bytes_before = dir_size(persist_dir)
+        # 近似重复检测统计（NearDuplicateDetector.statistics），未开启时为 None
+        self.dedup: Optional[Dict] = None
+        self.path: Optional[str] = None
+
+    @contextmanager
+    def running(self):
+        """计时并采样峰值内存"""
+        started = time.perf_counter()
+        with PeakRSSSampler() as sampler:
+            try:
+                yield self
+            finally:
+                self.seconds = time.perf_counter() - started
+        self.peak_rss = sampler.peak
+
+    def start_file(self, path: str, file_type: str) -> Dict:
+        entry = {
+            "file": os.path.relpath(path, self.data_dir),
+            "type": file_type,
+            "file_bytes": os.path.getsize(path) if os.path.exists(path) else 0,
+            "load_seconds": 0.0,
+            "pages": 0,
+            "pages_cached": 0,
+            "chars": 0,
+            "chunks": 0,
+            "duplicates": 0,
+            "embed_seconds": 0.0,
+            "write_seconds": 0.0,
+            "bytes_written": 0,
+            "rss_mb": 0.0,
+            "error": None,
+        }
+        self.files.append(entry)
+        return entry
+
+    def totals(self) -> Dict:
+        ok = [entry for entry in self.files if entry["error"] is None]
+        chars = sum(entry["chars"] for entry in ok)
+        chunks = sum(entry["chunks"] for entry in ok)
+        input_bytes = sum(entry["file_bytes"] for entry in ok)
+        seconds = self.seconds or 1e-9
+        store_bytes = dir_size(self.persist_dir)
+        embed_seconds = sum(entry["embed_seconds"] for entry in ok)
+        duplicates = sum(entry.get("duplicates", 0) for entry in ok)
+        return {
+            "files": len(self.files),
+            "failed_files": len(self.files) - len(ok),
+            "pages": sum(entry["pages"] for entry in ok),
+            "pages_cached": sum(entry.get("pages_cached", 0) for entry in ok),
+            "chars": chars,
+            "chunks": chunks,
+            "input_bytes": input_bytes,
+            "load_seconds": round(sum(entry["load_seconds"] for entry in ok), 3),
+            "embed_seconds": round(embed_seconds, 3),
+            "write_seconds": round(sum(entry["write_seconds"] for entry in ok), 3),
+            "seconds": round(self.seconds, 3),
+            "store_bytes": store_bytes,
+            "store_bytes_written": store_bytes - self.store_bytes_before,
+            "peak_rss_mb": round(self.peak_rss / 1024 / 1024, 1),
+            "duplicates_dropped": duplicates,
+            # 按已写入切片的平均 Embedding 耗时和占用空间估算跳过重复切片省下的量
+            "dedup_savings": {
+                "embed_seconds": round(duplicates * embed_seconds / chunks, 3) if chunks else 0.0,
+                "store_bytes": int(duplicates * (store_bytes - self.store_bytes_before) / chunks) if chunks else 0,
+            },
+            "throughput": {
+                "files_per_sec": round(len(ok) / seconds, 3),
+                "chunks_per_sec": round(chunks / seconds, 2),
+                "chars_per_sec": round(chars / seconds, 1),
+                "input_mb_per_sec": round(input_bytes / 1024 / 1024 / seconds, 3),
+            },
+        }
+
+    def as_dict(self) -> Dict:
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "data_dir": self.data_dir,
+            "persist_dir": self.persist_dir,
+            "totals": self.totals(),
+            "dedup": self.dedup,
+            "files": self.files,
+        }
+
+    def save(self, path: Optional[str] = None) -> str:
+        """保存为 JSON，返回文件路径"""
+        if path is None:
+            report_dir = os.getenv("INGEST_REPORT_DIR", "reports")
+            path = os.path.join(report_dir, f"ingest_{self.started_at.strftime('%Y%m%d_%H%M%S')}.json")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, ensure_ascii=False, indent=2)
+        self.path = path
+        return path
+
+    def print_summary(self, slowest: int = 5):
+        """打印汇总和最慢的几个文件"""
+        totals = self.totals()
+        print(f"\n📈 导入报告:")
+        print(f"  文件: {totals['files']}（失败 {totals['failed_files']}）  页数: {totals['pages']}"
+              f"（缓存 {totals['pages_cached']}）  "
+              f"字符: {totals['chars']}  切片: {totals['chunks']}")
+        print(f"  耗时: 总 {totals['seconds']}s = 加载 {totals['load_seconds']}s + "
+              f"Embedding {totals['embed_seconds']}s + 写入 {totals['write_seconds']}s（其余为切片等）")
+        print(f"  吞吐: {totals['throughput']['chunks_per_sec']} 切片/s, "
+              f"{totals['throughput']['input_mb_per_sec']} MB/s  峰值内存: {totals['peak_rss_mb']} MB")
+        if self.dedup is not None:
+            savings = totals["dedup_savings"]
+            print(f"  去重: 跳过 {totals['duplicates_dropped']} 个近似重复切片（{self.dedup['dropped_chars']} 字），"
+                  f"约省 Embedding {savings['embed_seconds']}s、索引 {savings['store_bytes'] / 1024 / 1024:.1f} MB")
+        ranked = sorted(self.files, key=lambda e: e["load_seconds"] + e["embed_seconds"] + e["write_seconds"],
+                        reverse=True)[:slowest]
+        if ranked:
+            print(f"  最慢的文件:")
+            for entry in ranked:
+                cost = entry["load_seconds"] + entry["embed_seconds"] + entry["write_seconds"]
+                print(f"    - {entry['file']}: {cost:.2f}s（加载 {entry['load_seconds']}s, "
+                      f"{entry['pages']} 页, {entry['chunks']} 切片）{' ❌ ' + entry['error'] if entry['error'] else ''}")
+        if self.path:
+            print(f"  💾 报告已保存: {self.path}")
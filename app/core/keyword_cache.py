@@ -0,0 +1,87 @@
+"""
+关键词检索结果预计算
+大部分线上问题直接点名 config/keywords.json 中的某个实体。导入时为每个实体（以及「X是谁」等模板）
+预先检索一次，保存前 k 个切片 id（<persist_dir>/keyword_cache.json）。开启直接检索
+（ENABLE_DIRECT_RETRIEVAL）且问题去掉句末标点后与模板完全一致时（如「贾宝玉」「贾宝玉是谁」），
+直接按 id 取切片，不做 Embedding 和向量检索；其它问法不命中
+
+缓存带索引指纹（向量数、关键词配置、Embedding 模型、投影 / 量化 / 实体检索设置），任何一项变化即失效；
+不含版本名，缓存文件放在版本目录内，随版本切换
+
+由 KEYWORD_CACHE=true 开启（默认关闭）
+"""
+import hashlib
+import json
+import os
+import re
+from typing import Dict, Iterable, List, Optional
+
+KEYWORD_CACHE_FILE = "keyword_cache.json"
+DEFAULT_TEMPLATES = ("{}", "{}是谁")
+_TRAILING = re.compile(r"[\s？?！!。，,.~～]+$")
+
+
+def normalize_query(query: str) -> str:
+    """去掉首尾空白和句末标点（「贾宝玉是谁？」与「贾宝玉是谁」视为同一问题）"""
+    return _TRAILING.sub("", query.strip())
+
+
+def index_fingerprint(parts: Dict) -> str:
+    return hashlib.sha1(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def file_digest(path: str) -> str:
+    if not os.path.exists(path):
+        return ""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:16]
+
+
+class KeywordRetrievalCache:
+    """规范化问题 → 预先检索的切片 id"""
+
+    def __init__(self, entries: Dict[str, List[str]], fingerprint: str, k: int):
+        self.entries = entries
+        self.fingerprint = fingerprint
+        self.k = k
+
+    def get(self, query: str, k: int) -> Optional[List[str]]:
+        """命中且缓存的 k 足够时返回前 k 个 id"""
+        if k > self.k:
+            return None
+        ids = self.entries.get(normalize_query(query))
+        return ids[:k] if ids else None
+
+    @classmethod
+    def build(cls, search_ids, keywords: Iterable[str], fingerprint: str, k: int,
+              templates: Iterable[str] = DEFAULT_TEMPLATES):
+        """
+        参数:
+            search_ids: 函数 query → 前 k 个切片 id（与线上检索走同一路径）
+        """
+        entries = {}
+        for keyword in keywords:
+            for template in templates:
+                query = normalize_query(template.format(keyword))
+                if query not in entries:
+                    entries[query] = search_ids(query, k)
+        return cls(entries, fingerprint, k)
+
+    def save(self, directory: str):
+        path = os.path.join(directory, KEYWORD_CACHE_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "k": self.k, "entries": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory: str, fingerprint: str):
+        """加载缓存；不存在或指纹不一致（索引已变化）时返回 None"""
+        path = os.path.join(directory, KEYWORD_CACHE_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("fingerprint") != fingerprint:
+            return None
+        return cls(data["entries"], data["fingerprint"], data["k"])
@@ -9,8 +9,20 @@ from typing import Tuple, List, Dict
 class KeywordMatcher:
     def __init__(self, config_path="config/keywords.json"):
         self.config_path = config_path
-        self.keywords = self._load_keywords()
-        self.all_keywords_flat = self._flatten_keywords()
+        self.reload()
+    
+    def reload(self):
+        """重新加载配置：先构建新的关键词表，再整体替换（热加载时由后台线程调用）"""
+        keywords = self._load_keywords()
+        self._state = (keywords, self._flatten_keywords(keywords))
+    
+    @property
+    def keywords(self) -> Dict:
+        return self._state[0]
+    
+    @property
+    def all_keywords_flat(self) -> List[str]:
+        return self._state[1]
     
     def _load_keywords(self) -> Dict:
         """加载关键词配置"""
@@ -21,19 +33,19 @@ class KeywordMatcher:
         with open(self.config_path, 'r', encoding='utf-8') as f:
             return json.load(f)
     
-    def _flatten_keywords(self) -> List[str]:
+    def _flatten_keywords(self, config: Dict) -> List[str]:
         """将所有关键词展平为一维列表"""
         keywords = []
         
         # 四大名著的关键词
-        if "四大名著" in self.keywords:
-            for book, categories in self.keywords["四大名著"].items():
+        if "四大名著" in config:
+            for book, categories in config["四大名著"].items():
                 for category, words in categories.items():
                     keywords.extend(words)
         
         # 通用词条
-        if "通用词条" in self.keywords:
-            keywords.extend(self.keywords["通用词条"])
+        if "通用词条" in config:
+            keywords.extend(config["通用词条"])
         
         return keywords
     
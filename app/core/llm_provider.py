@@ -0,0 +1,373 @@
+"""
+LLM 提供商连接池
+- 每个提供商一个长连接（keep-alive）HTTP 客户端，进程内共享
+- 重试预算：重试次数不超过请求数的固定比例，避免故障时重试风暴
+- 延迟预算 + 对冲请求：主提供商迟迟没有首 token 时，向备用提供商再发一次，谁先出结果用谁
+- 取消：客户端断开或对冲落败时直接断开对应的 HTTP 响应，不再继续接收（和计费）剩余 token
+"""
+import os
+import queue
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+from langchain_openai import ChatOpenAI
+from dotenv import load_dotenv
+from app.core.metrics import REGISTRY
+
+load_dotenv()
+
+# 提供商配置（base URL 可用环境变量覆盖，便于指向本地测试桩 scripts/fake_llm_server.py）
+PROVIDERS = {
+    "groq": {
+        "display": "Groq",
+        "base_url_env": "GROQ_API_BASE",
+        "base_url": "https://api.groq.com/openai/v1",
+        "api_key_env": "GROQ_API_KEY",
+        "model_env": "GROQ_LLM_MODEL",
+        "model": "llama-3.3-70b-versatile",
+    },
+    "aliyun": {
+        "display": "阿里云",
+        "base_url_env": "DASHSCOPE_API_BASE",
+        "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1",
+        "api_key_env": "DASHSCOPE_API_KEY",
+        "model_env": "LLM_MODEL",
+        "model": "qwen-plus",
+    },
+}
+
+
+LLM_HEDGED = REGISTRY.counter("kb_llm_hedged_requests_total", "发出的对冲请求数")
+LLM_RETRIES = REGISTRY.counter("kb_llm_retries_total", "LLM 调用重试次数", labels=("provider",))
+
+
+def normalize_provider(provider: Optional[str]) -> str:
+    """未知提供商一律按阿里云处理（与原有逻辑一致）"""
+    provider = (provider or "aliyun").lower()
+    return provider if provider in PROVIDERS else "aliyun"
+
+
+class LLMTimeoutError(TimeoutError):
+    """在延迟预算内没有任何提供商返回首 token"""
+
+
+class RetryBudget:
+    """
+    重试预算（令牌桶）
+
+    每个请求存入 ratio 个令牌，每次重试消耗 1 个；
+    初始有 min_retries 个令牌，保证低流量时也能重试
+    """
+
+    def __init__(self, ratio: float = 0.1, min_retries: int = 3, max_tokens: float = 20.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = float(min_retries)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.max_tokens)
+
+    def try_withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+# 当前线程正在进行的 _Attempt（httpx 响应钩子据此把响应交给对应的尝试）
+_current = threading.local()
+
+
+def _abort_response(response: httpx.Response):
+    """
+    立即断开流式响应：先 shutdown 底层 socket，唤醒阻塞在读取上的工作线程，再关闭响应
+
+    被断开的连接不会放回连接池
+    """
+    if response.is_closed:
+        return
+    network_stream = response.extensions.get("network_stream")
+    sock = network_stream.get_extra_info("socket") if network_stream is not None else None
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    try:
+        response.close()
+    except Exception:
+        pass
+
+
+def _track_response(response: httpx.Response):
+    """httpx 响应钩子：记录当前尝试的响应（收到响应头时调用，此时响应体尚未读取）"""
+    attempt = getattr(_current, "attempt", None)
+    if attempt is not None:
+        attempt.attach(response)
+
+
+class _Attempt:
+    """一次对某个提供商的流式调用（在后台线程中运行）"""
+
+    def __init__(self, provider: str, llm: ChatOpenAI, messages, events: queue.Queue):
+        self.provider = provider
+        self.stop = threading.Event()
+        self.response: Optional[httpx.Response] = None
+        self._lock = threading.Lock()
+        self.thread = threading.Thread(
+            target=self._run, args=(llm, messages, events), daemon=True
+        )
+
+    def attach(self, response: httpx.Response):
+        with self._lock:
+            self.response = response
+            stopped = self.stop.is_set()
+        if stopped:
+            # 取消发生在响应头到达之前
+            _abort_response(response)
+
+    def cancel(self):
+        """停止本次尝试；响应还在读取时直接断开"""
+        self.stop.set()
+        with self._lock:
+            response = self.response
+        if response is not None:
+            _abort_response(response)
+
+    def _run(self, llm, messages, events):
+        _current.attempt = self
+        stream = None
+        try:
+            stream = llm.stream(messages)
+            for chunk in stream:
+                if self.stop.is_set():
+                    break
+                events.put(("chunk", self, chunk))
+            events.put(("done", self, None))
+        except Exception as e:
+            events.put(("error", self, e))
+        finally:
+            _current.attempt = None
+            if stream is not None:
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+            with self._lock:
+                self.response = None
+
+
+class LLMProviderPool:
+    def __init__(self, primary: Optional[str] = None, secondary: Optional[str] = None):
+        self.primary = normalize_provider(primary or os.getenv("MODEL_PROVIDER", "aliyun"))
+        secondary = secondary if secondary is not None else os.getenv("LLM_FALLBACK_PROVIDER", "")
+        secondary = normalize_provider(secondary) if secondary else None
+        self.secondary = secondary if secondary != self.primary else None
+
+        # 主提供商超过该时间（秒）还没有首 token 时发出对冲请求，0 表示不对冲
+        self.hedge_after = float(os.getenv("LLM_HEDGE_AFTER", "0"))
+        # 单次请求等待首 token 的总预算（秒）
+        self.latency_budget = float(os.getenv("LLM_LATENCY_BUDGET", "60"))
+        self.retry_budget = RetryBudget(ratio=float(os.getenv("LLM_RETRY_RATIO", "0.1")))
+
+        self._clients: Dict[str, ChatOpenAI] = {}
+        self._agent_clients: Dict[str, ChatOpenAI] = {}
+        self._lock = threading.Lock()
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+        self.retries = 0
+
+    def model_name(self, provider: Optional[str] = None) -> str:
+        config = PROVIDERS[provider or self.primary]
+        return os.getenv(config["model_env"], config["model"])
+
+    def display_name(self, provider: Optional[str] = None) -> str:
+        return PROVIDERS[provider or self.primary]["display"]
+
+    def get_llm(self, provider: Optional[str] = None) -> ChatOpenAI:
+        """获取（或创建）提供商对应的 ChatOpenAI，底层 HTTP 连接池在进程内复用"""
+        provider = provider or self.primary
+        with self._lock:
+            if provider not in self._clients:
+                self._clients[provider] = self._build_llm(provider)
+            return self._clients[provider]
+
+    def get_agent_llm(self, provider: Optional[str] = None) -> ChatOpenAI:
+        """
+        Agent 模式使用的 ChatOpenAI
+
+        Agent 直接调用模型（不经过 stream() 的重试预算），因此保留 SDK 自带的重试
+        （LLM_AGENT_MAX_RETRIES，默认 2 次）
+        """
+        provider = provider or self.primary
+        with self._lock:
+            if provider not in self._agent_clients:
+                self._agent_clients[provider] = self._build_llm(
+                    provider, max_retries=int(os.getenv("LLM_AGENT_MAX_RETRIES", "2"))
+                )
+            return self._agent_clients[provider]
+
+    def _build_llm(self, provider: str, max_retries: int = 0) -> ChatOpenAI:
+        """max_retries 默认为 0：stream() / invoke() 的重试由 RetryBudget 统一控制"""
+        config = PROVIDERS[provider]
+        max_connections = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "50"))
+        http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=float(os.getenv("LLM_POOL_KEEPALIVE", "60")),
+            ),
+            timeout=httpx.Timeout(self.latency_budget, connect=5.0),
+            event_hooks={"response": [_track_response]},
+        )
+        return ChatOpenAI(
+            model=self.model_name(provider),
+            openai_api_base=os.getenv(config["base_url_env"], config["base_url"]),
+            openai_api_key=os.getenv(config["api_key_env"]),
+            http_client=http_client,
+            max_retries=max_retries,
+            stream_usage=True,  # 流式最后一块带 usage，用于 token 统计
+        )
+
+    def stream(self, messages, cancel_event: Optional[threading.Event] = None):
+        """
+        流式调用（带重试预算、对冲请求和延迟预算）
+
+        cancel_event 支持 add_callback()（如 request_coalescer.CancelEvent）时，
+        取消会立即断开所有尝试的 HTTP 响应；普通 threading.Event 只在两个文本块之间检查
+
+        返回:
+            生成器，逐个返回胜出提供商的 AIMessageChunk
+        """
+        self.retry_budget.deposit()
+        events: queue.Queue = queue.Queue()
+        attempts: List[_Attempt] = []
+
+        def abort():
+            for attempt in list(attempts):
+                attempt.cancel()
+            events.put(("cancelled", None, None))
+
+        add_callback = getattr(cancel_event, "add_callback", None)
+        if add_callback is not None:
+            add_callback(abort)
+
+        def start(provider):
+            attempt = _Attempt(provider, self.get_llm(provider), messages, events)
+            attempts.append(attempt)
+            attempt.thread.start()
+            return attempt
+
+        started_at = time.monotonic()
+        deadline = started_at + self.latency_budget
+        start(self.primary)
+        hedged = False
+        winner = None
+
+        try:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+
+                now = time.monotonic()
+                timeout = deadline - now if winner is None else 1.0
+                can_hedge = winner is None and not hedged and self.secondary and self.hedge_after > 0
+                if can_hedge:
+                    timeout = min(timeout, started_at + self.hedge_after - now)
+
+                if winner is None and timeout <= 0:
+                    if can_hedge and now < deadline:
+                        print(f"⏱️  {self.display_name()} 首 token 超过 {self.hedge_after}s，对冲请求 {self.display_name(self.secondary)}")
+                        self.hedged_requests += 1
+                        LLM_HEDGED.inc()
+                        hedged = True
+                        start(self.secondary)
+                        continue
+                    raise LLMTimeoutError(f"{self.latency_budget}s 内没有收到任何提供商的首 token")
+
+                try:
+                    kind, attempt, payload = events.get(timeout=max(timeout, 0.01) if winner is None else 1.0)
+                except queue.Empty:
+                    continue
+
+                if kind == "cancelled":
+                    return
+                if winner is not None and attempt is not winner:
+                    continue
+
+                if kind == "chunk":
+                    if winner is None:
+                        # 跳过首个空内容块（通常只携带 role），以真正的首 token 决定胜者
+                        if not getattr(payload, "content", None):
+                            continue
+                        winner = attempt
+                        # 落败的对冲请求立即断开，不再接收剩余 token
+                        for other in attempts:
+                            if other is not winner:
+                                other.cancel()
+                        if winner.provider != self.primary:
+                            self.hedge_wins += 1
+                    yield payload
+                elif kind == "done":
+                    # 胜者正常结束；或没有内容输出的尝试结束且其它尝试也都已结束
+                    attempt.stop.set()
+                    if winner is not None or all(a.stop.is_set() for a in attempts):
+                        return
+                else:  # error
+                    if winner is not None:
+                        raise payload
+                    attempt.stop.set()
+                    if self.retry_budget.try_withdraw() and time.monotonic() < deadline:
+                        self.retries += 1
+                        LLM_RETRIES.inc(provider=attempt.provider)
+                        print(f"🔁 {self.display_name(attempt.provider)} 调用失败，重试：{payload}")
+                        start(attempt.provider)
+                    elif self.secondary and not hedged:
+                        hedged = True
+                        print(f"🔀 {self.display_name(attempt.provider)} 调用失败，切换到 {self.display_name(self.secondary)}：{payload}")
+                        start(self.secondary)
+                    elif all(a.stop.is_set() for a in attempts):
+                        raise payload
+        finally:
+            if add_callback is not None:
+                cancel_event.remove_callback(abort)
+            for attempt in attempts:
+                attempt.cancel()
+
+    def invoke(self, messages):
+        """非流式调用：与 stream() 共用对冲和重试逻辑，返回合并后的消息"""
+        response = None
+        for chunk in self.stream(messages):
+            response = chunk if response is None else response + chunk
+        if response is None:
+            raise RuntimeError("LLM 未返回任何内容")
+        return response
+
+    def get_statistics(self) -> Dict:
+        """获取连接池统计"""
+        return {
+            "主提供商": self.display_name(),
+            "备用提供商": self.display_name(self.secondary) if self.secondary else None,
+            "对冲请求数": self.hedged_requests,
+            "对冲胜出数": self.hedge_wins,
+            "重试次数": self.retries,
+        }
+
+
+_pool: Optional[LLMProviderPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_provider_pool() -> LLMProviderPool:
+    """获取进程内共享的提供商连接池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = LLMProviderPool()
+        return _pool
@@ -0,0 +1,246 @@
+"""
+内存诊断
+- 进程内存：RSS、峰值 RSS、匿名页 / 文件页、swap
+- 按组件归因：Embedding 模型参数、Chroma 向量与 HNSW 索引、关键词 / Few-Shot / 标签配置、
+  LLM 客户端、Agent 图、正在处理的文档
+- tracemalloc：按需开启，列出分配内存最多的代码位置
+- 增长测试：连续执行 N 次合成请求，观察 RSS 和 Python 堆的变化，用于发现内存泄漏
+
+用于 /admin/memory 接口和 scripts/diagnose_memory.py
+"""
+import gc
+import os
+import resource
+import sys
+import time
+import tracemalloc
+import types
+from typing import Dict, List, Optional
+
+from app.core.ingest_report import dir_size
+
+MB = 1024 * 1024
+
+SYNTHETIC_QUERIES = ["贾宝玉是谁？", "诸葛亮的故事", "孙悟空的师傅是谁", "武松打虎的故事",
+                     "林黛玉和薛宝钗的关系", "三顾茅庐的故事是什么？", "大观园在哪里", "宋江是谁"]
+
+# 遍历对象图时不深入的类型（模块、类、函数是全局共享的）
+_SKIP_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+
+def process_memory() -> Dict:
+    """当前进程内存（MB）"""
+    fields = {"VmRSS": "rss_mb", "VmHWM": "peak_rss_mb", "RssAnon": "anon_mb",
+              "RssFile": "file_mb", "VmSwap": "swap_mb"}
+    result = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                name = line.split(":", 1)[0]
+                if name in fields:
+                    result[fields[name]] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+
+def deep_sizeof(obj, max_objects: int = 500000) -> int:
+    """
+    对象及其引用的所有对象的总字节数（近似值）
+
+    不计算模块、类和函数；被多个组件共享的对象会在各组件中重复计算
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack and len(seen) < max_objects:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _SKIP_TYPES):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current, 0)
+        stack.extend(gc.get_referents(current))
+    return total
+
+
+def embedding_memory(embeddings) -> Dict:
+    """Embedding 模型参数占用（torch 张量不在 Python 堆中，需要单独统计）"""
+    if embeddings is None:
+        return {"type": None}
+    info = {"type": type(embeddings).__name__}
+    if hasattr(embeddings, "url"):
+        info["note"] = f"模型在独立的 Embedding 服务进程中: {embeddings.url}"
+        return info
+
+    model = getattr(embeddings, "client", None) or getattr(embeddings, "_client", None)
+    if model is not None and hasattr(model, "parameters"):
+        params = sum(p.numel() * p.element_size() for p in model.parameters())
+        buffers = sum(b.numel() * b.element_size() for b in model.buffers())
+        info["parameters_mb"] = round(params / MB, 1)
+        info["buffers_mb"] = round(buffers / MB, 1)
+        info["device"] = str(getattr(model, "device", "cpu"))
+    else:
+        info["python_objects_mb"] = round(deep_sizeof(embeddings) / MB, 2)
+    return info
+
+
+def chroma_memory(rag) -> Dict:
+    """Chroma 集合规模、向量估算大小和 HNSW 索引文件大小"""
+    info = {"persist_dir": rag.persist_dir, "disk_mb": round(dir_size(rag.persist_dir) / MB, 1)}
+    index = rag.loaded_index
+    if index is None:
+        info["loaded"] = False
+        return info
+
+    info["loaded"] = True
+    collection = index.vector_store._collection
+    count = collection.count()
+    info["vectors"] = count
+    if count:
+        sample = collection.peek(1)
+        embeddings = sample.get("embeddings")
+        if embeddings is not None and len(embeddings):
+            dim = len(embeddings[0])
+            info["dimension"] = dim
+            info["vectors_mb"] = round(count * dim * 4 / MB, 1)
+
+    # HNSW 索引加载后常驻内存，大小约等于其文件大小
+    hnsw_bytes = 0
+    for segment in _segment_dirs(rag.persist_dir):
+        hnsw_bytes += dir_size(segment)
+    info["hnsw_index_mb"] = round(hnsw_bytes / MB, 1)
+    return info
+
+
+def _segment_dirs(persist_dir: str) -> List[str]:
+    if not os.path.isdir(persist_dir):
+        return []
+    # 量化索引、投影矩阵、父文本库等不是 Chroma 的段目录
+    skip = {"quantized", "projection", "parents"}
+    return [os.path.join(persist_dir, name) for name in os.listdir(persist_dir)
+            if os.path.isdir(os.path.join(persist_dir, name)) and name not in skip and not name.endswith(".tmp")]
+
+
+def component_report(agent_manager, coalescer=None, include_agent_graph: bool = False) -> Dict:
+    """
+    按组件统计内存
+
+    参数:
+        agent_manager: AgentManager
+        coalescer: 可选 RequestCoalescer（统计进行中的合并请求）
+        include_agent_graph: 是否构建一次 Agent 图并统计其大小（Groq 模式不使用 Agent）
+    """
+    gc.collect()
+    rag = agent_manager.rag
+    python_mb = lambda obj: round(deep_sizeof(obj) / MB, 3)
+
+    components = {
+        "embedding_model": embedding_memory(rag.embeddings),
+        "chroma": chroma_memory(rag),
+        "keyword_matcher_mb": python_mb(agent_manager.keyword_matcher),
+        "few_shot_manager_mb": python_mb(agent_manager.few_shot_manager) if agent_manager.few_shot_manager else 0,
+        "document_tagger_mb": python_mb(rag.tagger),
+        "llm_clients_mb": python_mb(agent_manager.llm_pool),
+        "in_flight_documents_mb": python_mb([agent_manager.last_state.retrieved_docs, agent_manager.last_state.prompt_parts]),
+    }
+    if coalescer is not None:
+        components["request_coalescer_mb"] = python_mb(coalescer._flights)
+        components["request_coalescer_flights"] = len(coalescer._flights)
+    if include_agent_graph:
+        components["agent_graph_mb"] = python_mb(agent_manager.create_agent())
+
+    report = {
+        "process": process_memory(),
+        "components": components,
+        "gc_objects": len(gc.get_objects()),
+    }
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        report["tracemalloc"] = {"current_mb": round(current / MB, 1), "peak_mb": round(peak / MB, 1)}
+    return report
+
+
+def top_allocators(limit: int = 20, snapshot: Optional[tracemalloc.Snapshot] = None) -> List[Dict]:
+    """tracemalloc 分配最多的代码位置（需要已开启 tracemalloc）"""
+    if snapshot is None:
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot()
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ])
+    return [
+        {"location": str(stat.traceback[0]), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+
+def measure_growth(agent_manager, requests: int = 50, with_llm: bool = False, top: int = 10) -> Dict:
+    """
+    连续执行 N 次合成请求，记录内存变化
+
+    参数:
+        requests: 请求数
+        with_llm: 是否调用 LLM（默认只做检索和提示词构建，不产生费用；可配合 scripts/fake_llm_server.py）
+        top: 列出增长最多的前 N 个代码位置
+    """
+    from app.core.agent import RequestState
+    from app.core.metrics import RequestTrace
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(10)
+
+    def run_one(index):
+        # 每个问题加编号，避免命中各类缓存
+        query = f"{SYNTHETIC_QUERIES[index % len(SYNTHETIC_QUERIES)]} #{index}"
+        if with_llm:
+            for _ in agent_manager.run_simple_rag_stream(query):
+                pass
+        else:
+            agent_manager._retrieve_and_build_prompt(query, False, None, RequestTrace(), RequestState())
+
+    try:
+        # 先跑一次预热（懒加载的向量库、分词器等不算作增长）
+        run_one(0)
+        gc.collect()
+        before = tracemalloc.take_snapshot()
+        rss_before = process_memory().get("rss_mb", 0)
+        heap_before = tracemalloc.get_traced_memory()[0]
+        samples = []
+        step = max(requests // 20, 1)
+        started = time.perf_counter()
+        for index in range(1, requests + 1):
+            run_one(index)
+            if index % step == 0 or index == requests:
+                gc.collect()
+                samples.append({
+                    "requests": index,
+                    "rss_mb": process_memory().get("rss_mb", 0),
+                    "python_heap_mb": round(tracemalloc.get_traced_memory()[0] / MB, 2),
+                })
+        elapsed = time.perf_counter() - started
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+        rss_after = process_memory().get("rss_mb", 0)
+        heap_after = tracemalloc.get_traced_memory()[0]
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+    growth = after.compare_to(before, "lineno")
+    return {
+        "requests": requests,
+        "with_llm": with_llm,
+        "seconds": round(elapsed, 2),
+        "rss_growth_mb": round(rss_after - rss_before, 1),
+        "python_heap_growth_mb": round((heap_after - heap_before) / MB, 3),
+        "python_heap_growth_per_request_kb": round((heap_after - heap_before) / 1024 / requests, 2) if requests else 0,
+        "samples": samples,
+        "top_growth": [
+            {"location": str(stat.traceback[0]), "size_diff_kb": round(stat.size_diff / 1024, 1),
+             "count_diff": stat.count_diff}
+            for stat in growth[:top] if stat.size_diff > 0
+        ],
+    }
@@ -0,0 +1,193 @@
+"""
+指标与耗时追踪
+- MetricsRegistry：进程内的计数器 / 直方图，按 Prometheus 文本格式导出（/metrics）
+- RequestTrace：单次请求的分阶段耗时，结束时写入直方图，也可放进 SSE metadata
+
+只用 time.perf_counter 和一把锁，开销足够小，可以在生产环境常开
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Sequence, Tuple
+
+# 耗时直方图默认分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                 labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.labels = tuple(labels)
+        # 标签值 -> [各分桶计数..., +Inf 计数], 总和, 总数
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    labels = _format_labels(self.labels, key, 'le="%s"' % le)
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help, labels)
+            return self._metrics[name]
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                  labels: Sequence[str] = ()) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help, buckets, labels)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        """导出 Prometheus 文本格式"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "kb_stage_seconds", "各阶段耗时（秒），outcome 为 ok / cancelled / error", labels=("stage", "outcome")
+)
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    "kb_llm_tokens_per_second", "LLM 输出速率（流式分块/秒）",
+    buckets=(1, 5, 10, 20, 50, 100, 200, 500)
+)
+RETRIEVAL_K = REGISTRY.histogram(
+    "kb_retrieval_k", "检索文档数 k", buckets=(1, 3, 5, 8, 10, 20, 50)
+)
+CONTEXT_CHARS = REGISTRY.histogram(
+    "kb_context_chars", "提示词中知识库内容的字符数",
+    buckets=(500, 1000, 2000, 4000, 8000, 16000, 32000)
+)
+CACHE_HITS = REGISTRY.counter(
+    "kb_cache_hits_total", "各类缓存命中次数", labels=("cache",)
+)
+REQUESTS = REGISTRY.counter(
+    "kb_requests_total", "请求数", labels=("endpoint", "status")
+)
+
+
+class RequestTrace:
+    """
+    单次请求的分阶段耗时
+
+    用法:
+        trace = RequestTrace()
+        with trace.span("vector_search"):
+            ...
+        trace.finish()   # 写入直方图（取消或出错的请求传 outcome="cancelled" / "error"）
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+        self.values: Dict[str, float] = {}
+        self.finished = False
+
+    @contextmanager
+    def span(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def record(self, stage: str, seconds: float):
+        """记录某阶段耗时（同一阶段多次调用时累加）"""
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    def set(self, name: str, value: float):
+        """记录数值（k、上下文字符数、token 速率等）"""
+        self.values[name] = value
+
+    def finish(self, observe: bool = True, outcome: str = "ok") -> Dict:
+        """结束追踪，把各阶段耗时按请求结果写入直方图，返回 as_dict()（重复调用不再写入）"""
+        if not self.finished:
+            self.finished = True
+            self.spans["total"] = time.perf_counter() - self.started
+            if observe:
+                for stage, seconds in self.spans.items():
+                    STAGE_SECONDS.observe(seconds, stage=stage, outcome=outcome)
+                if "k" in self.values:
+                    RETRIEVAL_K.observe(self.values["k"])
+                if "context_chars" in self.values:
+                    CONTEXT_CHARS.observe(self.values["context_chars"])
+                if "tokens_per_second" in self.values:
+                    TOKENS_PER_SECOND.observe(self.values["tokens_per_second"])
+        return self.as_dict()
+
+    def as_dict(self) -> Dict:
+        """耗时以毫秒表示，便于放进 SSE metadata"""
+        result = {f"{stage}_ms": round(seconds * 1000, 2) for stage, seconds in self.spans.items()}
+        result.update({name: round(value, 2) for name, value in self.values.items()})
+        return result
+
@@ -0,0 +1,105 @@
+"""
+父窗口文本库（small-to-big 检索）
+向量库里只放小切片（子切片，默认 200 字），匹配更精确；每个 Document（PDF 的一页、一章或整本 txt）
+作为父文本按 UTF-8 追加写入 <persist_dir>/parents/parents.txt，子切片元数据只记录 parent_id 和在父文本中的字节偏移。
+
+检索命中子切片后，按偏移从 mmap 的父文本中截取子切片前后共约 PARENT_WINDOW_CHARS 字的窗口，
+同一父文本中重叠的窗口合并为一个。父文本不重复存入向量库，也不常驻内存
+
+由 PARENT_RETRIEVAL=true 开启（此时 CHILD_CHUNK_SIZE / CHILD_CHUNK_OVERLAP 代替 CHUNK_SIZE / CHUNK_OVERLAP）
+"""
+import json
+import mmap
+import os
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+PARENT_DIR = "parents"
+TEXT_FILE = "parents.txt"
+INDEX_FILE = "parents.json"
+# UTF-8 中一个字最多 4 字节；按字数估算窗口时先多读，再按字数截断
+MAX_CHAR_BYTES = 4
+
+
+class ParentStoreWriter:
+    """导入时顺序写入父文本，close() 后才生成索引（未完成的导入不会留下可用的父文本库）"""
+
+    def __init__(self, directory: str):
+        self.directory = os.path.join(directory, PARENT_DIR)
+        os.makedirs(self.directory, exist_ok=True)
+        self._file = open(os.path.join(self.directory, TEXT_FILE + ".tmp"), "wb")
+        self.offsets: Dict[str, Tuple[int, int]] = {}
+        self.size = 0
+
+    def add(self, text: str) -> str:
+        """写入一个父文本，返回 parent_id"""
+        data = text.encode("utf-8")
+        parent_id = uuid.uuid4().hex
+        self._file.write(data)
+        self.offsets[parent_id] = (self.size, len(data))
+        self.size += len(data)
+        return parent_id
+
+    def close(self):
+        self._file.close()
+        os.replace(os.path.join(self.directory, TEXT_FILE + ".tmp"), os.path.join(self.directory, TEXT_FILE))
+        tmp_path = os.path.join(self.directory, INDEX_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "bytes": self.size,
+                "parents": self.offsets,
+            }, f)
+        os.replace(tmp_path, os.path.join(self.directory, INDEX_FILE))
+
+
+class ParentStore:
+    """只读父文本库：parent_id → (起始字节, 字节数)，文本通过 mmap 按需读取"""
+
+    def __init__(self, directory: str, offsets: Dict[str, Tuple[int, int]], data):
+        self.directory = directory
+        self.offsets = offsets
+        self._data = data
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["ParentStore"]:
+        directory = os.path.join(directory, PARENT_DIR)
+        index_path = os.path.join(directory, INDEX_FILE)
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path, "r", encoding="utf-8") as f:
+            offsets = {parent_id: tuple(value) for parent_id, value in json.load(f)["parents"].items()}
+        with open(os.path.join(directory, TEXT_FILE), "rb") as f:
+            # 空文件不能 mmap
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        return cls(directory, offsets, data)
+
+    def __contains__(self, parent_id) -> bool:
+        return parent_id in self.offsets
+
+    def read(self, parent_id: str, start: int = 0, end: Optional[int] = None) -> str:
+        """父文本中 [start, end) 字节（相对父文本开头）"""
+        offset, length = self.offsets[parent_id]
+        end = length if end is None else min(end, length)
+        return self._data[offset + max(start, 0):offset + end].decode("utf-8", errors="ignore")
+
+    def window(self, parent_id: str, child_offset: int, child_bytes: int, window_chars: int) -> Tuple[int, int]:
+        """
+        子切片前后共约 window_chars 字的窗口，返回父文本内的字节范围 [start, end)
+
+        子切片本身比窗口长时只返回子切片
+        """
+        _, length = self.offsets[parent_id]
+        child_end = child_offset + child_bytes
+        child_chars = len(self.read(parent_id, child_offset, child_end))
+        pad = max(window_chars - child_chars, 0) // 2
+        if not pad:
+            return child_offset, child_end
+        left = self.read(parent_id, child_offset - pad * MAX_CHAR_BYTES, child_offset)[-pad:]
+        right = self.read(parent_id, child_end, child_end + pad * MAX_CHAR_BYTES)[:pad]
+        return max(child_offset - len(left.encode("utf-8")), 0), min(child_end + len(right.encode("utf-8")), length)
+
+    def statistics(self) -> Dict:
+        size = sum(length for _, length in self.offsets.values())
+        return {"parents": len(self.offsets), "mb": round(size / 1024 / 1024, 2)}
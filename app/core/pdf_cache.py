@@ -0,0 +1,153 @@
+"""
+PDF 逐页文本缓存
+PDF 几乎不会变，但 PyPDFLoader 每次导入都要重新解析每一页。这里把提取出的每页文本按
+(文件 sha256, 页码) 缓存到磁盘（PDF_CACHE_DIR，默认 .cache/pdf_pages/<hash 前 2 位>/<hash>.json），
+文件内容没变就直接读缓存；pypdf 版本或缓存格式变化时缓存失效
+
+需要解析的 PDF 页数不少于 PDF_PARALLEL_MIN_PAGES（默认 64）时，按页码区间分给
+PDF_PARSE_WORKERS 个进程并行提取（默认 min(4, CPU 数)，1 表示不并行）。进程池使用 spawn
+（导入在服务进程中进行时，fork 会复制 Embedding 模型和线程锁状态）
+
+输出与 PyPDFLoader 一致：每页一个 Document，metadata 含 source、page（从 0 开始）、page_label、
+total_pages 和 PDF 文档信息（title、author、producer、creationdate 等，键名小写），
+文档信息和页码标签一并缓存，命中缓存时元数据不变。PDF_PAGE_CACHE=false 时退回 PyPDFLoader
+"""
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+
+from app.core.index_bundle import file_sha256
+from app.core.metrics import CACHE_HITS
+
+# 缓存格式版本：缓存内容变化（如增加元数据）时递增，旧缓存自动失效
+CACHE_FORMAT = 2
+_PDF_DATE = re.compile(r"^D:(\d{4})(\d{2})?(\d{2})?(\d{2})?(\d{2})?(\d{2})?")
+
+
+def _parser_version() -> str:
+    import pypdf
+    return f"pypdf-{pypdf.__version__}/{CACHE_FORMAT}"
+
+
+def _pdf_date(value: str) -> str:
+    """PDF 日期（D:20200101120000+08'00'）→ ISO 格式，无法识别时原样返回"""
+    match = _PDF_DATE.match(value)
+    if not match:
+        return value
+    year, month, day, hour, minute, second = (part or default for part, default in
+                                              zip(match.groups(), ("", "01", "01", "00", "00", "00")))
+    return f"{year}-{month}-{day}T{hour}:{minute}:{second}"
+
+
+def document_metadata(reader) -> Dict:
+    """PDF 文档信息（键名去掉 / 并小写，值转为字符串，日期转 ISO 格式）和总页数"""
+    metadata = {}
+    for key, value in (reader.metadata or {}).items():
+        if value is None:
+            continue
+        key = str(key).lstrip("/").lower()
+        value = str(value)
+        metadata[key] = _pdf_date(value) if key in ("creationdate", "moddate") else value
+    metadata["total_pages"] = len(reader.pages)
+    return metadata
+
+
+def extract_pages(path: str, start: int, end: int) -> List[str]:
+    """提取 [start, end) 页的文本（进程池任务，需为模块级函数）"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, min(end, len(reader.pages)))]
+
+
+def parse_pdf(path: str, workers: int = 1, min_pages: int = 64) -> Tuple[Dict, List[str], List[str]]:
+    """
+    提取全部页的文本；页数足够多时按页码区间分给多个进程
+
+    返回:
+        (文档信息, 每页文本, 每页页码标签)
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    total = len(reader.pages)
+    metadata = document_metadata(reader)
+    labels = [str(label) for label in reader.page_labels]
+    workers = min(workers, os.cpu_count() or 1)
+    if workers <= 1 or total < min_pages:
+        return metadata, extract_pages(path, 0, total), labels
+    step = -(-total // workers)
+    ranges = [(start, start + step) for start in range(0, total, step)]
+    with ProcessPoolExecutor(max_workers=len(ranges), mp_context=multiprocessing.get_context("spawn")) as pool:
+        parts = pool.map(extract_pages, [path] * len(ranges), *zip(*ranges))
+        return metadata, [text for part in parts for text in part], labels
+
+
+class PdfPageCache:
+    """文件 sha256 → 文档信息、每页文本和页码标签"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or os.getenv("PDF_CACHE_DIR", os.path.join(".cache", "pdf_pages"))
+        self.parser = _parser_version()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}.json")
+
+    def get(self, digest: str) -> Optional[Dict]:
+        """缓存内容 {"metadata", "pages", "page_labels"}；不存在或解析器版本不同时返回 None"""
+        path = self._path(digest)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data if data.get("parser") == self.parser else None
+
+    def put(self, digest: str, metadata: Dict, pages: List[str], page_labels: List[str], source: str = ""):
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"parser": self.parser, "source": source, "metadata": metadata,
+                       "pages": pages, "page_labels": page_labels}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class CachedPDFLoader(BaseLoader):
+    """
+    带逐页缓存的 PDF 加载器
+
+    加载后 cached_pages 为从缓存读取的页数（未命中为 0）；命中时只需计算文件哈希
+    """
+
+    def __init__(self, file_path: str, cache: Optional[PdfPageCache] = None, workers: Optional[int] = None,
+                 min_pages: Optional[int] = None):
+        self.file_path = str(file_path)
+        self.cache = cache or PdfPageCache()
+        self.workers = workers or int(os.getenv("PDF_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.min_pages = min_pages or int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+        self.cached_pages = 0
+
+    def lazy_load(self) -> Iterator[Document]:
+        digest = file_sha256(self.file_path)
+        cached = self.cache.get(digest)
+        if cached is not None:
+            metadata, pages, labels = cached["metadata"], cached["pages"], cached["page_labels"]
+            self.cached_pages = len(pages)
+            CACHE_HITS.inc(cache="pdf_pages")
+        else:
+            metadata, pages, labels = parse_pdf(self.file_path, self.workers, self.min_pages)
+            self.cache.put(digest, metadata, pages, labels, source=self.file_path)
+        for page, text in enumerate(pages):
+            page_metadata = {**metadata, "source": self.file_path, "page": page}
+            if page < len(labels):
+                page_metadata["page_label"] = labels[page]
+            yield Document(page_content=text, metadata=page_metadata)
@@ -0,0 +1,134 @@
+"""
+按需分析单次请求的性能（cProfile）
+- 默认关闭：没有带开关的请求不经过任何分析代码
+- /chat 通过请求头 X-Profile: <ADMIN_TOKEN> 开启；命令行脚本通过 --profile 开启
+- 结果保存为 .prof 文件（可用 snakeviz / flameprof / gprof2dot 生成火焰图），并返回按累计耗时排序的前 N 个函数
+
+cProfile 同一时刻只能有一个在运行，所以进程内同时只分析一个请求，其余请求照常处理但不分析
+"""
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+_active_lock = threading.Lock()
+
+
+def is_authorized(token: Optional[str]) -> bool:
+    """校验管理令牌（未配置 ADMIN_TOKEN 时一律拒绝）"""
+    expected = os.getenv("ADMIN_TOKEN", "")
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), expected.encode("utf-8"))
+
+
+class RequestProfiler:
+    """
+    单次请求的 cProfile 分析器
+
+    用法:
+        profiler = RequestProfiler("贾宝玉是谁")
+        stream = profiler.wrap(stream)      # 生成器：每次 next() 时开启分析
+        ...
+        profiler.summary                    # 结束后可用
+    """
+
+    def __init__(self, label: str, top_n: int = 20):
+        self.label = label
+        self.top_n = top_n
+        self.output_dir = os.getenv("PROFILE_DIR", "profiles")
+        self.path: Optional[str] = None
+        self.summary: Optional[Dict] = None
+        self._profile = cProfile.Profile()
+        self._active = False
+
+    def _acquire(self) -> bool:
+        # 在真正开始执行时才占用，避免从未启动的请求一直占着
+        self._active = _active_lock.acquire(blocking=False)
+        if not self._active:
+            self.summary = {"error": "已有请求正在分析，本次请求未分析"}
+        return self._active
+
+    def wrap(self, iterator: Iterator) -> Iterator:
+        """
+        包装生成器：只在执行 next() 期间开启分析
+
+        流式请求的每一步可能在不同的工作线程中执行，逐步开启/关闭可以覆盖
+        关键词匹配、Embedding、向量检索、提示词构建和 LLM 流式输出各阶段
+        """
+        if not self._acquire():
+            yield from iterator
+            return
+        try:
+            while True:
+                self._profile.enable()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self._profile.disable()
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+            self.stop()
+
+    def run(self, func, *args, **kwargs):
+        """分析一次普通函数调用"""
+        if not self._acquire():
+            return func(*args, **kwargs)
+        try:
+            return self._profile.runcall(func, *args, **kwargs)
+        finally:
+            self.stop()
+
+    def stop(self) -> Optional[Dict]:
+        """结束分析：保存 .prof 文件并生成摘要"""
+        if not self._active:
+            return self.summary
+        self._active = False
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            slug = re.sub(r"[^\w]+", "_", self.label)[:40].strip("_") or "request"
+            self.path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d_%H%M%S')}_{slug}.prof")
+            self._profile.dump_stats(self.path)
+            self.summary = {"file": self.path, "top_functions": self._top_functions()}
+        except Exception as e:
+            self.summary = {"error": str(e)}
+        finally:
+            _active_lock.release()
+        return self.summary
+
+    def _top_functions(self) -> List[Dict]:
+        stats = pstats.Stats(self._profile, stream=io.StringIO())
+        entries = []
+        for (filename, line, name), (_, calls, total, cumulative, _) in stats.stats.items():
+            entries.append({
+                "function": f"{filename}:{line}({name})",
+                "calls": calls,
+                "total_ms": round(total * 1000, 2),
+                "cumulative_ms": round(cumulative * 1000, 2),
+            })
+        entries.sort(key=lambda entry: entry["cumulative_ms"], reverse=True)
+        return entries[:self.top_n]
+
+
+def print_summary(summary: Optional[Dict]):
+    """命令行打印分析摘要"""
+    if not summary:
+        return
+    if "error" in summary:
+        print(f"⚠️  保存分析结果失败: {summary['error']}")
+        return
+    print(f"\n🔬 性能分析已保存: {summary['file']}")
+    print(f"   生成火焰图: flameprof {summary['file']} > profile.svg  或  snakeviz {summary['file']}")
+    print(f"\n   {'累计(ms)':>10} {'自身(ms)':>10} {'调用次数':>8}  函数")
+    for entry in summary["top_functions"]:
+        print(f"   {entry['cumulative_ms']:>10} {entry['total_ms']:>10} {entry['calls']:>8}  {entry['function']}")
@@ -0,0 +1,141 @@
+"""
+降维投影
+导入时在语料向量上拟合 PCA，把 1024 维向量投影到 256 / 384 维后存入单独的 Chroma 集合，
+检索时对查询向量做同样的投影。投影矩阵保存在向量库目录下（<persist_dir>/projection/），
+带版本号，与投影集合的元数据中的版本号一致才会启用
+
+由 VECTOR_PROJECTION_DIM=256 等开启（0 表示不降维）
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.core.quantized_store import iter_collection
+
+PROJECTION_DIR = "projection"
+
+
+def projected_collection_name(dim: int) -> str:
+    return f"langchain_pca{dim}"
+
+
+class PCAProjection:
+    """PCA 投影：y = normalize((x - mean) @ components.T)"""
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, explained_variance: float,
+                 version: str = "", created_at: str = "", fit_vectors: int = 0):
+        self.mean = mean.astype(np.float32)
+        self.components = components.astype(np.float32)
+        self.explained_variance = explained_variance
+        self.version = version or hashlib.sha1(self.components.tobytes()).hexdigest()[:12]
+        self.created_at = created_at or time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.fit_vectors = fit_vectors
+
+    @property
+    def source_dim(self) -> int:
+        return self.components.shape[1]
+
+    @property
+    def dim(self) -> int:
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, dim: int, max_samples: int = 50000, seed: int = 0) -> "PCAProjection":
+        """在（采样后的）语料向量上拟合 PCA"""
+        if dim >= vectors.shape[1]:
+            raise ValueError(f"目标维度 {dim} 必须小于原始维度 {vectors.shape[1]}")
+        sample = vectors
+        if len(vectors) > max_samples:
+            sample = vectors[np.random.default_rng(seed).choice(len(vectors), max_samples, replace=False)]
+        mean = sample.mean(axis=0)
+        centered = (sample - mean).astype(np.float64)
+        # 协方差矩阵只有 D×D（1024×1024），特征分解比对整个样本做 SVD 快得多
+        covariance = centered.T @ centered / max(len(sample) - 1, 1)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        order = np.argsort(eigenvalues)[::-1][:dim]
+        explained = float(eigenvalues[order].sum() / max(eigenvalues.sum(), 1e-12))
+        return cls(mean, eigenvectors[:, order].T, explained, fit_vectors=len(sample))
+
+    def transform(self, vectors) -> np.ndarray:
+        projected = (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.components.T
+        norms = np.linalg.norm(projected, axis=-1, keepdims=True)
+        return projected / np.maximum(norms, 1e-12)
+
+    def save(self, directory: str):
+        """保存到 directory（先写临时目录再替换）"""
+        tmp_dir = directory + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, "mean.npy"), self.mean)
+        np.save(os.path.join(tmp_dir, "components.npy"), self.components)
+        with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(self.manifest(), f, ensure_ascii=False, indent=2)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_dir, directory)
+
+    def manifest(self) -> Dict:
+        return {
+            "version": self.version,
+            "source_dim": self.source_dim,
+            "dim": self.dim,
+            "explained_variance": round(self.explained_variance, 4),
+            "fit_vectors": self.fit_vectors,
+            "created_at": self.created_at,
+            "collection": projected_collection_name(self.dim),
+        }
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["PCAProjection"]:
+        manifest_path = os.path.join(directory, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        return cls(
+            np.load(os.path.join(directory, "mean.npy")),
+            np.load(os.path.join(directory, "components.npy")),
+            manifest["explained_variance"],
+            version=manifest["version"],
+            created_at=manifest["created_at"],
+            fit_vectors=manifest["fit_vectors"],
+        )
+
+
+class ProjectedEmbeddings(Embeddings):
+    """先用原模型计算 Embedding，再做投影（供投影集合使用）"""
+
+    def __init__(self, embeddings: Embeddings, projection: PCAProjection):
+        self.embeddings = embeddings
+        self.projection = projection
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.projection.transform(self.embeddings.embed_documents(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.projection.transform(self.embeddings.embed_query(text)).tolist()
+
+
+def build_projected_collection(source_collection, target_store, projection: PCAProjection, batch_size: int = 1000):
+    """
+    把原集合的向量投影后写入投影集合（复用已有向量，不重新计算 Embedding）
+
+    目标集合的元数据记录投影版本，加载时据此校验
+    """
+    written = 0
+    for batch in iter_collection(source_collection, batch_size,
+                                 include=("embeddings", "documents", "metadatas")):
+        target_store._collection.add(
+            ids=batch["ids"],
+            embeddings=projection.transform(batch["embeddings"]).tolist(),
+            documents=batch["documents"],
+            metadatas=batch["metadatas"],
+        )
+        written += len(batch["ids"])
+    target_store._collection.modify(metadata={"projection_version": projection.version})
+    return written
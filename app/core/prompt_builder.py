@@ -0,0 +1,102 @@
+"""
+提示词组装（适配提供商的前缀缓存）
+DashScope 等 OpenAI 兼容接口会缓存请求中逐字节相同的前缀。这里把不变的部分放在最前面：
+
+    SystemMessage  固定说明 + 按问题类型选出的 Few-Shot 示例（同一类型逐字节相同）
+    HumanMessage   知识库内容 + 用户问题（每次不同）
+
+提供商返回的缓存命中 token 数按前缀类型记入指标，首 token 时间按是否命中缓存分开统计
+"""
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from app.core.metrics import REGISTRY
+
+RAG_INSTRUCTIONS = (
+    "你是一个智能助手。请基于用户消息中的知识库内容回答用户的问题。"
+    "如果知识库内容不足以回答问题，可以结合你的通用知识补充。"
+)
+NO_CONTEXT_INSTRUCTIONS = "你是一个智能助手。请回答用户的问题。"
+
+PROMPT_PREFIX_REQUESTS = REGISTRY.counter(
+    "kb_prompt_prefix_requests_total", "按静态前缀类型统计的 LLM 请求数", labels=("prefix",)
+)
+PROMPT_CACHED_TOKENS = REGISTRY.counter(
+    "kb_prompt_cached_tokens_total", "提供商前缀缓存命中的 prompt token 数", labels=("prefix",)
+)
+PROMPT_TOKENS_BY_PREFIX = REGISTRY.counter(
+    "kb_prompt_tokens_by_prefix_total", "按静态前缀类型统计的 prompt token 数", labels=("prefix",)
+)
+TTFT_BY_CACHE = REGISTRY.histogram(
+    "kb_llm_ttft_by_prompt_cache_seconds", "首 token 时间（按是否命中提供商前缀缓存）", labels=("prompt_cache",)
+)
+
+
+def messages_text(messages: List[BaseMessage]) -> str:
+    """消息拼接成文本（用于本地 token 估算）"""
+    return "\n\n".join(str(message.content) for message in messages)
+
+
+class PromptBuilder:
+    """
+    参数:
+        few_shot_manager: 可选 FewShotManager
+        selection: Few-Shot 示例选择方式
+            type    按问题类型选一组固定示例放进系统消息（前缀可缓存，默认）
+            similar 按问题向量逐个挑最相近的示例，放在用户消息里（示例更贴切，但只有固定说明能命中缓存）；
+                    没有问题向量或没有足够相近的示例时按 type 处理
+    """
+
+    def __init__(self, few_shot_manager=None, selection: Optional[str] = None):
+        self.few_shot_manager = few_shot_manager
+        self.selection = selection or os.getenv("FEW_SHOT_SELECTION", "type")
+
+    def build(self, query: str, context: str, query_vector=None) -> Tuple[List[BaseMessage], Dict, Dict]:
+        """
+        返回:
+            (消息列表, 组成部分 {"few_shot", "context", "query"}, 前缀 {"name", "hash"})
+        """
+        if not context:
+            return self._assemble(NO_CONTEXT_INSTRUCTIONS, f"用户问题：{query}", "no_context", "", context, query)
+
+        examples_text, prefix = "", "rag"
+        human_examples = ""
+        if self.few_shot_manager:
+            examples = []
+            if self.selection == "similar" and query_vector is not None:
+                examples = self.few_shot_manager.select_examples(query_vector)
+            if examples:
+                human_examples = examples_text = self.few_shot_manager.format_examples_for_prompt(examples)
+                prefix = "rag/similar"
+            else:
+                question_type, examples = self.few_shot_manager.prefix_examples(query, query_vector)
+                examples_text = self.few_shot_manager.format_examples_for_prompt(examples)
+                prefix = f"rag/{question_type or '通用'}"
+
+        system = RAG_INSTRUCTIONS
+        if examples_text and not human_examples:
+            system = f"{RAG_INSTRUCTIONS}\n\n{examples_text}"
+        human = f"{human_examples}知识库内容：\n{context}\n\n用户问题：{query}"
+        return self._assemble(system, human, prefix, examples_text, context, query)
+
+    @staticmethod
+    def _assemble(system: str, human: str, prefix: str, examples_text: str, context: str, query: str):
+        parts = {"few_shot": examples_text, "context": context, "query": query}
+        # 同一前缀名下 hash 应保持不变；变化说明模板或示例被修改（缓存会重新预热）
+        prefix_info = {"name": prefix, "hash": hashlib.sha1(system.encode("utf-8")).hexdigest()[:8]}
+        return [SystemMessage(content=system), HumanMessage(content=human)], parts, prefix_info
+
+
+def observe_prompt_cache(prefix: str, usage: Dict, ttft: Optional[float] = None):
+    """记录前缀缓存效果：各前缀的 prompt / 缓存命中 token 数，以及命中与否的首 token 时间"""
+    if not prefix or not usage:
+        return
+    cached = usage.get("cached_tokens", 0) or 0
+    PROMPT_PREFIX_REQUESTS.inc(prefix=prefix)
+    PROMPT_TOKENS_BY_PREFIX.inc(usage.get("prompt_tokens", 0), prefix=prefix)
+    PROMPT_CACHED_TOKENS.inc(cached, prefix=prefix)
+    if ttft is not None:
+        TTFT_BY_CACHE.observe(ttft, prompt_cache="hit" if cached else "miss")
@@ -0,0 +1,352 @@
+"""
+量化向量索引
+bge-large-zh 的 1024 维 float32 向量每个切片约 4 KB，书多了之后是内存的大头。
+量化索引只把压缩后的编码放在内存里，先用编码粗排出候选，再从磁盘上的全精度向量（memmap）精确重排：
+
+- int8：逐维标量量化，每维 1 字节，内存约为 float32 的 1/4
+- pq：乘积量化，每 4 维（默认）一个 8 位码字，内存约为 float32 的 1/16
+
+文档内容和元数据仍由 Chroma 保存，检索结果按 id 取回。
+由 VECTOR_QUANTIZATION=int8|pq 开启，索引保存在 <persist_dir>/quantized/
+"""
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+QUANTIZED_DIR = "quantized"
+# 支持过滤的元数据字段（search_by_book 等按这些字段等值过滤）
+FILTER_FIELDS = ("book", "author", "dynasty", "genre")
+# 粗排时每批处理的行数（控制临时内存）
+BLOCK_ROWS = 8192
+
+
+class UnsupportedFilter(ValueError):
+    """过滤条件不是量化索引支持的等值过滤，调用方应退回 Chroma 检索"""
+
+
+def iter_collection(collection, batch_size: int = 1000, include=("embeddings", "metadatas")):
+    """分批读取 Chroma 集合"""
+    offset = 0
+    while True:
+        batch = collection.get(include=list(include), limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            return
+        yield batch
+        offset += len(batch["ids"])
+
+
+def _squared_distances(vectors: np.ndarray, query: np.ndarray) -> np.ndarray:
+    diff = vectors - query
+    return np.einsum("ij,ij->i", diff, diff)
+
+
+class Int8Codec:
+    """逐维标量量化：x ≈ (code + 128) * step + low"""
+
+    name = "int8"
+
+    def fit(self, vectors: np.ndarray):
+        self.low = vectors.min(axis=0).astype(np.float32)
+        high = vectors.max(axis=0).astype(np.float32)
+        self.step = np.maximum((high - self.low) / 255.0, 1e-12).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((vectors - self.low) / self.step)
+        return (np.clip(codes, 0, 255) - 128).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return (codes.astype(np.float32) + 128.0) * self.step + self.low
+
+    def prepare(self, codes: np.ndarray):
+        # ||q - x̂||² = ||q||² - 2 q·x̂ + ||x̂||²，预先算好 ||x̂||²（加载时直接读取）
+        if getattr(self, "norms", None) is not None and len(self.norms) == len(codes):
+            return
+        norms = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), BLOCK_ROWS):
+            decoded = self.decode(codes[start:start + BLOCK_ROWS])
+            norms[start:start + BLOCK_ROWS] = np.einsum("ij,ij->i", decoded, decoded)
+        self.norms = norms
+
+    def distances(self, codes: np.ndarray, rows: slice, query: np.ndarray) -> np.ndarray:
+        """近似平方距离（省略常数项 ||q||²，不影响排序）"""
+        scaled = query * self.step
+        dot = (codes.astype(np.float32) + 128.0) @ scaled + float(query @ self.low)
+        return self.norms[rows] - 2.0 * dot
+
+    def save(self, directory: str):
+        np.save(os.path.join(directory, "low.npy"), self.low)
+        np.save(os.path.join(directory, "step.npy"), self.step)
+        np.save(os.path.join(directory, "norms.npy"), self.norms)
+
+    def load(self, directory: str):
+        self.low = np.load(os.path.join(directory, "low.npy"))
+        self.step = np.load(os.path.join(directory, "step.npy"))
+        self.norms = np.load(os.path.join(directory, "norms.npy"))
+
+    def nbytes(self) -> int:
+        return self.low.nbytes + self.step.nbytes + self.norms.nbytes
+
+
+class PQCodec:
+    """乘积量化：向量切成 m 段，每段用 256 个中心之一的编号表示"""
+
+    name = "pq"
+
+    def __init__(self, m: int = 0, iterations: int = 10, train_size: int = 10000, seed: int = 0):
+        self.m = m
+        self.iterations = iterations
+        self.train_size = train_size
+        self.seed = seed
+
+    def fit(self, vectors: np.ndarray):
+        dim = vectors.shape[1]
+        if not self.m:
+            self.m = max(dim // 4, 1)
+        if dim % self.m:
+            raise ValueError(f"维度 {dim} 不能被 PQ 段数 {self.m} 整除")
+        rng = np.random.default_rng(self.seed)
+        sample = vectors
+        if len(vectors) > self.train_size:
+            sample = vectors[rng.choice(len(vectors), self.train_size, replace=False)]
+        sub = dim // self.m
+        centroids = min(256, len(sample))
+        self.codebooks = np.zeros((self.m, 256, sub), dtype=np.float32)
+        for part in range(self.m):
+            centers = self._kmeans(sample[:, part * sub:(part + 1) * sub], centroids, rng)
+            # 样本不足 256 个时重复填充，保证编码不会落到未训练的中心上
+            self.codebooks[part] = centers[np.arange(256) % centroids]
+
+    def _kmeans(self, data: np.ndarray, k: int, rng) -> np.ndarray:
+        centers = data[rng.choice(len(data), k, replace=False)].astype(np.float32)
+        for _ in range(self.iterations):
+            assignment = self._assign(data, centers)
+            sums = np.zeros_like(centers)
+            np.add.at(sums, assignment, data)
+            counts = np.bincount(assignment, minlength=k)
+            filled = counts > 0
+            centers[filled] = sums[filled] / counts[filled, None]
+        return centers
+
+    @staticmethod
+    def _assign(data: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        distances = (np.einsum("ij,ij->i", data, data)[:, None] - 2.0 * data @ centers.T
+                     + np.einsum("ij,ij->i", centers, centers)[None, :])
+        return distances.argmin(axis=1)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        sub = self.codebooks.shape[2]
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for part in range(self.m):
+            codes[:, part] = self._assign(vectors[:, part * sub:(part + 1) * sub], self.codebooks[part])
+        return codes
+
+    def prepare(self, codes: np.ndarray):
+        self._parts = np.arange(self.m)
+
+    def distances(self, codes: np.ndarray, rows: slice, query: np.ndarray) -> np.ndarray:
+        """非对称距离：查询向量不量化，查表累加各段距离"""
+        sub = self.codebooks.shape[2]
+        table = ((self.codebooks - query.reshape(self.m, 1, sub)) ** 2).sum(axis=2)
+        return table[self._parts, codes].sum(axis=1)
+
+    def save(self, directory: str):
+        np.save(os.path.join(directory, "codebooks.npy"), self.codebooks)
+
+    def load(self, directory: str):
+        self.codebooks = np.load(os.path.join(directory, "codebooks.npy"))
+        self.m = self.codebooks.shape[0]
+
+    def nbytes(self) -> int:
+        return self.codebooks.nbytes
+
+
+CODECS = {"int8": Int8Codec, "pq": PQCodec}
+
+
+def _filter_column(values: List, vocabulary: Dict[str, int]) -> np.ndarray:
+    """
+    过滤字段的取值编号列，用能容纳 len(vocabulary) + 1 个取值的最小整数类型
+
+    缺失值编码为 len(vocabulary)，不会等于任何取值的编号
+    """
+    missing = len(vocabulary)
+    dtype = np.uint8 if missing < 2 ** 8 else np.uint16 if missing < 2 ** 16 else np.int32
+    return np.array([vocabulary.get(v, missing) for v in values], dtype=dtype)
+
+
+class QuantizedIndex:
+    """
+    量化索引：内存中的编码 + 磁盘上的全精度向量（memmap）
+
+    目录结构:
+        manifest.json      模式、维度、数量、内存占用
+        ids.json           行号 -> Chroma id
+        codes.npy          量化编码（常驻内存）
+        vectors.f32.npy    全精度向量（memmap，只在精排时读取候选行）
+        filter_<字段>.npy  可过滤字段的取值编号（uint8 / uint16，常驻内存）
+    """
+
+    def __init__(self, directory: str, manifest: Dict, ids: List[str], codes: np.ndarray,
+                 vectors: np.ndarray, codec, filters: Dict[str, Tuple[Dict[str, int], np.ndarray]]):
+        self.directory = directory
+        self.manifest = manifest
+        self.ids = ids
+        self.codes = codes
+        self.vectors = vectors
+        self.codec = codec
+        self.filters = filters
+        self.codec.prepare(codes)
+
+    @property
+    def mode(self) -> str:
+        return self.manifest["mode"]
+
+    @classmethod
+    def build(cls, collection, directory: str, mode: str = "int8", pq_m: int = 0) -> "QuantizedIndex":
+        """从 Chroma 集合构建量化索引（先写临时目录，完成后替换）"""
+        if mode not in CODECS:
+            raise ValueError(f"未知的量化模式: {mode}（可选 {', '.join(CODECS)}）")
+        started = time.perf_counter()
+
+        ids, vectors, field_values = [], [], {field: [] for field in FILTER_FIELDS}
+        for batch in iter_collection(collection):
+            ids.extend(batch["ids"])
+            vectors.append(np.asarray(batch["embeddings"], dtype=np.float32))
+            for metadata in batch["metadatas"]:
+                for field in FILTER_FIELDS:
+                    field_values[field].append((metadata or {}).get(field))
+        if not ids:
+            raise ValueError("向量库为空，无法构建量化索引")
+        vectors = np.concatenate(vectors)
+
+        codec = PQCodec(m=pq_m) if mode == "pq" else Int8Codec()
+        codec.fit(vectors)
+        codes = codec.encode(vectors)
+
+        tmp_dir = directory + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, "codes.npy"), codes)
+        np.save(os.path.join(tmp_dir, "vectors.f32.npy"), vectors)
+        with open(os.path.join(tmp_dir, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump(ids, f)
+        vocabularies, filter_bytes = {}, 0
+        for field, values in field_values.items():
+            vocabulary = {value: index for index, value in enumerate(sorted({v for v in values if v is not None}))}
+            column = _filter_column(values, vocabulary)
+            np.save(os.path.join(tmp_dir, f"filter_{field}.npy"), column)
+            vocabularies[field] = vocabulary
+            filter_bytes += column.nbytes
+
+        codec.prepare(codes)
+        codec.save(tmp_dir)
+        manifest = {
+            "mode": mode,
+            "count": len(ids),
+            "dim": int(vectors.shape[1]),
+            "pq_m": getattr(codec, "m", None),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "build_seconds": round(time.perf_counter() - started, 2),
+            "float32_bytes": int(vectors.nbytes),
+            "memory_bytes": int(codes.nbytes + codec.nbytes() + filter_bytes),
+            "filters": vocabularies,
+        }
+        with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_dir, directory)
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["QuantizedIndex"]:
+        """加载量化索引（不存在时返回 None）"""
+        manifest_path = os.path.join(directory, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        with open(os.path.join(directory, "ids.json"), encoding="utf-8") as f:
+            ids = json.load(f)
+        codec = CODECS[manifest["mode"]]()
+        codec.load(directory)
+        filters = {
+            field: (vocabulary, np.load(os.path.join(directory, f"filter_{field}.npy")))
+            for field, vocabulary in manifest["filters"].items()
+        }
+        return cls(
+            directory, manifest, ids,
+            codes=np.load(os.path.join(directory, "codes.npy")),
+            vectors=np.load(os.path.join(directory, "vectors.f32.npy"), mmap_mode="r"),
+            codec=codec, filters=filters,
+        )
+
+    def _mask(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        if not filters:
+            return None
+        mask = np.ones(len(self.ids), dtype=bool)
+        for field, value in filters.items():
+            if field not in self.filters or isinstance(value, dict):
+                raise UnsupportedFilter(f"量化索引不支持过滤条件: {field}={value}")
+            vocabulary, column = self.filters[field]
+            if value not in vocabulary:
+                return np.zeros(len(self.ids), dtype=bool)
+            mask &= column == vocabulary[value]
+        return mask
+
+    def search(self, query_vector, k: int = 5, filters: Optional[Dict] = None,
+               candidates: int = 0) -> List[Tuple[str, float]]:
+        """
+        检索
+
+        参数:
+            query_vector: 查询向量
+            k: 返回数量
+            filters: 等值过滤，如 {"book": "红楼梦"}
+            candidates: 粗排候选数（默认 max(10k, 100)），越大召回越接近精确检索
+
+        返回:
+            [(Chroma id, 平方 L2 距离), ...]，按距离升序
+        """
+        query = np.asarray(query_vector, dtype=np.float32)
+        mask = self._mask(filters)
+        candidates = candidates or max(10 * k, 100)
+
+        approx = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, len(self.ids), BLOCK_ROWS):
+            rows = slice(start, start + BLOCK_ROWS)
+            approx[rows] = self.codec.distances(self.codes[rows], rows, query)
+        if mask is not None:
+            approx[~mask] = np.inf
+            candidates = min(candidates, int(mask.sum()))
+        if candidates <= 0:
+            return []
+
+        candidates = min(candidates, len(approx))
+        top = np.argpartition(approx, candidates - 1)[:candidates]
+        # 按行号顺序读取 memmap，减少随机 IO
+        top.sort()
+        exact = _squared_distances(np.asarray(self.vectors[top]), query)
+        order = np.argsort(exact)[:k]
+        return [(self.ids[top[i]], float(exact[i])) for i in order]
+
+    def memory_bytes(self) -> int:
+        """常驻内存（编码 + 码本 / 量化参数 + 过滤列）"""
+        return int(self.codes.nbytes + self.codec.nbytes()
+                   + sum(column.nbytes for _, column in self.filters.values()))
+
+    def statistics(self) -> Dict:
+        float32_bytes = self.manifest["float32_bytes"]
+        memory = self.memory_bytes()
+        return {
+            "mode": self.mode,
+            "count": self.manifest["count"],
+            "dim": self.manifest["dim"],
+            "memory_mb": round(memory / 1024 / 1024, 2),
+            "float32_mb": round(float32_bytes / 1024 / 1024, 2),
+            "compression": round(float32_bytes / memory, 2) if memory else 0,
+        }
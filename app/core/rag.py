@@ -2,7 +2,14 @@
 RAG Manager - 支持免费 Embedding 模型和文档标签
 """
 import os
-from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 try:
     from langchain_chroma import Chroma
@@ -10,64 +17,188 @@ except ImportError:
     from langchain_community.vectorstores import Chroma
 from dotenv import load_dotenv
 from app.core.document_tagger import DocumentTagger
+from app.core import index_versions
+from app.core.entity_index import EntityExtractor, EntityIndex
+from app.core.ingest_report import IngestReport, TimedEmbeddings, current_rss, dir_size
+from app.core.metrics import CACHE_HITS
 
 load_dotenv()
 
+# 切片分隔符预设：default 为 RecursiveCharacterTextSplitter 默认值，chinese 额外按中文标点断句
+SEPARATOR_PRESETS = {
+    "default": ["\n\n", "\n", " ", ""],
+    "chinese": ["\n\n", "\n", "。", "！", "？", "；", "，", " ", ""],
+}
+
+
+def load_local_embeddings():
+    """加载本地 HuggingFace Embedding 模型"""
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    model_name = os.getenv("LOCAL_EMBEDDING_MODEL", "BAAI/bge-large-zh-v1.5")
+    print(f"📊 使用本地 Embedding: {model_name}")
+    print("💰 完全免费，无需 API Key")
+    print("⏳ 首次使用会下载模型（约 500MB），请耐心等待...")
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+
+
+class RAGRetriever(BaseRetriever):
+    """把 RAGManager.search 包装成 LangChain 检索器"""
+
+    rag: Any
+    k: int = 5
+    filters: Optional[Dict] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return self.rag.search(query, k=self.k, filters=self.filters)
+
+
+class IndexSnapshot:
+    """
+    一个向量库版本的全部检索状态：Chroma 集合、投影、量化索引、实体倒排索引、关键词检索缓存和父文本库
+
+    创建后不再修改：切换版本或构建派生索引时生成新对象（replace），再整体替换 RAGManager 上的引用。
+    检索开始时取一次引用并全程使用，不会混用两个版本的对象
+    """
+
+    FIELDS = ("version", "persist_dir", "vector_store", "projection", "projected_store",
+              "quantized_index", "entity_index", "keyword_cache", "parent_store")
+
+    def __init__(self, version, persist_dir, vector_store, projection=None, projected_store=None,
+                 quantized_index=None, entity_index=None, keyword_cache=None, parent_store=None):
+        values = locals()
+        for name in self.FIELDS:
+            object.__setattr__(self, name, values[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("IndexSnapshot 创建后不可修改，请使用 replace()")
+
+    def replace(self, **changes) -> "IndexSnapshot":
+        return IndexSnapshot(**{**{name: getattr(self, name) for name in self.FIELDS}, **changes})
+
+    @property
+    def search_store(self):
+        """检索使用的向量库：有投影时为投影集合，否则为原始集合"""
+        return self.projected_store if self.projection is not None else self.vector_store
+
+
+def _index_field(name):
+    """RAGManager 上的只读兼容属性：读取当前快照的字段（同一次检索需要多个字段时请用 current_index()）"""
+    return property(lambda self: getattr(self.current_index(), name))
+
+
 class RAGManager:
-    def __init__(self, data_dir="data", persist_dir="vector_store"):
+    def __init__(self, data_dir="data", persist_dir="vector_store", embeddings=None,
+                 chunk_size=None, chunk_overlap=None, separators=None, parent_retrieval=None):
         self.data_dir = data_dir
-        self.persist_dir = persist_dir
-        self.embeddings = self._get_embeddings()
-        self.vector_store = None
+        # 版本化布局下 persist_dir 是根目录，实际的 Chroma 目录为 CURRENT 指向的版本
+        self.index_root = persist_dir
+        self.index_version = index_versions.current_version(persist_dir)
+        self.persist_dir = index_versions.resolve_store_dir(persist_dir)
+        self.reload_interval = float(os.getenv("INDEX_RELOAD_INTERVAL", "5"))
+        self._version_checked_at = time.monotonic()
+        # small-to-big：向量库只放小切片，检索时从父文本库截取子切片前后的窗口
+        if parent_retrieval is None:
+            parent_retrieval = os.getenv("PARENT_RETRIEVAL", "false").lower() == "true"
+        self.parent_retrieval = parent_retrieval
+        self.parent_window_chars = int(os.getenv("PARENT_WINDOW_CHARS", "600"))
+        # 切片参数（可用 benchmarks/chunk_sweep.py 对比不同取值）；small-to-big 时为子切片参数
+        if parent_retrieval:
+            default_size, default_overlap = os.getenv("CHILD_CHUNK_SIZE", "200"), os.getenv("CHILD_CHUNK_OVERLAP", "20")
+        else:
+            default_size, default_overlap = os.getenv("CHUNK_SIZE", "1000"), os.getenv("CHUNK_OVERLAP", "100")
+        self.chunk_size = chunk_size or int(default_size)
+        self.chunk_overlap = chunk_overlap if chunk_overlap is not None else int(default_overlap)
+        self.separators = separators or os.getenv("CHUNK_SEPARATORS", "default")
+        # 量化索引（int8 / pq）：内存中只放压缩编码，候选用磁盘上的全精度向量精排
+        self.quantization = os.getenv("VECTOR_QUANTIZATION", "").lower()
+        # 降维投影（PCA）：向量以低维存入单独的集合，查询向量同样投影
+        self.projection_dim = int(os.getenv("VECTOR_PROJECTION_DIM", "0"))
+        # 实体倒排索引：问题提到已知实体时限定或优先提到该实体的切片（off / boost / restrict）
+        # 实体检索默认关闭：boost 会改变检索结果的顺序，需显式开启
+        self.entity_retrieval = os.getenv("ENTITY_RETRIEVAL", "off").lower()
+        self.entity_boost_weight = float(os.getenv("ENTITY_BOOST_WEIGHT", "0.5"))
+        self.entity_max_candidates = int(os.getenv("ENTITY_MAX_CANDIDATES", "2000"))
+        self.entity_extractor = EntityExtractor()
+        # 关键词检索缓存：导入时为每个关键词预先检索，命中时跳过 Embedding 和向量检索
+        # 只有问题与模板完全一致时才命中，默认关闭
+        self.keyword_cache_enabled = os.getenv("KEYWORD_CACHE", "false").lower() == "true"
+        self.keyword_cache_k = int(os.getenv("KEYWORD_CACHE_K", "8"))
+        # 近似重复切片检测（MinHash）：同一部书的多个版本只保留先导入的一份（默认关闭）
+        self.dedup_enabled = os.getenv("CHUNK_DEDUP", "false").lower() == "true"
+        # PDF 逐页文本缓存（按文件 sha256，未变化的 PDF 不再解析）
+        self.pdf_page_cache = None
+        if os.getenv("PDF_PAGE_CACHE", "true").lower() == "true":
+            from app.core.pdf_cache import PdfPageCache
+            self.pdf_page_cache = PdfPageCache()
+        # 可注入 Embedding（如基准测试使用的确定性哈希 Embedding）
+        self.embeddings = embeddings or self._get_embeddings()
+        # 当前版本的快照（首次检索时打开，切换版本时整体替换）
+        self._snapshot = None
+        self._snapshot_lock = threading.RLock()
         self.tagger = DocumentTagger()  # 新增：文档标签管理器
 
     def _get_embeddings(self):
         """
-        获取 Embedding 模型（本地 HuggingFace 模型）
-        """
-        from langchain_community.embeddings import HuggingFaceEmbeddings
-        model_name = os.getenv("LOCAL_EMBEDDING_MODEL", "BAAI/bge-large-zh-v1.5")
-        print(f"📊 使用本地 Embedding: {model_name}")
-        print("💰 完全免费，无需 API Key")
-        print("⏳ 首次使用会下载模型（约 500MB），请耐心等待...")
-        return HuggingFaceEmbeddings(
-            model_name=model_name,
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
-        )
-
-    def load_and_index(self):
-        """加载 data 目录下的文档并建立索引（带标签）"""
-        print(f"Loading documents from {self.data_dir}...")
+        获取 Embedding 模型
         
-        from langchain_community.document_loaders import TextLoader, PyPDFLoader, UnstructuredEPubLoader
+        设置了 EMBEDDING_SERVICE_URL 时使用共享 Embedding 服务（多 worker 共用一份模型），
+        否则在当前进程加载本地 HuggingFace 模型
+        """
+        service_url = os.getenv("EMBEDDING_SERVICE_URL")
+        if service_url:
+            from app.core.embedding_service import EmbeddingServiceClient
+            print(f"📊 使用共享 Embedding 服务: {service_url}")
+            return EmbeddingServiceClient(service_url)
+        return load_local_embeddings()
+
+    # 支持的文件格式：(glob, 文件类型)
+    SOURCE_PATTERNS = (("**/*.pdf", "pdf"), ("**/*.txt", "txt"), ("**/*.md", "md"), ("**/*.epub", "epub"))
+    # 单次写入 Chroma 的切片数（Chroma 对单批大小有上限）
+    INDEX_BATCH_SIZE = 1000
+
+    def list_source_files(self):
+        """列出 data 目录下待导入的文件：[(路径, 文件类型)]，跳过隐藏文件"""
+        files = []
+        for pattern, file_type in self.SOURCE_PATTERNS:
+            for path in sorted(Path(self.data_dir).glob(pattern)):
+                relative = path.relative_to(self.data_dir)
+                if path.is_file() and not any(part.startswith(".") for part in relative.parts):
+                    files.append((str(path), file_type))
+        return files
+
+    def load_documents(self, path: str, file_type: str, entry=None):
+        """
+        加载单个文件（PDF 每页一个 Document，EPUB 每章一个 Document）
         
-        # 支持多种文件格式
-        loaders = [
-            DirectoryLoader(self.data_dir, glob="**/*.pdf", loader_cls=PyPDFLoader),
-            DirectoryLoader(self.data_dir, glob="**/*.txt", loader_cls=TextLoader),
-            DirectoryLoader(self.data_dir, glob="**/*.md", loader_cls=TextLoader),
-            DirectoryLoader(self.data_dir, glob="**/*.epub", loader_cls=UnstructuredEPubLoader),
-        ]
+        参数:
+            entry: 可选导入报告条目，记录从 PDF 页缓存读取的页数（pages_cached）
+        """
+        from langchain_community.document_loaders import TextLoader, UnstructuredEPubLoader
         
-        documents = []
-        for loader in loaders:
-            try:
-                docs = loader.load()
-                documents.extend(docs)
-                if docs:
-                    print(f"  ✅ Loaded {len(docs)} documents from {loader.glob}")
-            except Exception as e:
-                print(f"  ⚠️  Warning loading {loader.glob}: {e}")
-        
-        if not documents:
-            print("❌ No documents found.")
-            return
+        if file_type == "pdf" and self.pdf_page_cache:
+            from app.core.pdf_cache import CachedPDFLoader
+            loader = CachedPDFLoader(path, self.pdf_page_cache)
+            documents = loader.load()
+            if entry is not None:
+                entry["pages_cached"] = loader.cached_pages
+            return documents
+        elif file_type == "pdf":
+            loader = PyPDFLoader(path)
+        elif file_type == "epub" and os.getenv("EPUB_LOADER", "native").lower() == "unstructured":
+            loader = UnstructuredEPubLoader(path)
+        elif file_type == "epub":
+            from app.core.epub_loader import EpubChapterLoader
+            loader = EpubChapterLoader(path)
+        else:
+            loader = TextLoader(path)
+        return loader.load()
 
-        print(f"\n📚 Total documents loaded: {len(documents)}")
-        
-        # 为文档添加标签
-        print(f"🏷️  Adding tags to documents...")
+    def tag_documents(self, documents):
+        """为文档添加标签（书名、作者、朝代等）"""
         for doc in documents:
             source = doc.metadata.get("source", "")
             tags = self.tagger.get_tags_for_file(source)
@@ -88,58 +219,719 @@ class RAGManager:
                 doc.metadata["keywords"] = ", ".join(tags["keywords"])
             else:
                 doc.metadata["keywords"] = ""
+        return documents
+
+    def split_documents(self, documents, parents=None, keep=None):
+        """
+        文本切片
         
-        # 打印标签统计
-        tag_stats = {}
+        参数:
+            parents: 可选 ParentStoreWriter（small-to-big）。Document 写入父文本库，
+                切片元数据记录 parent_id、在父文本中的字节偏移 parent_offset 和字节数 child_bytes
+            keep: 可选过滤函数（切片列表 → 保留的切片，如近似重复检测）。small-to-big 时逐个 Document 过滤，
+                切片全部被过滤掉的 Document 不写入父文本库
+        """
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+            separators=SEPARATOR_PRESETS[self.separators],
+            # 中文标点留在句末，而不是放到下一个切片开头
+            keep_separator="end" if self.separators == "chinese" else True,
+            add_start_index=parents is not None,
+        )
+        if parents is None:
+            chunks = text_splitter.split_documents(documents)
+            return keep(chunks) if keep is not None else chunks
+        
+        chunks = []
         for doc in documents:
-            book = doc.metadata.get("book", "未知")
-            tag_stats[book] = tag_stats.get(book, 0) + 1
+            # start_index 是字符偏移且单调递增，增量换算成字节偏移
+            char_pos = byte_pos = 0
+            doc_chunks = text_splitter.split_documents([doc])
+            for chunk in doc_chunks:
+                start = chunk.metadata.pop("start_index", -1)
+                if start >= char_pos:
+                    byte_pos += len(doc.page_content[char_pos:start].encode("utf-8"))
+                    char_pos = start
+                    chunk.metadata["parent_offset"] = byte_pos
+                    chunk.metadata["child_bytes"] = len(chunk.page_content.encode("utf-8"))
+            if keep is not None:
+                doc_chunks = keep(doc_chunks)
+            if not doc_chunks:
+                continue
+            parent_id = parents.add(doc.page_content)
+            for chunk in doc_chunks:
+                if "parent_offset" in chunk.metadata:
+                    chunk.metadata["parent_id"] = parent_id
+            chunks.extend(doc_chunks)
+        return chunks
+
+    def index_chunks(self, vector_store, chunks):
+        """分批写入向量数据库，返回切片 id（用于实体倒排索引）"""
+        ids = [uuid.uuid4().hex for _ in chunks]
+        for i in range(0, len(chunks), self.INDEX_BATCH_SIZE):
+            vector_store.add_documents(chunks[i:i + self.INDEX_BATCH_SIZE], ids=ids[i:i + self.INDEX_BATCH_SIZE])
+        return ids
+
+    def load_and_index(self, save_report: bool = True):
+        """
+        加载 data 目录下的文档并建立索引（带标签）
+        
+        逐个文件加载 → 打标签 → 切片 → Embedding 并写入，记录每个文件各阶段的耗时
         
+        返回:
+            IngestReport（没有文档时返回 None），save_report=True 时同时保存为 JSON
+        """
+        print(f"Loading documents from {self.data_dir}...")
+        
+        files = self.list_source_files()
+        if not files:
+            print("❌ No documents found.")
+            return None
+        
+        report = IngestReport(self.data_dir, self.persist_dir)
+        timed_embeddings = TimedEmbeddings(self.embeddings)
+        vector_store = Chroma(persist_directory=self.persist_dir, embedding_function=timed_embeddings)
+        entity_index = EntityIndex()
+        dedup = None
+        if self.dedup_enabled:
+            from app.core.dedup import NearDuplicateDetector
+            dedup = NearDuplicateDetector()
+        parents = None
+        if self.parent_retrieval:
+            from app.core.parent_store import ParentStoreWriter
+            parents = ParentStoreWriter(self.persist_dir)
+        tag_stats = {}
+        
+        print(f"🏷️  Loading, tagging and indexing {len(files)} files...")
+        with report.running():
+            for path, file_type in files:
+                entry = report.start_file(path, file_type)
+                try:
+                    started = time.perf_counter()
+                    documents = self.load_documents(path, file_type, entry)
+                    entry["load_seconds"] = round(time.perf_counter() - started, 3)
+                    entry["pages"] = len(documents)
+                    entry["chars"] = sum(len(doc.page_content) for doc in documents)
+                    
+                    self.tag_documents(documents)
+                    # 先去重再写父文本：只被重复切片引用的父文本不写入父文本库
+                    duplicates = []
+                    
+                    def keep(chunks):
+                        kept, dropped = dedup.filter(chunks)
+                        duplicates.extend(dropped)
+                        return kept
+                    
+                    chunks = self.split_documents(documents, parents, keep if dedup is not None else None)
+                    if dedup is not None:
+                        entry["duplicates"] = len(duplicates)
+                    self.entity_extractor.tag_chunks(chunks)
+                    entry["chunks"] = len(chunks)
+                    
+                    store_bytes = dir_size(self.persist_dir)
+                    embed_seconds = timed_embeddings.seconds
+                    started = time.perf_counter()
+                    entity_index.add_chunks(self.index_chunks(vector_store, chunks), chunks)
+                    elapsed = time.perf_counter() - started
+                    embed_seconds = timed_embeddings.seconds - embed_seconds
+                    entry["embed_seconds"] = round(embed_seconds, 3)
+                    entry["write_seconds"] = round(elapsed - embed_seconds, 3)
+                    entry["bytes_written"] = dir_size(self.persist_dir) - store_bytes
+                    entry["rss_mb"] = round(current_rss() / 1024 / 1024, 1)
+                    
+                    for doc in documents:
+                        book = doc.metadata.get("book", "未知")
+                        tag_stats[book] = tag_stats.get(book, 0) + 1
+                    print(f"  ✅ {entry['file']}: {len(documents)} documents, {len(chunks)} chunks "
+                          f"(加载 {entry['load_seconds']}s, Embedding {entry['embed_seconds']}s)")
+                except Exception as e:
+                    entry["error"] = str(e)
+                    print(f"  ⚠️  Warning loading {path}: {e}")
+        
+        if dedup is not None:
+            report.dedup = dedup.statistics()
+        totals = report.totals()
+        print(f"\n📚 Total documents loaded: {totals['pages']}")
         print(f"📊 Documents by book:")
         for book, count in tag_stats.items():
             print(f"  - {book}: {count} documents")
-
-        # 文本切片
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        texts = text_splitter.split_documents(documents)
-        print(f"✂️  Split into {len(texts)} chunks.")
-
-        # 存储到向量数据库
-        self.vector_store = Chroma.from_documents(
-            documents=texts,
-            embedding=self.embeddings,
-            persist_directory=self.persist_dir
-        )
+        print(f"✂️  Split into {totals['chunks']} chunks.")
         print("✅ Indexing completed and persisted.")
         print(f"💡 所有文档已添加标签，可以使用标签过滤检索结果")
+        
+        entity_index.save(self.persist_dir)
+        print(f"👤 实体倒排索引：{entity_index.statistics()['entities']} 个实体")
+        parent_store = None
+        if parents is not None:
+            parents.close()
+            parent_store = self._load_parent_store(self.persist_dir)
+            stats = parent_store.statistics()
+            print(f"🪟 父文本库：{stats['parents']} 个父窗口（{stats['mb']} MB），子切片 {self.chunk_size} 字")
+        
+        # 新导入的目录没有投影、量化索引和关键词缓存，由 build_derived_indexes 构建后替换快照
+        self._set_index(IndexSnapshot(self.index_version, self.persist_dir, vector_store,
+                                      entity_index=entity_index, parent_store=parent_store))
+        self.build_derived_indexes()
+        
+        if save_report:
+            report.save()
+        report.print_summary()
+        return report
 
     def get_retriever(self, k=5, filters=None):
         """
-        获取检索器
+        获取检索器（Agent 模式和直接检索使用）
+        
+        与 search() 走同一条路径：投影、量化索引、实体检索和 small-to-big 父窗口扩展都会生效
         
         参数:
             k: 检索文档数量，默认 5（增加检索数量可提高召回率）
             filters: 标签过滤条件，如 {"book": "红楼梦"}
         """
-        if not self.vector_store:
-            # 如果内存里没有，尝试从本地加载
-            self.vector_store = Chroma(
-                persist_directory=self.persist_dir,
-                embedding_function=self.embeddings
-            )
+        return RAGRetriever(rag=self, k=k, filters=filters)
+    
+    # 只读兼容属性（脚本和基准测试使用）
+    vector_store = _index_field("vector_store")
+    projection = _index_field("projection")
+    projected_store = _index_field("projected_store")
+    quantized_index = _index_field("quantized_index")
+    entity_index = _index_field("entity_index")
+    keyword_cache = _index_field("keyword_cache")
+    parent_store = _index_field("parent_store")
+    
+    @property
+    def loaded_index(self):
+        """已打开的快照；尚未打开时为 None（不触发加载）"""
+        return self._snapshot
+    
+    def current_index(self) -> IndexSnapshot:
+        """
+        当前版本的快照（首次使用时打开）
+        
+        一次检索只在开始时调用一次，之后全程使用返回的对象
+        """
+        self.reload_if_changed()
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._snapshot_lock:
+                if self._snapshot is None:
+                    self._snapshot = self._open_index(self.index_version, self.persist_dir)
+                snapshot = self._snapshot
+        return snapshot
+    
+    def _set_index(self, snapshot):
+        with self._snapshot_lock:
+            self._snapshot = snapshot
+    
+    def _update_index(self, **changes):
+        """构建派生索引后用新对象替换当前快照（同一版本目录）"""
+        with self._snapshot_lock:
+            self._snapshot = self.current_index().replace(**changes)
+            return self._snapshot
+    
+    def _open_index(self, version, persist_dir) -> IndexSnapshot:
+        """打开一个版本目录：Chroma 集合及按配置开启的投影、量化索引、实体索引、父文本库和关键词检索缓存"""
+        vector_store = Chroma(persist_directory=persist_dir, embedding_function=self.embeddings)
+        projection, projected_store = self._load_projection(persist_dir)
+        snapshot = IndexSnapshot(
+            version, persist_dir, vector_store, projection, projected_store,
+            quantized_index=self._load_quantized_index(persist_dir, vector_store, projection),
+            entity_index=self._load_entity_index(persist_dir),
+            parent_store=self._load_parent_store(persist_dir),
+        )
+        return snapshot.replace(keyword_cache=self._load_keyword_cache(snapshot))
+    
+    def reload_if_changed(self, force=False):
+        """
+        CURRENT 指针变化时切换到新版本（最多每 INDEX_RELOAD_INTERVAL 秒检查一次）
+        
+        先打开新版本的快照，再一次性替换引用；正在进行的检索继续使用开始时取到的旧快照
+        """
+        now = time.monotonic()
+        if not force and now - self._version_checked_at < self.reload_interval:
+            return False
+        self._version_checked_at = now
+        version = index_versions.current_version(self.index_root)
+        if version == self.index_version:
+            return False
+        
+        with self._snapshot_lock:
+            if version == self.index_version:  # 其它线程已经切换
+                return False
+            print(f"🔄 向量库切换到版本 {version}（原 {self.index_version or '旧布局'}）")
+            persist_dir = index_versions.resolve_store_dir(self.index_root)
+            # 尚未打开过的留到首次使用时再打开
+            snapshot = self._open_index(version, persist_dir) if self._snapshot is not None else None
+            self.index_version, self.persist_dir = version, persist_dir
+            self._snapshot = snapshot
+        return True
+
+    def rebuild_index(self, keep=None, save_report=True):
+        """
+        蓝绿重建：导入到新的版本目录，校验通过后切换 CURRENT 并清理旧版本
+        
+        构建或校验失败时删除新目录，当前版本不受影响
+        
+        参数:
+            keep: 保留的版本数（含当前版本），默认 INDEX_KEEP_VERSIONS（2）
+        返回:
+            {"status", "version", "validation", "removed", "report"}
+        """
+        builder, path = self._new_version_builder()
+        try:
+            report = builder.load_and_index(save_report=save_report)
+        except Exception:
+            index_versions.discard_version(path)
+            raise
+        if report is None:
+            index_versions.discard_version(path)
+            return {"status": "error", "version": os.path.basename(path), "message": "No documents found"}
+        
+        failed = report.totals()["failed_files"]
+        result = self._promote_version(builder, path, keep, [f"{failed} 个文件导入失败"] if failed else [])
+        result["report"] = report
+        return result
+
+    def _new_version_builder(self):
+        """创建新的版本目录和写入它的 RAGManager"""
+        path = index_versions.new_version_dir(self.index_root)
+        print(f"🏗️  构建新版本 {os.path.basename(path)}（当前版本 {self.index_version or '旧布局'} 继续提供服务）")
+        builder = RAGManager(self.data_dir, path, embeddings=self.embeddings, chunk_size=self.chunk_size,
+                             chunk_overlap=self.chunk_overlap, separators=self.separators,
+                             parent_retrieval=self.parent_retrieval)
+        # 新目录还没有任何派生索引
+        builder._set_index(IndexSnapshot(None, path, Chroma(persist_directory=path, embedding_function=self.embeddings)))
+        return builder, path
+
+    def _promote_version(self, builder, path, keep=None, errors=()):
+        """校验新版本，通过则切换 CURRENT、清理旧版本并热切换，否则删除新目录"""
+        keep = keep or int(os.getenv("INDEX_KEEP_VERSIONS", "2"))
+        version = os.path.basename(path)
+        validation = index_versions.validate_version(builder._ensure_vector_store())
+        validation["errors"].extend(errors)
+        validation["ok"] = not validation["errors"]
+        if not validation["ok"]:
+            index_versions.discard_version(path)
+            print(f"❌ 新版本校验未通过，保留当前版本: {'; '.join(validation['errors'])}")
+            return {"status": "error", "version": version, "validation": validation}
+        
+        index_versions.activate_version(self.index_root, version)
+        removed = index_versions.gc_versions(self.index_root, keep)
+        print(f"✅ 已切换到版本 {version}（{validation['vectors']} 个向量），清理 {len(removed)} 个旧条目")
+        self.reload_if_changed(force=True)
+        return {"status": "success", "version": version, "validation": validation, "removed": removed}
+
+    def export_bundle(self, path):
+        """把当前版本导出为便携包（切片、元数据、向量），返回 manifest"""
+        from app.core.index_bundle import export_bundle
+        from app.core.parent_store import PARENT_DIR, INDEX_FILE, TEXT_FILE
+        
+        index = self.current_index()
+        parent_dir = os.path.join(index.persist_dir, PARENT_DIR)
+        attachments = {}
+        if os.path.exists(os.path.join(parent_dir, INDEX_FILE)):
+            attachments = {f"{PARENT_DIR}/{name}": os.path.join(parent_dir, name) for name in (TEXT_FILE, INDEX_FILE)}
+        return export_bundle(index.vector_store._collection, path,
+                             embedding_model=os.getenv("LOCAL_EMBEDDING_MODEL", "BAAI/bge-large-zh-v1.5"),
+                             index_version=index.version, attachments=attachments)
+
+    def import_bundle(self, bundle_path, keep=None):
+        """
+        从便携包导入到新版本（不重新计算 Embedding），校验通过后切换
+        
+        开启投影 / 量化时在新版本上重新构建
+        """
+        from app.core.index_bundle import import_bundle, read_manifest
+        
+        manifest = read_manifest(bundle_path)
+        model = os.getenv("LOCAL_EMBEDDING_MODEL", "BAAI/bge-large-zh-v1.5")
+        if manifest["embedding_model"] and manifest["embedding_model"] != model:
+            print(f"⚠️  导出包使用 {manifest['embedding_model']}，当前配置为 {model}，查询向量可能不兼容")
+        
+        builder, path = self._new_version_builder()
+        try:
+            started = time.perf_counter()
+            import_bundle(bundle_path, builder._ensure_vector_store()._collection, attachments_dir=path)
+            print(f"📥 已写入 {manifest['count']} 个向量（{manifest['dim']} 维），耗时 {time.perf_counter() - started:.1f}s")
+            builder.build_entity_index(retag="entities" not in manifest["metadata_fields"])
+            builder.build_derived_indexes()
+        except Exception:
+            index_versions.discard_version(path)
+            raise
+        result = self._promote_version(builder, path, keep)
+        result["manifest"] = manifest
+        return result
+
+    def _ensure_vector_store(self):
+        """当前版本的原始 Chroma 集合（首次使用时打开）"""
+        return self.current_index().vector_store
+    
+    def build_projection(self, dim=None):
+        """
+        在当前向量库的向量上拟合 PCA，并写入投影集合（复用已有向量，不重新计算 Embedding）
+        
+        参数:
+            dim: 目标维度，默认 VECTOR_PROJECTION_DIM
+        """
+        import numpy as np
+        from app.core.projection import (PROJECTION_DIR, PCAProjection, ProjectedEmbeddings,
+                                         build_projected_collection, projected_collection_name)
+        from app.core.quantized_store import iter_collection
+        
+        dim = dim or self.projection_dim
+        index = self.current_index()
+        collection = index.vector_store._collection
+        vectors = [np.asarray(batch["embeddings"], dtype=np.float32) for batch in iter_collection(collection)]
+        if not vectors:
+            raise ValueError("向量库为空，无法拟合投影")
+        vectors = np.concatenate(vectors)
+        
+        print(f"📐 拟合 PCA 投影：{vectors.shape[1]} → {dim} 维...")
+        projection = PCAProjection.fit(vectors, dim)
+        
+        name = projected_collection_name(dim)
+        Chroma(collection_name=name, persist_directory=index.persist_dir).delete_collection()
+        store = Chroma(collection_name=name, persist_directory=index.persist_dir,
+                       embedding_function=ProjectedEmbeddings(self.embeddings, projection))
+        written = build_projected_collection(collection, store, projection)
+        projection.save(os.path.join(index.persist_dir, PROJECTION_DIR))
+        
+        self._update_index(projection=projection, projected_store=store)
+        print(f"  ✅ {written} 个向量已投影（版本 {projection.version}，保留方差 {projection.explained_variance:.1%}）")
+        return projection
+
+    def _load_projection(self, persist_dir):
+        """加载投影和投影集合；未开启、不存在或版本不一致时返回 (None, None)（使用原始向量检索）"""
+        if not self.projection_dim:
+            return None, None
+        from app.core.projection import PROJECTION_DIR, PCAProjection, ProjectedEmbeddings, projected_collection_name
+        
+        projection = PCAProjection.load(os.path.join(persist_dir, PROJECTION_DIR))
+        if projection is None or projection.dim != self.projection_dim:
+            print(f"⚠️  未找到 {self.projection_dim} 维投影，使用原始向量检索（重新导入或运行 build_projection）")
+            return None, None
+        store = Chroma(collection_name=projected_collection_name(projection.dim), persist_directory=persist_dir,
+                       embedding_function=ProjectedEmbeddings(self.embeddings, projection))
+        version = (store._collection.metadata or {}).get("projection_version")
+        if version != projection.version:
+            print(f"⚠️  投影集合版本 {version} 与投影 {projection.version} 不一致，使用原始向量检索")
+            return None, None
+        return projection, store
+
+    def _search_store(self):
+        """检索使用的向量库：启用投影时为投影集合，否则为原始集合"""
+        return self.current_index().search_store
+
+    def build_derived_indexes(self):
+        """在当前向量库上构建投影、量化索引和关键词检索缓存（按配置开启；顺序不能变，后者依赖前者）"""
+        if self.projection_dim:
+            self.build_projection()
+        if self.quantization:
+            self.build_quantized_index()
+        if self.keyword_cache_enabled:
+            self.build_keyword_cache()
+
+    def _keyword_cache_fingerprint(self, index):
+        """
+        检索结果依赖的一切：向量数、关键词配置、Embedding 模型和检索设置
+        
+        缓存文件放在版本目录内，切换版本自然失效，因此不包含版本名（构建时新版本尚未激活）
+        """
+        from app.core.keyword_cache import file_digest, index_fingerprint
+        projection = index.projection
+        return index_fingerprint({
+            "vectors": index.vector_store._collection.count(),
+            "keywords": file_digest(self.entity_extractor.config_path),
+            "embedding_model": os.getenv("LOCAL_EMBEDDING_MODEL", "BAAI/bge-large-zh-v1.5"),
+            "projection": projection.version if projection is not None else None,
+            "quantization": self.quantization,
+            "entity_retrieval": self.entity_retrieval,
+            "entity_boost_weight": self.entity_boost_weight,
+        })
+
+    def build_keyword_cache(self):
+        """为每个关键词（及「X是谁」等模板）预先检索并保存前 k 个切片 id"""
+        from app.core.keyword_cache import KeywordRetrievalCache
+        
+        keywords = list(self.entity_extractor.entities)
+        print(f"⚡ 预计算 {len(keywords)} 个关键词的检索结果（k={self.keyword_cache_k}）...")
+        started = time.perf_counter()
+        index = self.current_index()
+        cache = KeywordRetrievalCache.build(
+            lambda query, k: [doc.id for doc in self.search(query, k=k) if doc.id],
+            keywords, self._keyword_cache_fingerprint(index), self.keyword_cache_k,
+        )
+        cache.save(index.persist_dir)
+        self._update_index(keyword_cache=cache)
+        print(f"  ✅ {len(cache.entries)} 条，耗时 {time.perf_counter() - started:.1f}s")
+        return cache
+
+    def _load_keyword_cache(self, index):
+        """加载关键词检索缓存；未开启、不存在或已失效时返回 None"""
+        if not self.keyword_cache_enabled:
+            return None
+        from app.core.keyword_cache import KeywordRetrievalCache
+        cache = KeywordRetrievalCache.load(index.persist_dir, self._keyword_cache_fingerprint(index))
+        if cache is None:
+            print("⚠️  关键词检索缓存不存在或已失效（重新导入或运行 scripts/build_keyword_cache.py）")
+        return cache
+
+    def cached_search(self, query, k=5, trace=None):
+        """
+        关键词检索缓存：命中时按 id 直接取切片（不做 Embedding 和向量检索），未命中返回 None
+        """
+        index = self.current_index()
+        cache = index.keyword_cache
+        ids = cache.get(query, k) if cache is not None else None
+        if ids is None:
+            return None
+        started = time.perf_counter()
+        docs = self.expand_to_parents(self.get_documents(ids, index), index)
+        if trace is not None:
+            trace.record("keyword_cache", time.perf_counter() - started)
+        CACHE_HITS.inc(cache="keyword_retrieval")
+        return docs
+
+    def build_entity_index(self, retag=False):
+        """
+        从当前向量库重建实体倒排索引（导入包或旧向量库使用）
+        
+        参数:
+            retag: 重新扫描切片文本并回写 entities 元数据（旧向量库没有实体标签时使用）
+        """
+        index = self.current_index()
+        entity_index = EntityIndex.from_collection(index.vector_store._collection,
+                                                   self.entity_extractor if retag else None)
+        entity_index.save(index.persist_dir)
+        self._update_index(entity_index=entity_index)
+        stats = entity_index.statistics()
+        print(f"👤 实体倒排索引：{stats['entities']} 个实体，{stats['postings']} 条记录")
+        return entity_index
+
+    def reload_entities(self):
+        """
+        关键词配置变化后重建实体识别正则（已写入切片的实体标签和倒排索引要重新导入或运行
+        scripts/build_entity_index.py 才会更新）；关键词检索缓存的指纹随之变化而失效
+        """
+        self.entity_extractor = EntityExtractor(self.entity_extractor.config_path)
+        with self._snapshot_lock:
+            if self._snapshot is not None:
+                self._snapshot = self._snapshot.replace(keyword_cache=self._load_keyword_cache(self._snapshot))
+
+    def _load_entity_index(self, persist_dir):
+        """加载实体倒排索引；未开启或不存在时返回 None（不做实体检索）"""
+        if self.entity_retrieval == "off":
+            return None
+        entity_index = EntityIndex.load(persist_dir)
+        if entity_index is None:
+            print("⚠️  未找到实体倒排索引（运行 scripts/build_entity_index.py 构建）")
+        return entity_index
+
+    def _query_entities(self, query, index):
+        """问题中提到的、在倒排索引中出现过的实体"""
+        if self.entity_retrieval == "off" or index.entity_index is None:
+            return []
+        return [name for name in self.entity_extractor.find(query) if name in index.entity_index.postings]
+
+    def _search_entities(self, entities, query_vector, k, filters, index):
+        """
+        restrict 模式：只在提到实体的切片中精确检索
+        
+        候选过多或过滤条件不是简单等值时返回 None（退回常规检索 + boost）
+        """
+        import numpy as np
+        from langchain_core.documents import Document
+        
+        ids = index.entity_index.lookup(entities)
+        if len(ids) > self.entity_max_candidates:
+            return None
+        if filters and any(key.startswith("$") or isinstance(value, dict) for key, value in filters.items()):
+            return None
+        records = index.search_store._collection.get(ids=list(ids), include=["embeddings", "documents", "metadatas"])
+        rows = [
+            (doc_id, vector, text, metadata or {})
+            for doc_id, vector, text, metadata in zip(records["ids"], records["embeddings"],
+                                                      records["documents"], records["metadatas"])
+            if not filters or all((metadata or {}).get(key) == value for key, value in filters.items())
+        ]
+        if not rows:
+            return []
+        vectors = np.asarray([row[1] for row in rows], dtype=np.float32)
+        distances = ((vectors - np.asarray(query_vector, dtype=np.float32)) ** 2).sum(axis=1)
+        return [Document(id=rows[i][0], page_content=rows[i][2], metadata=rows[i][3])
+                for i in np.argsort(distances)[:k]]
+
+    @staticmethod
+    def _boost_entities(docs, entities, k, weight=0.5):
+        """
+        按相似度名次和实体命中比例的加权分重排，取前 k 个
+
+        分数 = 名次 / 候选数 - weight × 命中实体数 / 问题中实体数（越小越靠前）；
+        weight=0.5 时提到全部实体的切片最多前移半个候选列表，相似度很低的切片不会仅凭提到实体排到最前
+        """
+        total = max(len(docs), 1)
+        
+        def score(item):
+            position, doc = item
+            matched = sum(name in doc.page_content for name in entities)
+            return position / total - weight * matched / len(entities)
+        
+        ranked = sorted(enumerate(docs), key=lambda item: (score(item), item[0]))
+        return [doc for _, doc in ranked[:k]]
+
+    def build_quantized_index(self, mode=None):
+        """从当前向量库构建量化索引（导入完成后自动调用，也可用 scripts/build_quantized_index.py 单独构建）"""
+        from app.core.quantized_store import QUANTIZED_DIR, QuantizedIndex
+        
+        mode = mode or self.quantization
+        index = self.current_index()
+        print(f"🗜️  构建 {mode} 量化索引...")
+        quantized_index = QuantizedIndex.build(
+            index.search_store._collection, os.path.join(index.persist_dir, QUANTIZED_DIR), mode
+        )
+        self._update_index(quantized_index=quantized_index)
+        stats = quantized_index.statistics()
+        print(f"  ✅ {stats['count']} 个向量：{stats['float32_mb']} MB → {stats['memory_mb']} MB（压缩 {stats['compression']}x）")
+        return quantized_index
+
+    def _load_quantized_index(self, persist_dir, vector_store, projection):
+        """加载量化索引；未开启、不存在或与向量库 / 投影不一致时返回 None（使用 Chroma 检索）"""
+        if not self.quantization:
+            return None
+        from app.core.quantized_store import QUANTIZED_DIR, QuantizedIndex
+        quantized_index = QuantizedIndex.load(os.path.join(persist_dir, QUANTIZED_DIR))
+        if quantized_index is None:
+            print("⚠️  未找到量化索引，使用 Chroma 检索（运行 scripts/build_quantized_index.py 构建）")
+        elif quantized_index.manifest["count"] != vector_store._collection.count():
+            print("⚠️  量化索引与向量库数量不一致（已过期），使用 Chroma 检索，请重新构建")
+            return None
+        elif projection is not None and quantized_index.manifest["dim"] != projection.dim:
+            print("⚠️  量化索引维度与当前投影不一致，使用 Chroma 检索，请重新构建")
+            return None
+        elif quantized_index.mode != self.quantization:
+            print(f"⚠️  量化索引模式为 {quantized_index.mode}，与 VECTOR_QUANTIZATION={self.quantization} 不一致")
+        return quantized_index
+
+    def _search_quantized(self, index, query_vector, k, filters):
+        """量化索引检索，按 id 从同一快照的 Chroma 取回文档内容和元数据"""
+        hits = index.quantized_index.search(query_vector, k=k, filters=filters)
+        return self.get_documents([doc_id for doc_id, _ in hits], index)
+
+    def get_documents(self, ids, index=None):
+        """按 id 取切片（保持 ids 的顺序）；index 为检索开始时取到的快照"""
+        from langchain_core.documents import Document
+        
+        if not ids:
+            return []
+        index = index or self.current_index()
+        records = index.vector_store._collection.get(ids=list(ids), include=["documents", "metadatas"])
+        by_id = {
+            doc_id: Document(id=doc_id, page_content=text, metadata=metadata or {})
+            for doc_id, text, metadata in zip(records["ids"], records["documents"], records["metadatas"])
+        }
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+    def embed_query(self, query: str, trace=None):
+        """计算问题向量（原始维度，供检索和 Few-Shot 示例选择共用），记录 query_embedding 耗时"""
+        started = time.perf_counter()
+        query_vector = self.embeddings.embed_query(query)
+        if trace is not None:
+            trace.record("query_embedding", time.perf_counter() - started)
+        return query_vector
+
+    def search(self, query: str, k=5, filters=None, trace=None, query_vector=None):
+        """
+        检索相关文档（查询向量化和向量检索分开计时）
+        
+        参数:
+            query: 查询文本
+            k: 返回文档数量
+            filters: 标签过滤条件，如 {"book": "红楼梦"}
+            trace: 可选 RequestTrace，记录 query_embedding / vector_search 耗时
+            query_vector: 已经用 embed_query 计算好的问题向量（不再重复计算）
+        """
+        # 整个检索使用同一个快照：版本切换只影响之后开始的检索
+        index = self.current_index()
+        
+        if query_vector is None:
+            query_vector = self.embed_query(query, trace)
+        if index.projection is not None:
+            query_vector = index.projection.transform(query_vector).tolist()
         
-        # 构建检索参数
-        search_kwargs = {"k": k}
+        started = time.perf_counter()
+        results = None
+        entities = self._query_entities(query, index)
+        if entities and trace is not None:
+            trace.set("entity_matches", len(entities))
+        if entities and self.entity_retrieval == "restrict":
+            results = self._search_entities(entities, query_vector, k, filters, index)
+        if results is None:
+            # boost：多取候选，再把提到实体的切片排到前面
+            fetch_k = k * 3 if entities else k
+            if index.quantized_index is not None:
+                from app.core.quantized_store import UnsupportedFilter
+                try:
+                    results = self._search_quantized(index, query_vector, fetch_k, filters)
+                except UnsupportedFilter:
+                    results = None
+            if results is None:
+                results = index.search_store.similarity_search_by_vector(query_vector, k=fetch_k, filter=filters)
+            if entities:
+                results = self._boost_entities(results, entities, k, self.entity_boost_weight)
+        if trace is not None:
+            trace.record("vector_search", time.perf_counter() - started)
+        
+        if index.parent_store is not None:
+            started = time.perf_counter()
+            results = self.expand_to_parents(results, index)
+            if trace is not None:
+                trace.record("parent_window", time.perf_counter() - started)
+        return results
+    
+    def _load_parent_store(self, persist_dir):
+        """加载父文本库；未开启或不存在时返回 None（直接返回子切片）"""
+        if not self.parent_retrieval:
+            return None
+        from app.core.parent_store import ParentStore
+        parent_store = ParentStore.load(persist_dir)
+        if parent_store is None:
+            print("⚠️  未找到父文本库，直接返回检索到的切片（开启 PARENT_RETRIEVAL 后需重新导入）")
+        return parent_store
+    
+    def expand_to_parents(self, docs, index=None):
+        """
+        子切片 → 父文本中子切片前后约 PARENT_WINDOW_CHARS 字的窗口
         
-        # 如果有过滤条件，添加到检索参数
-        if filters:
-            # Chroma 使用 where 参数进行元数据过滤
-            # 例如: {"book": "红楼梦"}
-            search_kwargs["filter"] = filters
+        同一父文本中重叠的窗口合并到排名靠前的那一条（结果可能少于 k 条）；
+        没有 parent_id 的切片原样返回。元数据（书名、页码等）沿用子切片；index 为检索开始时取到的快照
+        """
+        from langchain_core.documents import Document
         
-        return self.vector_store.as_retriever(search_kwargs=search_kwargs)
+        store = (index or self.current_index()).parent_store
+        if store is None:
+            return docs
+        windows = []  # [doc, parent_id, start, end]
+        for doc in docs:
+            parent_id = doc.metadata.get("parent_id")
+            if parent_id not in store:
+                windows.append([doc, None, 0, 0])
+                continue
+            start, end = store.window(parent_id, doc.metadata["parent_offset"], doc.metadata["child_bytes"],
+                                      self.parent_window_chars)
+            for window in windows:
+                if window[1] == parent_id and start <= window[3] and end >= window[2]:
+                    window[2], window[3] = min(start, window[2]), max(end, window[3])
+                    break
+            else:
+                windows.append([doc, parent_id, start, end])
+        return [
+            Document(id=doc.id, page_content=store.read(parent_id, start, end), metadata=doc.metadata)
+            if parent_id else doc
+            for doc, parent_id, start, end in windows
+        ]
     
-    def search_by_book(self, query: str, book_name: str, k=5):
+    def search_by_book(self, query: str, book_name: str, k=5, trace=None, query_vector=None):
         """
         按书名检索
         
@@ -148,20 +940,8 @@ class RAGManager:
             book_name: 书名（如 "红楼梦"）
             k: 返回文档数量
         """
-        if not self.vector_store:
-            self.vector_store = Chroma(
-                persist_directory=self.persist_dir,
-                embedding_function=self.embeddings
-            )
-        
         # 使用元数据过滤
-        results = self.vector_store.similarity_search(
-            query,
-            k=k,
-            filter={"book": book_name}
-        )
-        
-        return results
+        return self.search(query, k=k, filters={"book": book_name}, trace=trace, query_vector=query_vector)
     
     def get_books_list(self):
         """获取知识库中的所有书籍"""
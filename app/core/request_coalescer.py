@@ -0,0 +1,224 @@
+"""
+请求合并模块（Single-flight）
+相同问题并发到达时只执行一次检索和 LLM 生成，
+后到的请求挂到同一个 token 流上，由各自的 SSE 连接分发
+"""
+import asyncio
+import re
+import threading
+import unicodedata
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from app.core.metrics import REGISTRY
+
+STREAMS_CANCELLED = REGISTRY.counter("kb_streams_cancelled_total", "客户端断开后取消的生成数")
+TOKENS_SAVED = REGISTRY.counter("kb_tokens_saved_total", "取消生成估算节省的 token 数")
+
+_WHITESPACE = re.compile(r"\s+")
+_SENTINEL = object()
+
+
+def normalize_query(query: str) -> str:
+    """
+    归一化问题文本，作为合并键的一部分
+
+    全角/半角统一（NFKC）、合并连续空白、去掉首尾空白、英文小写
+    """
+    query = unicodedata.normalize("NFKC", query or "")
+    return _WHITESPACE.sub(" ", query).strip().lower()
+
+
+class CancelEvent(threading.Event):
+    """
+    可注册回调的取消事件
+
+    set() 时立即在调用方线程中执行回调（如中断正在阻塞读取的 HTTP 流），
+    不必等生成线程读到下一个文本块后才发现已取消；已取消时注册的回调立即执行
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._callbacks = []
+        self._callback_lock = threading.Lock()
+
+    def add_callback(self, callback: Callable[[], None]):
+        with self._callback_lock:
+            if not self.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]):
+        with self._callback_lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def set(self):
+        with self._callback_lock:
+            callbacks, self._callbacks = self._callbacks, []
+            super().set()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️  取消回调执行失败：{e}")
+
+
+class Flight:
+    """一次正在进行中的生成任务，所有订阅者共享它的文本块"""
+
+    def __init__(self, key: Tuple):
+        self.key = key
+        self.chunks = []          # 已产出的文本块（后到的订阅者从头回放）
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.result = None        # 生成结束后的附加信息（如检索元数据）
+        self.subscribers = 0
+        self.condition = asyncio.Condition()
+        self.cancel_event = CancelEvent()   # 所有订阅者断开后设置，通知生成线程停止并断开上游 HTTP 流
+        self.task: Optional[asyncio.Task] = None
+
+
+class RequestCoalescer:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._flights: Dict[Tuple, Flight] = {}
+        self.total_requests = 0
+        self.coalesced_requests = 0
+        # 断开取消统计（流式分块数近似 token 数）
+        self.completed_streams = 0
+        self.completed_tokens = 0
+        self.cancelled_streams = 0
+        self.tokens_saved = 0
+
+    def make_key(self, query: str, book: Optional[str], provider: str, model: str) -> Tuple:
+        """合并键：(归一化问题, 书名, 模型提供商, 模型名)"""
+        return (normalize_query(query), book or "", provider or "", model or "")
+
+    def join(self, key: Tuple, stream_factory: Callable[[threading.Event], Iterator[str]],
+             finalize: Optional[Callable[[], object]] = None, trace=None) -> Tuple[Flight, bool]:
+        """
+        加入（或发起）一次生成
+
+        参数:
+            key: make_key() 生成的合并键
+            stream_factory: 接收 cancel_event 的函数，返回逐块产出文本的同步生成器
+            finalize: 无参函数，生成结束后调用一次，返回值作为 flight.result 共享
+            trace: 发起生成的请求的 RequestTrace；生成结束（完成、取消或出错）时按结果 finish()
+
+        返回:
+            (Flight, 是否合并到了已有请求)
+        """
+        self.total_requests += 1
+
+        flight = self._flights.get(key) if self.enabled else None
+        if flight is not None:
+            self.coalesced_requests += 1
+            return flight, True
+
+        flight = Flight(key)
+        if self.enabled:
+            self._flights[key] = flight
+        flight.task = asyncio.create_task(self._produce(flight, stream_factory, finalize, trace))
+        return flight, False
+
+    async def _produce(self, flight: Flight, stream_factory, finalize, trace=None):
+        """在线程中驱动同步生成器，把文本块广播给所有订阅者"""
+        iterator = None
+        outcome = "error"
+        try:
+            iterator = stream_factory(flight.cancel_event)
+            while not flight.cancel_event.is_set():
+                chunk = await asyncio.to_thread(next, iterator, _SENTINEL)
+                if chunk is _SENTINEL:
+                    break
+                async with flight.condition:
+                    flight.chunks.append(chunk)
+                    flight.condition.notify_all()
+
+            if flight.cancel_event.is_set():
+                # 中断上游 LLM 流（生成器的 finally 会关闭 HTTP 流）
+                await asyncio.to_thread(iterator.close)
+                self._record_cancel(flight)
+                outcome = "cancelled"
+            else:
+                self.completed_streams += 1
+                self.completed_tokens += len(flight.chunks)
+                outcome = "ok"
+                if trace is not None:
+                    trace.finish(outcome=outcome)
+                if finalize:
+                    flight.result = finalize()
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            # 取消和出错的请求同样记录各阶段耗时（已完成的请求在 finalize 前已记录）
+            if trace is not None:
+                trace.finish(outcome=outcome)
+            # 结束后立即移出登记表：之后到达的相同请求会重新发起生成
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            async with flight.condition:
+                flight.done = True
+                flight.condition.notify_all()
+
+    async def stream(self, flight: Flight):
+        """
+        订阅 flight 的文本流（异步生成器）
+
+        先回放已产出的文本块，再等待新文本块；生成出错时抛出原异常
+        """
+        flight.subscribers += 1
+        try:
+            index = 0
+            while True:
+                async with flight.condition:
+                    await flight.condition.wait_for(
+                        lambda: len(flight.chunks) > index or flight.done
+                    )
+                while index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                if flight.done and index >= len(flight.chunks):
+                    break
+
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                self.cancel(flight)
+
+    def cancel(self, flight: Flight):
+        """取消生成：检索尚未结束时跳过 LLM 调用，已在生成时中断上游流"""
+        if flight.cancel_event.is_set():
+            return
+        flight.cancel_event.set()
+        # 立即移出登记表，新的相同请求不会挂到已取消的生成上
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+        print(f"🛑 客户端已断开，取消生成（已产出 {len(flight.chunks)} 块）")
+
+    def _record_cancel(self, flight: Flight):
+        """记录取消次数，并按已完成生成的平均长度估算节省的 token 数"""
+        self.cancelled_streams += 1
+        STREAMS_CANCELLED.inc()
+        if self.completed_streams:
+            average = self.completed_tokens / self.completed_streams
+            saved = max(int(average) - len(flight.chunks), 0)
+            self.tokens_saved += saved
+            TOKENS_SAVED.inc(saved)
+
+    def get_statistics(self) -> Dict:
+        """获取请求合并统计"""
+        return {
+            "启用": self.enabled,
+            "总请求数": self.total_requests,
+            "合并请求数": self.coalesced_requests,
+            "进行中": len(self._flights),
+            "取消生成数": self.cancelled_streams,
+            "估算节省 token 数": self.tokens_saved,
+        }
@@ -0,0 +1,191 @@
+"""
+Token 统计
+- 优先使用提供商返回的 usage（prompt / completion / 缓存命中 token 数）
+- 没有 usage 时用本地分词器估算（装了 tiktoken 就用 tiktoken，否则按中文字符 + 英文单词估算）
+- 提示词按 few-shot 示例 / 知识库内容 / 用户问题 / 模板文字拆分
+- 每次请求追加一行到 usage/token_usage.jsonl，按天汇总
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.core.metrics import REGISTRY
+
+LLM_TOKENS = REGISTRY.counter(
+    "kb_llm_tokens_total", "LLM token 数", labels=("provider", "kind")
+)
+PROMPT_PART_TOKENS = REGISTRY.counter(
+    "kb_prompt_part_tokens_total", "提示词各部分 token 数（few_shot / context / query / template）", labels=("part",)
+)
+
+_CJK_RANGES = "\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef"
+_CJK = re.compile(f"[{_CJK_RANGES}]")
+_WORD = re.compile(rf"[A-Za-z0-9_]+|[^\sA-Za-z0-9_{_CJK_RANGES}]")
+
+_encoder = None
+_encoder_loaded = False
+
+
+def _get_encoder():
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        _encoder_loaded = True
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoder = None
+    return _encoder
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本 token 数"""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text))
+    # 中文字符约 1 token/字，英文单词约 1.3 token/词，标点 1 token
+    cjk = len(_CJK.findall(text))
+    words = _WORD.findall(text)
+    return cjk + int(sum(1.3 if w[0].isalnum() else 1 for w in words) + 0.5)
+
+
+def prompt_breakdown(prompt: str, parts: Dict[str, str]) -> Dict[str, int]:
+    """
+    按部分估算提示词 token 数
+
+    参数:
+        prompt: 完整提示词
+        parts: {"few_shot": ..., "context": ..., "query": ...}
+
+    返回:
+        各部分 token 数，template 为其余模板文字
+    """
+    breakdown = {name: estimate_tokens(text) for name, text in parts.items()}
+    breakdown["template"] = max(estimate_tokens(prompt) - sum(breakdown.values()), 0)
+    return breakdown
+
+
+def usage_from_message(message) -> Optional[Dict[str, int]]:
+    """从 LangChain 消息的 usage_metadata 中取出 token 数"""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return None
+    details = usage.get("input_token_details") or {}
+    return {
+        "prompt_tokens": usage.get("input_tokens", 0),
+        "completion_tokens": usage.get("output_tokens", 0),
+        "cached_tokens": details.get("cache_read", 0) or 0,
+    }
+
+
+def build_usage(prompt: str, completion: str, parts: Dict[str, str],
+                provider_usage: Optional[Dict[str, int]] = None) -> Dict:
+    """
+    生成单次请求的 token 统计
+
+    返回:
+        {"prompt_tokens", "completion_tokens", "cached_tokens", "source", "prompt_breakdown"}
+    """
+    breakdown = prompt_breakdown(prompt, parts)
+    if provider_usage:
+        usage = dict(provider_usage)
+        usage["source"] = "provider"
+    else:
+        usage = {
+            "prompt_tokens": sum(breakdown.values()),
+            "completion_tokens": estimate_tokens(completion),
+            "cached_tokens": 0,
+            "source": "estimate",
+        }
+    usage["prompt_breakdown"] = breakdown
+    return usage
+
+
+class TokenLedger:
+    """
+    Token 账本：每次请求追加一行 JSON（多进程追加写是安全的），按天汇总
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("TOKEN_USAGE_FILE", "usage/token_usage.jsonl")
+        self._lock = threading.Lock()
+
+    def record(self, usage: Dict, provider: str, model: str, mode: str):
+        LLM_TOKENS.inc(usage["prompt_tokens"], provider=provider, kind="prompt")
+        LLM_TOKENS.inc(usage["completion_tokens"], provider=provider, kind="completion")
+        LLM_TOKENS.inc(usage.get("cached_tokens", 0), provider=provider, kind="cached")
+        for part, tokens in usage.get("prompt_breakdown", {}).items():
+            PROMPT_PART_TOKENS.inc(tokens, part=part)
+
+        entry = {"ts": time.time(), "provider": provider, "model": model, "mode": mode}
+        entry.update(usage)
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+        except OSError as e:
+            print(f"⚠️  写入 token 账本失败: {e}")
+
+    def daily_rollup(self, days: Optional[int] = None) -> Dict:
+        """
+        按天汇总
+
+        返回:
+            {"2026-01-01": {"requests", "prompt_tokens", "completion_tokens", "cached_tokens",
+                            "estimated_requests", "prompt_breakdown": {...}, "by_model": {...}}, ...}
+        """
+        rollup = {}
+        if not os.path.exists(self.path):
+            return rollup
+
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                day = datetime.fromtimestamp(entry["ts"]).strftime("%Y-%m-%d")
+                bucket = rollup.setdefault(day, {
+                    "requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+                    "estimated_requests": 0, "prompt_breakdown": defaultdict(int), "by_model": defaultdict(int),
+                })
+                bucket["requests"] += 1
+                bucket["prompt_tokens"] += entry.get("prompt_tokens", 0)
+                bucket["completion_tokens"] += entry.get("completion_tokens", 0)
+                bucket["cached_tokens"] += entry.get("cached_tokens", 0)
+                if entry.get("source") == "estimate":
+                    bucket["estimated_requests"] += 1
+                for part, tokens in entry.get("prompt_breakdown", {}).items():
+                    bucket["prompt_breakdown"][part] += tokens
+                bucket["by_model"][f"{entry.get('provider')}/{entry.get('model')}"] += (
+                    entry.get("prompt_tokens", 0) + entry.get("completion_tokens", 0)
+                )
+
+        days_sorted = sorted(rollup)
+        if days:
+            days_sorted = days_sorted[-days:]
+        return {
+            day: dict(rollup[day], prompt_breakdown=dict(rollup[day]["prompt_breakdown"]),
+                      by_model=dict(rollup[day]["by_model"]))
+            for day in days_sorted
+        }
+
+
+_ledger: Optional[TokenLedger] = None
+
+
+def get_token_ledger() -> TokenLedger:
+    """获取进程内共享的 token 账本"""
+    global _ledger
+    if _ledger is None:
+        _ledger = TokenLedger()
+    return _ledger
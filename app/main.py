@@ -1,7 +1,11 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
-from app.core.agent import AgentManager
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse, JSONResponse
+from app.core.agent import AgentManager, RequestState
+from app.core.request_coalescer import RequestCoalescer
+from app.core.metrics import REGISTRY, CACHE_HITS, REQUESTS, RequestTrace
+from app.core.profiler import RequestProfiler, is_authorized
+from app.core import memory_diagnostics
 from dotenv import load_dotenv
 import os
 import json
@@ -14,6 +18,15 @@ app = FastAPI(title="AI Agent Knowledge Base API")
 # 读取配置
 enable_direct_retrieval = os.getenv("ENABLE_DIRECT_RETRIEVAL", "false").lower() == "true"
 agent_manager = AgentManager(enable_direct_retrieval=enable_direct_retrieval)
+# 修改 config/ 下的关键词、Few-Shot 示例、文档标签后自动生效，无需重启
+agent_manager.config_watcher.start()
+
+# 相同问题并发到达时合并为一次检索 + 一次 LLM 调用
+enable_request_coalescing = os.getenv("ENABLE_REQUEST_COALESCING", "true").lower() == "true"
+coalescer = RequestCoalescer(enabled=enable_request_coalescing)
+
+# 是否在 SSE metadata 中附带分阶段耗时
+metrics_in_metadata = os.getenv("METRICS_IN_METADATA", "false").lower() == "true"
 
 # 挂载静态文件目录
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
@@ -24,32 +37,75 @@ async def root():
     return FileResponse("app/static/index.html")
 
 @app.get("/chat")
-async def chat(query: str, book: str = None):
+async def chat(request: Request, query: str, book: str = None):
     """
     流式聊天接口
     
     参数:
         query: 用户问题
         book: 可选，限定检索的书名（如 "红楼梦"）
+    
+    请求头:
+        X-Profile: 可选，值为 ADMIN_TOKEN 时对本次请求做 cProfile 分析，结果放在 metadata.profile
     """
-    async def generate():
-        try:
-            # 如果指定了书名，传递给 agent
+    trace = RequestTrace()
+    # 本请求独占的检索信息（不读 AgentManager 上的共享字段，避免并发请求串台）
+    state = RequestState()
+    profiler = None
+    if "x-profile" in request.headers:
+        if is_authorized(request.headers["x-profile"]):
+            profiler = RequestProfiler(query)
+        else:
+            print("⚠️  X-Profile 令牌无效，忽略性能分析请求")
+    
+    def start_stream(cancel_event):
+        def stream():
+            # 在生成器内选择路径：关键词匹配在第一次 next() 时执行，计入性能分析，也不阻塞事件循环
             if book:
-                answer = agent_manager.run_simple_rag_stream(query, keyword_matched=False, book_filter=book)
+                # 如果指定了书名，传递给 agent
+                yield from agent_manager.run_simple_rag_stream(
+                    query, keyword_matched=False, book_filter=book, cancel_event=cancel_event, trace=trace,
+                    state=state
+                )
             else:
-                answer = agent_manager.run_stream(query)
+                yield from agent_manager.run_stream(query, cancel_event=cancel_event, trace=trace, state=state)
+        return profiler.wrap(stream()) if profiler else stream()
+    
+    def finalize():
+        # 生成结束：检索信息和分阶段耗时（trace 已由 coalescer 结束并写入直方图；合并的请求共享同一份结果）
+        return {
+            "retrieval_info": state.retrieval_info(),
+            "timings": trace.as_dict(),
+        }
+
+    async def generate():
+        try:
+            key = coalescer.make_key(query, book, agent_manager.provider, agent_manager.model_name)
+            if profiler:
+                # 被分析的请求单独执行，不与其它请求合并
+                key = ("profile", id(profiler)) + key
+            flight, coalesced = coalescer.join(key, start_stream, finalize, trace=trace)
+            if coalesced:
+                CACHE_HITS.inc(cache="coalesce")
+                print(f"🔗 合并到进行中的相同请求：{query}")
             
             # 流式输出答案
             full_answer = ""
-            for chunk in answer:
-                full_answer += chunk
-                # 发送文本块
-                yield f"data: {json.dumps({'type': 'text', 'content': chunk}, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.01)  # 控制输出速度
+            chunks = coalescer.stream(flight)
+            try:
+                async for chunk in chunks:
+                    # 客户端断开（如关闭标签页）：停止订阅，最后一个订阅者离开时取消上游生成
+                    if await request.is_disconnected():
+                        return
+                    full_answer += chunk
+                    # 发送文本块
+                    yield f"data: {json.dumps({'type': 'text', 'content': chunk}, ensure_ascii=False)}\n\n"
+                    await asyncio.sleep(0.01)  # 控制输出速度
+            finally:
+                await chunks.aclose()
             
-            # 获取检索信息
-            retrieval_info = agent_manager.get_last_retrieval_info()
+            # 获取检索信息（由发起生成的请求在结束时统一获取）
+            retrieval_info = flight.result["retrieval_info"]
             
             # 发送元数据
             metadata = {
@@ -61,14 +117,23 @@ async def chat(query: str, book: str = None):
                 "used_few_shot": retrieval_info["used_few_shot"],
                 "keyword_matched": retrieval_info["keyword_matched"],
                 "retrieved_docs_count": retrieval_info["retrieved_docs_count"],
-                "sources": retrieval_info["sources"]
+                "token_usage": retrieval_info["token_usage"],
+                "prompt_prefix": retrieval_info["prompt_prefix"],
+                "sources": retrieval_info["sources"],
+                "coalesced": coalesced
             }
+            if metrics_in_metadata:
+                metadata["timings"] = flight.result["timings"]
+            if profiler:
+                metadata["profile"] = profiler.summary
             yield f"data: {json.dumps(metadata, ensure_ascii=False)}\n\n"
             
             # 发送结束标记
             yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+            REQUESTS.inc(endpoint="chat", status="ok")
             
         except Exception as e:
+            REQUESTS.inc(endpoint="chat", status="error")
             error_data = {"type": "error", "error": str(e)}
             yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
     
@@ -76,10 +141,22 @@ async def chat(query: str, book: str = None):
 
 @app.get("/ingest")
 async def ingest_docs():
-    """手动触发知识库更新"""
+    """
+    手动触发知识库更新
+    
+    构建到新的版本目录，校验通过后原子切换，重建期间继续使用当前版本提供服务
+    """
     try:
-        agent_manager.rag.load_and_index()
-        return {"status": "success", "message": "Documents indexed successfully"}
+        result = await asyncio.to_thread(agent_manager.rag.rebuild_index)
+        report = result.pop("report", None)
+        if result["status"] != "success":
+            result.setdefault("message", "New index version failed validation, current version kept")
+        else:
+            result["message"] = "Documents indexed successfully"
+        if report is not None:
+            result["report_file"] = report.path
+            result["report"] = report.as_dict()
+        return result
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -96,6 +173,74 @@ async def get_books():
     except Exception as e:
         return {"error": str(e)}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 指标（各阶段耗时直方图、缓存命中、取消生成等）"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/usage")
+async def get_usage(days: int = 30):
+    """按天汇总的 token 用量（prompt / completion / 缓存命中，以及提示词各部分占比）"""
+    return agent_manager.token_ledger.daily_rollup(days)
+
+@app.get("/stats")
+async def get_stats():
+    """获取请求合并、断开取消与 LLM 连接池统计"""
+    return {
+        "请求合并": coalescer.get_statistics(),
+        "LLM 连接池": agent_manager.llm_pool.get_statistics(),
+    }
+
+@app.get("/admin/memory")
+async def memory_report(request: Request, requests: int = 0, tracemalloc_top: int = 0,
+                        tracemalloc: str = None, with_llm: bool = False, agent_graph: bool = False):
+    """
+    内存诊断（需要请求头 X-Admin-Token: <ADMIN_TOKEN>）
+    
+    参数:
+        requests: 执行 N 次合成请求并报告内存增长（默认只做检索和提示词构建）
+        tracemalloc_top: 返回 tracemalloc 分配最多的前 N 个代码位置（需先开启）
+        tracemalloc: start / stop，开启或关闭 tracemalloc
+        with_llm: 合成请求是否调用 LLM
+        agent_graph: 是否统计 Agent 图大小
+    """
+    if not is_authorized(request.headers.get("x-admin-token")):
+        return JSONResponse({"error": "unauthorized"}, status_code=403)
+    
+    import tracemalloc as tm
+    if tracemalloc == "start" and not tm.is_tracing():
+        tm.start(10)
+    elif tracemalloc == "stop" and tm.is_tracing():
+        tm.stop()
+    
+    def build():
+        report = memory_diagnostics.component_report(agent_manager, coalescer, include_agent_graph=agent_graph)
+        if tracemalloc_top:
+            report["top_allocators"] = memory_diagnostics.top_allocators(tracemalloc_top)
+        if requests > 0:
+            report["growth"] = memory_diagnostics.measure_growth(agent_manager, requests, with_llm=with_llm)
+        return report
+    
+    return await asyncio.to_thread(build)
+
+@app.get("/admin/config")
+async def config_versions(request: Request, reload: bool = False):
+    """
+    已加载的配置版本（需要请求头 X-Admin-Token: <ADMIN_TOKEN>）
+    
+    参数:
+        reload: 立即检查一次配置文件（不等待下一次轮询）
+    """
+    if not is_authorized(request.headers.get("x-admin-token")):
+        return JSONResponse({"error": "unauthorized"}, status_code=403)
+    
+    watcher = agent_manager.config_watcher
+    reloaded = await asyncio.to_thread(watcher.check) if reload else []
+    status = watcher.status()
+    status["reloaded"] = reloaded
+    status["index_version"] = agent_manager.rag.index_version
+    return status
+
 @app.get("/config")
 async def get_config():
     """获取当前配置信息（LLM 和 Embedding 模型）"""
@@ -125,7 +270,8 @@ async def get_config():
             "llm_model": llm_display,
             "embedding_model": embedding_display,
             "model_provider": model_provider,
-            "enable_direct_retrieval": enable_direct_retrieval
+            "enable_direct_retrieval": enable_direct_retrieval,
+            "embedding_service": os.getenv("EMBEDDING_SERVICE_URL")
         }
     except Exception as e:
         return {"error": str(e)}
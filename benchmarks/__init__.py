@@ -0,0 +1,4 @@
+"""
+离线基准测试
+不需要网络和 API Key：合成中文语料 + 确定性哈希 Embedding，结果写成 JSON 便于跨提交对比
+"""
@@ -0,0 +1,268 @@
+"""
+/chat 端到端压测
+
+逐级提高并发（如 50 → 100 → 200 → 500 条 SSE 流），统计：
+首 token 时间、token 间隔、完成时间、错误率，以及服务端 CPU / RSS
+
+LLM 使用本地测试桩 scripts/fake_llm_server.py，不消耗付费 API。
+
+用法:
+    # 自动启动测试桩和 uvicorn（需已有 vector_store/）
+    python -m benchmarks.chat_load --launch --levels 50,100,200,500
+
+    # 压测已在运行的服务（传入服务进程 PID 以采集 CPU/RSS）
+    python -m benchmarks.chat_load --url http://127.0.0.1:8888 --server-pid 12345
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.retrieval_bench import git_commit, percentile
+
+QUERIES = ["贾宝玉是谁？", "诸葛亮的故事", "孙悟空的师傅是谁", "武松打虎的故事", "林黛玉和薛宝钗的关系",
+           "三顾茅庐的故事是什么？", "大观园在哪里", "宋江是谁"]
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+class ProcessSampler:
+    """通过 /proc 采集进程树（含 uvicorn worker 子进程）的 CPU 和 RSS"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+
+    def _tree(self):
+        pids, stack = [], [self.pid]
+        while stack:
+            pid = stack.pop()
+            pids.append(pid)
+            try:
+                for task in os.listdir(f"/proc/{pid}/task"):
+                    with open(f"/proc/{pid}/task/{task}/children") as f:
+                        stack.extend(int(child) for child in f.read().split())
+            except OSError:
+                pass
+        return pids
+
+    def sample(self):
+        """返回 (CPU 总 tick 数, RSS 字节数)"""
+        ticks, rss = 0, 0
+        for pid in self._tree():
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                ticks += int(fields[11]) + int(fields[12])  # utime + stime
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            rss += int(line.split()[1]) * 1024
+            except OSError:
+                pass
+        return ticks, rss
+
+
+async def one_stream(client: httpx.AsyncClient, url: str, query: str, timeout: float):
+    """发起一次 /chat，返回该请求的统计"""
+    started = time.perf_counter()
+    result = {"ttft": None, "gaps": [], "completion": None, "tokens": 0, "error": None}
+    last_token_at = None
+    try:
+        async with client.stream("GET", f"{url}/chat", params={"query": query}, timeout=timeout) as response:
+            if response.status_code != 200:
+                result["error"] = f"HTTP {response.status_code}"
+                return result
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[6:])
+                now = time.perf_counter()
+                if event["type"] == "text":
+                    if last_token_at is None:
+                        result["ttft"] = now - started
+                    else:
+                        result["gaps"].append(now - last_token_at)
+                    last_token_at = now
+                    result["tokens"] += 1
+                elif event["type"] == "error":
+                    result["error"] = event.get("error", "error")
+                    return result
+                elif event["type"] == "done":
+                    result["completion"] = now - started
+                    return result
+        result["error"] = "stream ended without done"
+    except Exception as e:
+        result["error"] = type(e).__name__
+    return result
+
+
+def summarize(values):
+    return {
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+    }
+
+
+async def run_level(url, concurrency, requests_per_stream, timeout, unique, sampler):
+    """以固定并发跑一轮：concurrency 个并发流，每个流顺序发起 requests_per_stream 次请求"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    results = []
+    cpu_before = sampler.sample() if sampler else None
+    peak_rss = 0
+    stop_sampling = asyncio.Event()
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while not stop_sampling.is_set():
+            peak_rss = max(peak_rss, sampler.sample()[1])
+            await asyncio.sleep(0.5)
+
+    async def worker(worker_id):
+        for i in range(requests_per_stream):
+            query = QUERIES[(worker_id + i) % len(QUERIES)]
+            if unique:
+                # 加编号避免被请求合并，测最坏情况
+                query = f"{query} #{worker_id}-{i}"
+            results.append(await one_stream(client, url, query, timeout))
+
+    sampler_task = asyncio.create_task(sample_rss()) if sampler else None
+    started = time.perf_counter()
+    async with httpx.AsyncClient(limits=limits) as client:
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop_sampling.set()
+    if sampler_task:
+        await sampler_task
+
+    ok = [r for r in results if r["error"] is None]
+    errors = {}
+    for r in results:
+        if r["error"] is not None:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+
+    level = {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else 0,
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 0,
+        "errors": errors,
+        "ttft": summarize([r["ttft"] for r in ok if r["ttft"] is not None]),
+        "inter_token": summarize([gap for r in ok for gap in r["gaps"]]),
+        "completion": summarize([r["completion"] for r in ok]),
+    }
+    if sampler:
+        cpu_after = sampler.sample()[0]
+        level["server_cpu_percent"] = round((cpu_after - cpu_before[0]) / CLOCK_TICKS / elapsed * 100, 1)
+        level["server_peak_rss_mb"] = round(peak_rss / 1024 / 1024, 1)
+    return level
+
+
+def launch_servers(args):
+    """启动 LLM 测试桩和 uvicorn，返回 (进程列表, uvicorn PID)"""
+    fake = subprocess.Popen([
+        sys.executable, "scripts/fake_llm_server.py", "--port", str(args.fake_port),
+        "--first-token-latency", str(args.first_token_latency),
+        "--tokens-per-sec", str(args.tokens_per_sec), "--max-tokens", str(args.max_tokens),
+        "--jitter", "0.2",
+    ])
+    env = dict(os.environ)
+    fake_base = f"http://127.0.0.1:{args.fake_port}/v1"
+    env.update({
+        "GROQ_API_BASE": fake_base, "DASHSCOPE_API_BASE": fake_base,
+        "GROQ_API_KEY": "fake", "DASHSCOPE_API_KEY": "fake",
+    })
+    server = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+        "--port", str(args.port), "--workers", str(args.workers),
+    ], env=env)
+    return [fake, server], server.pid
+
+
+async def wait_ready(url, timeout=300):
+    """等待服务就绪（首次启动要加载 Embedding 模型）"""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{url}/config", timeout=2)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(1)
+    raise TimeoutError(f"{url} 在 {timeout}s 内未就绪")
+
+
+async def main_async(args):
+    processes, server_pid = [], args.server_pid
+    url = args.url
+    if args.launch:
+        processes, server_pid = launch_servers(args)
+        url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        await wait_ready(url)
+        sampler = ProcessSampler(server_pid) if server_pid and os.path.exists(f"/proc/{server_pid}") else None
+        levels = []
+        for concurrency in (int(c) for c in args.levels.split(",")):
+            print(f"\n🚀 并发 {concurrency} ...")
+            level = await run_level(url, concurrency, args.requests_per_stream, args.timeout, args.unique, sampler)
+            levels.append(level)
+            print(f"  TTFT p50/p95/p99: {level['ttft']['p50_ms']}/{level['ttft']['p95_ms']}/{level['ttft']['p99_ms']} ms")
+            print(f"  token 间隔 p50/p95: {level['inter_token']['p50_ms']}/{level['inter_token']['p95_ms']} ms")
+            print(f"  完成时间 p50/p95: {level['completion']['p50_ms']}/{level['completion']['p95_ms']} ms")
+            print(f"  错误率: {level['error_rate'] * 100:.2f}%  {level['errors'] or ''}")
+            if sampler:
+                print(f"  服务端 CPU: {level['server_cpu_percent']}%  峰值 RSS: {level['server_peak_rss_mb']} MB")
+        return levels
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/chat 端到端压测")
+    parser.add_argument("--url", default="http://127.0.0.1:8888", help="已运行服务的地址（不使用 --launch 时）")
+    parser.add_argument("--server-pid", type=int, help="服务进程 PID，用于采集 CPU/RSS")
+    parser.add_argument("--launch", action="store_true", help="自动启动 LLM 测试桩和 uvicorn")
+    parser.add_argument("--port", type=int, default=8890, help="--launch 时 uvicorn 端口")
+    parser.add_argument("--workers", type=int, default=1, help="--launch 时 uvicorn worker 数")
+    parser.add_argument("--fake-port", type=int, default=9000, help="--launch 时测试桩端口")
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--max-tokens", type=int, default=100)
+    parser.add_argument("--levels", default="50,100,200,500", help="逐级并发数，逗号分隔")
+    parser.add_argument("--requests-per-stream", type=int, default=2, help="每个并发流顺序发起的请求数")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求超时（秒）")
+    parser.add_argument("--unique", action=argparse.BooleanOptionalAction, default=True,
+                        help="每个请求使用不同问题（避免请求合并）")
+    parser.add_argument("--out", help="结果 JSON 路径（默认 bench_results/chat_load_<commit>.json）")
+    args = parser.parse_args()
+
+    levels = asyncio.run(main_async(args))
+    result = {
+        "benchmark": "chat_load",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "params": vars(args),
+        "levels": {str(level["concurrency"]): level for level in levels},
+    }
+    out = args.out or os.path.join("bench_results", f"chat_load_{result['commit']}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 结果已写入 {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+切片参数扫描
+按 chunk_size × chunk_overlap × 分隔符预设 的网格逐个重建临时索引，跑带标注的查询集，
+对比 recall@k、每次查询的平均上下文 token 数、索引大小和构建时间
+
+Embedding 按 (模型名, 维度, 切片文本) 的哈希缓存：不同参数下切出相同文本时不会重复计算，
+--cache-file 可把缓存保存到磁盘，供下次扫描复用；换了模型或维度时不会取到旧向量
+
+用法:
+    python -m benchmarks.chunk_sweep                                   # 合成语料 + 哈希 Embedding，完全离线
+    python -m benchmarks.chunk_sweep --embedding local --cache-file .cache/sweep_embeddings.pkl
+    python -m benchmarks.chunk_sweep --chunk-sizes 300,500,800,1000 --overlaps 0,50,100 --separators default,chinese
+
+    # small-to-big：chunk_size 为子切片大小，上下文为 PARENT_WINDOW_CHARS 字的父窗口
+    python -m benchmarks.chunk_sweep --parent-retrieval --chunk-sizes 100,200,300 --overlaps 0,20
+
+    # 使用真实语料：查询集为 JSONL，每行 {"query": "...", "key": "相关切片中必定出现的文字", "book": "可选"}
+    python -m benchmarks.chunk_sweep --data-dir data --queries benchmarks/my_queries.jsonl --embedding local
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.embeddings import Embeddings
+
+from benchmarks.retrieval_bench import dir_size, git_commit, make_embeddings
+from benchmarks.synthetic_corpus import generate_corpus
+
+
+def embedding_model_name(kind: str) -> str:
+    if kind == "hash":
+        return "hash"
+    return os.getenv("LOCAL_EMBEDDING_MODEL", "BAAI/bge-large-zh-v1.5")
+
+
+class CachedEmbeddings(Embeddings):
+    """按 (模型名, 维度, 文本) 的 SHA-1 缓存 embed_documents 结果（float32 存储）"""
+
+    def __init__(self, embeddings: Embeddings, cache_file: str = None, model: str = ""):
+        self.embeddings = embeddings
+        self.cache_file = cache_file
+        # 键中带上模型名和维度：同一个缓存文件可以安全地被不同模型共用
+        self.namespace = f"{model}/{len(embeddings.embed_query('维度'))}"
+        self.cache: Dict[str, bytes] = {}
+        self.hits = 0
+        self.misses = 0
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, "rb") as f:
+                self.cache = pickle.load(f)
+            print(f"📦 已加载 {len(self.cache)} 条缓存的 Embedding: {cache_file}（{self.namespace}）")
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.namespace}\n{text}".encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self.cache and key not in missing:
+                missing[key] = text
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            for key, vector in zip(missing, vectors):
+                self.cache[key] = array("f", vector).tobytes()
+
+        result = []
+        for key in keys:
+            vector = array("f")
+            vector.frombytes(self.cache[key])
+            result.append(vector.tolist())
+        return result
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def save(self):
+        if self.cache_file:
+            os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+            with open(self.cache_file, "wb") as f:
+                pickle.dump(self.cache, f)
+
+
+def load_queries(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_point(data_dir, workdir, embeddings, queries, chunk_size, overlap, separators, k, parent_retrieval=False):
+    """构建一个参数组合的临时索引并评估"""
+    from app.core.rag import RAGManager
+    from app.core.token_accounting import estimate_tokens
+
+    persist_dir = os.path.join(workdir, f"store_{chunk_size}_{overlap}_{separators}")
+    hits_before, misses_before = embeddings.hits, embeddings.misses
+    try:
+        rag = RAGManager(data_dir=data_dir, persist_dir=persist_dir, embeddings=embeddings,
+                         chunk_size=chunk_size, chunk_overlap=overlap, separators=separators,
+                         parent_retrieval=parent_retrieval)
+        started = time.perf_counter()
+        report = rag.load_and_index(save_report=False)
+        build_seconds = time.perf_counter() - started
+
+        recalls, context_tokens = [], []
+        for item in queries:
+            docs = rag.search(item["query"], k=k)
+            recalls.append(1.0 if any(item["key"] in doc.page_content for doc in docs) else 0.0)
+            context_tokens.append(estimate_tokens("\n\n".join(doc.page_content for doc in docs)))
+
+        return {
+            "chunk_size": chunk_size,
+            "chunk_overlap": overlap,
+            "separators": separators,
+            "parent_retrieval": parent_retrieval,
+            "chunks": report.totals()["chunks"] if report else 0,
+            "recall_at_k": round(sum(recalls) / len(recalls), 4) if recalls else 0,
+            "avg_context_tokens": round(sum(context_tokens) / len(context_tokens), 1) if context_tokens else 0,
+            "index_bytes": dir_size(persist_dir),
+            "build_seconds": round(build_seconds, 3),
+            "embeddings_computed": embeddings.misses - misses_before,
+            "embeddings_reused": embeddings.hits - hits_before,
+        }
+    finally:
+        shutil.rmtree(persist_dir, ignore_errors=True)
+
+
+def run_sweep(args):
+    workdir = tempfile.mkdtemp(prefix="kb_chunk_sweep_")
+    try:
+        if args.data_dir:
+            if not args.queries:
+                raise SystemExit("❌ 使用 --data-dir 时需要 --queries 查询集")
+            data_dir = args.data_dir
+            queries = load_queries(args.queries)
+        else:
+            data_dir = os.path.join(workdir, "data")
+            print(f"📝 生成合成语料: {args.docs} 篇 × {args.paragraphs} 段")
+            queries = generate_corpus(data_dir, num_docs=args.docs, paragraphs_per_doc=args.paragraphs,
+                                      facts_per_doc=args.facts, seed=args.seed)
+
+        embeddings = CachedEmbeddings(make_embeddings(args.embedding, args.dim), args.cache_file,
+                                      model=embedding_model_name(args.embedding))
+        grid = list(itertools.product(
+            [int(size) for size in args.chunk_sizes.split(",")],
+            [int(overlap) for overlap in args.overlaps.split(",")],
+            args.separators.split(","),
+        ))
+
+        points = []
+        for chunk_size, overlap, separators in grid:
+            if overlap >= chunk_size:
+                continue
+            print(f"\n🔧 chunk_size={chunk_size} overlap={overlap} separators={separators}")
+            points.append(run_point(data_dir, workdir, embeddings, queries,
+                                    chunk_size, overlap, separators, args.k, args.parent_retrieval))
+        embeddings.save()
+        return queries, points
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_table(points, k):
+    print(f"\n{'size':>6} {'overlap':>8} {'separators':>10} {'chunks':>7} {'recall@' + str(k):>9} "
+          f"{'ctx tokens':>11} {'index MB':>9} {'build s':>8} {'reused':>7}")
+    for point in sorted(points, key=lambda p: (-p["recall_at_k"], p["avg_context_tokens"])):
+        print(f"{point['chunk_size']:>6} {point['chunk_overlap']:>8} {point['separators']:>10} {point['chunks']:>7} "
+              f"{point['recall_at_k']:>9.3f} {point['avg_context_tokens']:>11.1f} "
+              f"{point['index_bytes'] / 1024 / 1024:>9.2f} {point['build_seconds']:>8.2f} "
+              f"{point['embeddings_reused']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="切片参数扫描")
+    parser.add_argument("--chunk-sizes", default="300,500,800,1000,1500")
+    parser.add_argument("--overlaps", default="0,50,100,200")
+    parser.add_argument("--separators", default="default,chinese", help="分隔符预设，见 app.core.rag.SEPARATOR_PRESETS")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--parent-retrieval", action="store_true",
+                        help="small-to-big：索引子切片，返回父窗口（窗口大小见 PARENT_WINDOW_CHARS）")
+    parser.add_argument("--data-dir", help="真实语料目录（默认生成合成语料）")
+    parser.add_argument("--queries", help="查询集 JSONL：{query, key[, book]}")
+    parser.add_argument("--docs", type=int, default=20, help="合成文档数")
+    parser.add_argument("--paragraphs", type=int, default=40, help="每篇文档段落数")
+    parser.add_argument("--facts", type=int, default=5, help="每篇文档埋入的事实数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embedding", choices=["hash", "local"], default="hash")
+    parser.add_argument("--dim", type=int, default=512, help="哈希 Embedding 维度")
+    parser.add_argument("--cache-file", help="Embedding 缓存文件（跨次扫描复用）")
+    parser.add_argument("--out", help="结果 JSON 路径（默认 bench_results/chunk_sweep_<commit>_<embedding>.json）")
+    args = parser.parse_args()
+
+    queries, points = run_sweep(args)
+    print_table(points, args.k)
+
+    result = {
+        "benchmark": "chunk_sweep",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "params": vars(args),
+        "queries": len(queries),
+        "points": points,
+    }
+    out = args.out or os.path.join("bench_results", f"chunk_sweep_{result['commit']}_{args.embedding}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 结果已写入 {out}")
+
+
+if __name__ == "__main__":
+    main()
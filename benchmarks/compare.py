@@ -0,0 +1,55 @@
+"""
+对比两次基准测试结果（JSON），标出变化超过阈值的指标
+
+用法:
+    python -m benchmarks.compare bench_results/old.json bench_results/new.json --threshold 10
+"""
+import argparse
+import json
+
+# 数值越大越好的指标（其余视为越小越好）
+HIGHER_IS_BETTER = ("qps", "recall", "per_sec", "hit_rate")
+
+
+def flatten(data, prefix=""):
+    items = {}
+    for key, value in data.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            items.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            items[path] = value
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比两次基准测试结果")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="标记为回归的变化百分比")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    print(f"基线: {baseline.get('commit')}  当前: {current.get('commit')}")
+    old, new = flatten(baseline), flatten(current)
+    regressions = 0
+    for key in sorted(set(old) & set(new)):
+        if key.startswith("params.") or old[key] == 0:
+            continue
+        change = (new[key] - old[key]) / abs(old[key]) * 100
+        better = change > 0 if any(word in key for word in HIGHER_IS_BETTER) else change < 0
+        mark = ""
+        if abs(change) >= args.threshold:
+            mark = "✅" if better else "❌"
+            regressions += 0 if better else 1
+        print(f"  {mark:2} {key:<45} {old[key]:>12} → {new[key]:>12}  ({change:+.1f}%)")
+
+    print(f"\n{'❌ 发现 ' + str(regressions) + ' 项回归' if regressions else '✅ 无回归'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+EPUB 加载器对比
+同一批 EPUB 分别用 EpubChapterLoader（native）和 UnstructuredEPubLoader（unstructured）加载，
+每次加载在独立子进程中进行，记录导入耗时、加载耗时、峰值 RSS、Document 数、字数和切片数
+
+不指定文件时生成合成的章回体 EPUB（不依赖真实书籍）
+
+用法:
+    python -m benchmarks.epub_loader_bench                                   # 合成 EPUB
+    python -m benchmarks.epub_loader_bench --files data/红楼梦.epub data/西游记.epub --repeat 3
+    python -m benchmarks.epub_loader_bench --loaders native                  # 未安装 unstructured 时
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.retrieval_bench import git_commit
+from benchmarks.synthetic_corpus import FILLER
+
+CHINESE_NUMBERS = "一二三四五六七八九"
+
+
+def _chinese_number(n: int) -> str:
+    """1~999 → 中文数字（生成章回标题用）"""
+    hundreds, rest = divmod(n, 100)
+    tens, ones = divmod(rest, 10)
+    text = f"{CHINESE_NUMBERS[hundreds - 1]}百" if hundreds else ""
+    if tens:
+        text += ("" if tens == 1 and not hundreds else CHINESE_NUMBERS[tens - 1]) + "十"
+    elif hundreds and ones:
+        text += "零"
+    return text + (CHINESE_NUMBERS[ones - 1] if ones else "")
+
+
+def write_synthetic_epub(path: str, chapters: int = 120, paragraphs: int = 60):
+    """写一个最小的 EPUB（mimetype + container.xml + OPF + 每回一个 XHTML）"""
+    items, spine = [], []
+    with zipfile.ZipFile(path, "w") as book:
+        book.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        book.writestr("META-INF/container.xml", (
+            '<?xml version="1.0"?><container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+            '</rootfiles></container>'))
+        for n in range(1, chapters + 1):
+            body = "".join(f"<p>{FILLER[i % 40:]}{FILLER[:i % 40]}</p>" for i in range(n, n + paragraphs))
+            book.writestr(f"OEBPS/ch{n:03d}.xhtml", (
+                f'<?xml version="1.0" encoding="utf-8"?><html xmlns="http://www.w3.org/1999/xhtml">'
+                f'<head><title>synthetic</title><style>p{{text-indent:2em}}</style></head>'
+                f'<body><h2>第{_chinese_number(n)}回 合成章节{n}</h2>{body}</body></html>'))
+            items.append(f'<item id="ch{n}" href="ch{n:03d}.xhtml" media-type="application/xhtml+xml"/>')
+            spine.append(f'<itemref idref="ch{n}"/>')
+        book.writestr("OEBPS/content.opf", (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:identifier id="id">synthetic</dc:identifier>'
+            '<dc:title>合成章回</dc:title><dc:language>zh</dc:language></metadata>'
+            f'<manifest>{"".join(items)}</manifest><spine>{"".join(spine)}</spine></package>'))
+
+
+def run_worker(loader: str, path: str):
+    """子进程：加载一个文件并打印 JSON 结果"""
+    started = time.perf_counter()
+    if loader == "native":
+        from app.core.epub_loader import EpubChapterLoader as Loader
+    else:
+        from langchain_community.document_loaders import UnstructuredEPubLoader as Loader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    import_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    documents = Loader(path).load()
+    load_seconds = time.perf_counter() - started
+    chunks = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100).split_documents(documents)
+    print(json.dumps({
+        "import_seconds": round(import_seconds, 3),
+        "load_seconds": round(load_seconds, 3),
+        # Linux 下 ru_maxrss 单位为 KB
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "documents": len(documents),
+        "chars": sum(len(doc.page_content) for doc in documents),
+        "chunks": len(chunks),
+        "chapters_numbered": sum(1 for doc in documents if "chapter" in doc.metadata),
+    }))
+
+
+def measure(loader: str, path: str, repeat: int):
+    """重复 repeat 次取加载耗时最短的一次"""
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-m", "benchmarks.epub_loader_bench", "--worker", loader, path],
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        if result.returncode != 0:
+            return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"}
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return min(runs, key=lambda run: run["load_seconds"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EPUB 加载器对比")
+    parser.add_argument("--files", nargs="*", help="EPUB 文件（默认生成合成 EPUB）")
+    parser.add_argument("--loaders", default="native,unstructured")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--chapters", type=int, default=120, help="合成 EPUB 的回数")
+    parser.add_argument("--worker", nargs=2, metavar=("LOADER", "FILE"), help=argparse.SUPPRESS)
+    parser.add_argument("--out", help="结果 JSON 路径（默认 bench_results/epub_loader_<commit>.json）")
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(*args.worker)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="kb_epub_bench_")
+    try:
+        files = args.files
+        if not files:
+            files = [os.path.join(workdir, "synthetic.epub")]
+            write_synthetic_epub(files[0], chapters=args.chapters)
+            print(f"📝 生成合成 EPUB：{args.chapters} 回")
+
+        points = []
+        for path in files:
+            for loader in args.loaders.split(","):
+                print(f"⏱️  {loader}: {os.path.basename(path)}")
+                points.append({"file": os.path.basename(path), "bytes": os.path.getsize(path), "loader": loader,
+                               **measure(loader, path, args.repeat)})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{'file':>20} {'loader':>13} {'import s':>9} {'load s':>8} {'RSS MB':>8} {'docs':>6} "
+          f"{'chars':>9} {'chunks':>7} {'numbered':>9}")
+    for point in points:
+        if "error" in point:
+            print(f"{point['file'][-20:]:>20} {point['loader']:>13}  ❌ {point['error']}")
+            continue
+        print(f"{point['file'][-20:]:>20} {point['loader']:>13} {point['import_seconds']:>9.2f} "
+              f"{point['load_seconds']:>8.2f} {point['max_rss_mb']:>8.1f} {point['documents']:>6} "
+              f"{point['chars']:>9} {point['chunks']:>7} {point['chapters_numbered']:>9}")
+
+    result = {
+        "benchmark": "epub_loader",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "params": vars(args),
+        "points": points,
+    }
+    out = args.out or os.path.join("bench_results", f"epub_loader_{result['commit']}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 结果已写入 {out}")
+
+
+if __name__ == "__main__":
+    main()
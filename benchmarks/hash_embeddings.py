@@ -0,0 +1,43 @@
+"""
+确定性哈希 Embedding
+把字符 unigram / bigram 哈希到固定维度（带符号哈希），L2 归一化。
+不依赖模型和网络，同一文本在任何机器上得到相同向量，用于可复现的基准测试
+"""
+import hashlib
+import math
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+
+class HashEmbeddings(Embeddings):
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self._feature_cache = {}
+
+    def _feature(self, gram: str):
+        cached = self._feature_cache.get(gram)
+        if cached is None:
+            digest = hashlib.md5(gram.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            cached = self._feature_cache[gram] = (index, sign)
+        return cached
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        chars = [c for c in text if not c.isspace()]
+        for i, char in enumerate(chars):
+            index, sign = self._feature(char)
+            vector[index] += sign * 0.5
+            if i + 1 < len(chars):
+                index, sign = self._feature(char + chars[i + 1])
+                vector[index] += sign
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
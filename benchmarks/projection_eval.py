@@ -0,0 +1,136 @@
+"""
+降维投影评估
+在同一份语料上拟合 PCA，对每个目标维度报告：保留方差、检索延迟、向量内存、
+相对全维精确检索的 recall@k，以及按标注计算的 recall@k
+
+用法:
+    python -m benchmarks.projection_eval                                  # 合成语料 + 哈希 Embedding（512 维）
+    python -m benchmarks.projection_eval --dims 128,256,384
+    python -m benchmarks.projection_eval --embedding local --dims 256,384,512   # 真实 bge 模型（1024 维）
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.quantization_eval import evaluate
+from benchmarks.retrieval_bench import dir_size, git_commit, make_embeddings
+from benchmarks.synthetic_corpus import generate_corpus
+
+
+def run_eval(args):
+    from app.core.quantized_store import iter_collection
+    from app.core.rag import RAGManager
+
+    workdir = tempfile.mkdtemp(prefix="kb_projection_eval_")
+    try:
+        data_dir = os.path.join(workdir, "data")
+        persist_dir = os.path.join(workdir, "vector_store")
+        print(f"📝 生成合成语料: {args.docs} 篇 × {args.paragraphs} 段")
+        queries = generate_corpus(data_dir, num_docs=args.docs, paragraphs_per_doc=args.paragraphs,
+                                  facts_per_doc=args.facts, seed=args.seed)
+        rag = RAGManager(data_dir=data_dir, persist_dir=persist_dir,
+                         embeddings=make_embeddings(args.embedding, args.dim))
+        rag.load_and_index(save_report=False)
+        collection = rag.vector_store._collection
+        base_disk = dir_size(persist_dir)
+
+        ids, full = [], []
+        for batch in iter_collection(collection):
+            ids.extend(batch["ids"])
+            full.append(np.asarray(batch["embeddings"], dtype=np.float32))
+        full = np.concatenate(full)
+        query_vectors = [np.asarray(rag.embeddings.embed_query(item["query"]), dtype=np.float32)
+                         for item in queries]
+
+        # 全维精确检索作为基准
+        exact_ids = []
+        for vector in query_vectors:
+            distances = ((full - vector) ** 2).sum(axis=1)
+            exact_ids.append({ids[i] for i in np.argsort(distances)[:args.k]})
+
+        def texts_of(result_ids):
+            if not result_ids:
+                return []
+            return collection.get(ids=list(result_ids), include=["documents"])["documents"]
+
+        def chroma_search(store):
+            return lambda v: store._collection.query(query_embeddings=[v.tolist()], n_results=args.k)["ids"][0]
+
+        print(f"\n📊 检索对比（k={args.k}，{len(queries)} 条查询，{len(ids)} 个向量，原始 {full.shape[1]} 维）")
+        results = {
+            str(full.shape[1]): evaluate(
+                f"{full.shape[1]} 维", chroma_search(rag.vector_store), query_vectors, queries,
+                exact_ids, texts_of, args.k, memory_bytes=full.nbytes,
+            ),
+        }
+        results[str(full.shape[1])]["explained_variance"] = 1.0
+
+        for dim in args.dims:
+            if dim >= full.shape[1]:
+                print(f"  ⏭️  跳过 {dim} 维（不小于原始维度）")
+                continue
+            disk_before = dir_size(persist_dir)
+            started = time.perf_counter()
+            projection = rag.build_projection(dim)
+            build_seconds = time.perf_counter() - started
+            projected = [projection.transform(vector) for vector in query_vectors]
+            result = evaluate(
+                f"{dim} 维", chroma_search(rag.projected_store), projected, queries,
+                exact_ids, texts_of, args.k, memory_bytes=len(ids) * dim * 4,
+            )
+            result["explained_variance"] = round(projection.explained_variance, 4)
+            result["build_seconds"] = round(build_seconds, 2)
+            result["index_growth_mb"] = round((dir_size(persist_dir) - disk_before) / 1024 / 1024, 2)
+            results[str(dim)] = result
+
+        print("\n📐 保留方差:")
+        for dim, result in results.items():
+            print(f"  {dim} 维: {result['explained_variance']:.1%}，recall@{args.k}(vs 全维) {result['recall_vs_exact']}")
+
+        return {
+            "benchmark": "projection",
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "params": vars(args),
+            "vectors": len(ids),
+            "source_dim": int(full.shape[1]),
+            "base_index_mb": round(base_disk / 1024 / 1024, 2),
+            "results": results,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="降维投影评估")
+    parser.add_argument("--docs", type=int, default=40, help="合成文档数")
+    parser.add_argument("--paragraphs", type=int, default=40, help="每篇文档段落数")
+    parser.add_argument("--facts", type=int, default=5, help="每篇文档埋入的事实数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embedding", choices=["hash", "local"], default="hash")
+    parser.add_argument("--dim", type=int, default=512, help="哈希 Embedding 维度")
+    parser.add_argument("--dims", type=lambda s: [int(x) for x in s.split(",")], default=[128, 256, 384],
+                        help="逗号分隔的目标维度")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--out", help="结果 JSON 路径（默认 bench_results/projection_<commit>_<embedding>.json）")
+    args = parser.parse_args()
+
+    result = run_eval(args)
+    out = args.out or os.path.join("bench_results", f"projection_{result['commit']}_{args.embedding}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 结果已写入 {out}")
+
+
+if __name__ == "__main__":
+    main()
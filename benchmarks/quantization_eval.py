@@ -0,0 +1,153 @@
+"""
+量化索引评估
+在同一份语料上对比 Chroma（float32 + HNSW）、int8、pq 三种检索方式：
+内存占用 / 压缩比、查询延迟、相对精确检索的 recall@k，以及按标注计算的 recall@k
+
+recall 损失超过 --max-recall-loss 时标记为不通过
+
+用法:
+    python -m benchmarks.quantization_eval                              # 合成语料 + 哈希 Embedding
+    python -m benchmarks.quantization_eval --embedding local --docs 200 # 真实 bge 模型（1024 维）
+    python -m benchmarks.quantization_eval --pq-m 128                   # PQ 段数（默认 维度/4）
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.retrieval_bench import dir_size, git_commit, make_embeddings, percentile
+from benchmarks.synthetic_corpus import generate_corpus
+
+
+def evaluate(name, search_ids, query_vectors, queries, exact_ids, texts_of, k, memory_bytes):
+    """跑完整查询集：延迟、相对精确检索的 recall、按标注的 recall"""
+    latencies, overlap, labeled = [], [], []
+    for vector, item, truth in zip(query_vectors, queries, exact_ids):
+        started = time.perf_counter()
+        ids = search_ids(vector)
+        latencies.append(time.perf_counter() - started)
+        overlap.append(len(set(ids) & truth) / len(truth) if truth else 1.0)
+        labeled.append(1.0 if any(item["key"] in text for text in texts_of(ids)) else 0.0)
+    summary = {
+        "memory_mb": round(memory_bytes / 1024 / 1024, 3),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "recall_vs_exact": round(sum(overlap) / len(overlap), 4),
+        "recall_at_k": round(sum(labeled) / len(labeled), 4),
+    }
+    print(f"  {name:<10} 内存 {summary['memory_mb']:>9.3f} MB  p50 {summary['p50_ms']:>7.2f}ms  "
+          f"p95 {summary['p95_ms']:>7.2f}ms  recall@{k}(vs 精确) {summary['recall_vs_exact']:.4f}  "
+          f"recall@{k}(标注) {summary['recall_at_k']:.4f}")
+    return summary
+
+
+def run_eval(args):
+    from app.core.quantized_store import QuantizedIndex
+    from app.core.rag import RAGManager
+
+    workdir = tempfile.mkdtemp(prefix="kb_quant_eval_")
+    try:
+        data_dir = os.path.join(workdir, "data")
+        persist_dir = os.path.join(workdir, "vector_store")
+        print(f"📝 生成合成语料: {args.docs} 篇 × {args.paragraphs} 段")
+        queries = generate_corpus(data_dir, num_docs=args.docs, paragraphs_per_doc=args.paragraphs,
+                                  facts_per_doc=args.facts, seed=args.seed)
+        rag = RAGManager(data_dir=data_dir, persist_dir=persist_dir,
+                         embeddings=make_embeddings(args.embedding, args.dim))
+        rag.load_and_index(save_report=False)
+        collection = rag.vector_store._collection
+        query_vectors = [np.asarray(rag.embeddings.embed_query(item["query"]), dtype=np.float32)
+                         for item in queries]
+
+        indexes = {}
+        for mode in ("int8", "pq"):
+            started = time.perf_counter()
+            indexes[mode] = QuantizedIndex.build(collection, os.path.join(workdir, mode), mode,
+                                                 pq_m=args.pq_m if mode == "pq" else 0)
+            print(f"🗜️  {mode} 索引构建 {time.perf_counter() - started:.2f}s")
+
+        # 精确检索（全精度暴力搜索）作为基准
+        full = np.asarray(indexes["int8"].vectors)
+        ids = indexes["int8"].ids
+        exact_ids = []
+        for vector in query_vectors:
+            distances = ((full - vector) ** 2).sum(axis=1)
+            exact_ids.append({ids[i] for i in np.argsort(distances)[:args.k]})
+
+        def texts_of(result_ids):
+            if not result_ids:
+                return []
+            return collection.get(ids=list(result_ids), include=["documents"])["documents"]
+
+        print(f"\n📊 检索对比（k={args.k}，{len(queries)} 条查询，{len(ids)} 个向量，{full.shape[1]} 维）")
+        # HNSW 段文件（data_level0.bin 等）包含全精度向量和图结构，加载后常驻内存
+        hnsw_bytes = sum(dir_size(os.path.join(persist_dir, name)) for name in os.listdir(persist_dir)
+                         if os.path.isdir(os.path.join(persist_dir, name)))
+        results = {
+            "chroma": evaluate(
+                "chroma",
+                lambda v: collection.query(query_embeddings=[v.tolist()], n_results=args.k)["ids"][0],
+                query_vectors, queries, exact_ids, texts_of, args.k, memory_bytes=hnsw_bytes or full.nbytes,
+            ),
+        }
+        for mode, index in indexes.items():
+            results[mode] = evaluate(
+                mode, lambda v, index=index: [doc_id for doc_id, _ in index.search(v, k=args.k)],
+                query_vectors, queries, exact_ids, texts_of, args.k, memory_bytes=index.memory_bytes(),
+            )
+            results[mode]["compression_vs_float32"] = index.statistics()["compression"]
+            loss = results["chroma"]["recall_vs_exact"] - results[mode]["recall_vs_exact"]
+            results[mode]["recall_loss"] = round(loss, 4)
+            results[mode]["passed"] = loss <= args.max_recall_loss
+
+        print(f"\n🎯 recall 损失阈值 {args.max_recall_loss}:")
+        for mode in indexes:
+            result = results[mode]
+            print(f"  {mode}: 压缩 {result['compression_vs_float32']}x，recall 损失 {result['recall_loss']} "
+                  f"{'✅ 通过' if result['passed'] else '❌ 超出阈值'}")
+
+        return {
+            "benchmark": "quantization",
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "params": vars(args),
+            "vectors": len(ids),
+            "dim": int(full.shape[1]),
+            "results": results,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量化索引评估")
+    parser.add_argument("--docs", type=int, default=40, help="合成文档数")
+    parser.add_argument("--paragraphs", type=int, default=40, help="每篇文档段落数")
+    parser.add_argument("--facts", type=int, default=5, help="每篇文档埋入的事实数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embedding", choices=["hash", "local"], default="hash")
+    parser.add_argument("--dim", type=int, default=512, help="哈希 Embedding 维度")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--pq-m", type=int, default=0, help="PQ 段数（默认 维度/4，即 16 倍压缩）")
+    parser.add_argument("--max-recall-loss", type=float, default=0.02, help="允许的 recall@k 损失")
+    parser.add_argument("--out", help="结果 JSON 路径（默认 bench_results/quantization_<commit>_<embedding>.json）")
+    args = parser.parse_args()
+
+    result = run_eval(args)
+    out = args.out or os.path.join("bench_results", f"quantization_{result['commit']}_{args.embedding}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 结果已写入 {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+RAGManager 检索基准测试
+
+指标：导入速度（chunks/s）、索引大小、查询延迟 p50/p95/p99、QPS、recall@k
+覆盖检索路径：search / search_by_book / get_retriever
+
+用法:
+    python -m benchmarks.retrieval_bench                      # 哈希 Embedding，完全离线
+    python -m benchmarks.retrieval_bench --embedding local    # 真实本地模型
+    python -m benchmarks.retrieval_bench --docs 200 --out bench_results/run.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_corpus import generate_corpus
+
+
+def percentile(values, pct):
+    """最近秩法百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(math.ceil(pct / 100.0 * len(ordered)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            total += os.path.getsize(os.path.join(dirpath, filename))
+    return total
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def make_embeddings(kind, dim):
+    if kind == "hash":
+        from benchmarks.hash_embeddings import HashEmbeddings
+        return HashEmbeddings(dim=dim)
+    from app.core.rag import load_local_embeddings
+    return load_local_embeddings()
+
+
+def latency_summary(latencies, recalls):
+    total = sum(latencies)
+    return {
+        "queries": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(total / len(latencies) * 1000, 3) if latencies else 0,
+        "qps": round(len(latencies) / total, 2) if total else 0,
+        "recall_at_k": round(sum(recalls) / len(recalls), 4) if recalls else 0,
+    }
+
+
+def run_path(name, search_fn, queries, k, warmup):
+    """对一条检索路径跑完整查询集"""
+    for item in queries[:warmup]:
+        search_fn(item)
+
+    latencies, recalls = [], []
+    for item in queries:
+        started = time.perf_counter()
+        docs = search_fn(item)
+        latencies.append(time.perf_counter() - started)
+        recalls.append(1.0 if any(item["key"] in doc.page_content for doc in docs[:k]) else 0.0)
+
+    summary = latency_summary(latencies, recalls)
+    print(f"  {name:<16} p50 {summary['p50_ms']:>8.2f}ms  p95 {summary['p95_ms']:>8.2f}ms  "
+          f"p99 {summary['p99_ms']:>8.2f}ms  QPS {summary['qps']:>8.1f}  recall@{k} {summary['recall_at_k']:.3f}")
+    return summary
+
+
+def run_benchmark(args):
+    from app.core.rag import RAGManager
+
+    workdir = tempfile.mkdtemp(prefix="kb_bench_")
+    data_dir = os.path.join(workdir, "data")
+    persist_dir = os.path.join(workdir, "vector_store")
+
+    try:
+        print(f"📝 生成合成语料: {args.docs} 篇 × {args.paragraphs} 段")
+        queries = generate_corpus(data_dir, num_docs=args.docs, paragraphs_per_doc=args.paragraphs,
+                                  facts_per_doc=args.facts, seed=args.seed)
+        corpus_bytes = dir_size(data_dir)
+
+        rag = RAGManager(data_dir=data_dir, persist_dir=persist_dir,
+                         embeddings=make_embeddings(args.embedding, args.dim))
+
+        started = time.perf_counter()
+        rag.load_and_index(save_report=False)
+        ingest_seconds = time.perf_counter() - started
+        chunk_count = rag.vector_store._collection.count()
+
+        print(f"\n📊 检索基准（k={args.k}，{len(queries)} 条查询）")
+        paths = {
+            "search": lambda item: rag.search(item["query"], k=args.k),
+            "search_by_book": lambda item: rag.search_by_book(item["query"], item["book"], k=args.k),
+            "get_retriever": lambda item: rag.get_retriever(k=args.k).invoke(item["query"]),
+        }
+        retrieval = {name: run_path(name, fn, queries, args.k, args.warmup) for name, fn in paths.items()}
+
+        return {
+            "benchmark": "retrieval",
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "platform": {"python": platform.python_version(), "machine": platform.machine()},
+            "params": vars(args),
+            "ingest": {
+                "documents": args.docs,
+                "corpus_bytes": corpus_bytes,
+                "chunks": chunk_count,
+                "seconds": round(ingest_seconds, 3),
+                "chunks_per_sec": round(chunk_count / ingest_seconds, 2) if ingest_seconds else 0,
+                "index_bytes": dir_size(persist_dir),
+            },
+            "retrieval": retrieval,
+        }
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f"📁 临时目录保留在: {workdir}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="RAGManager 离线检索基准测试")
+    parser.add_argument("--docs", type=int, default=20, help="合成文档数")
+    parser.add_argument("--paragraphs", type=int, default=40, help="每篇文档段落数")
+    parser.add_argument("--facts", type=int, default=5, help="每篇文档埋入的事实数（= 查询数）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embedding", choices=["hash", "local"], default="hash",
+                        help="hash: 确定性哈希 Embedding（离线）；local: 本地 bge 模型")
+    parser.add_argument("--dim", type=int, default=512, help="哈希 Embedding 维度")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=5, help="预热查询数")
+    parser.add_argument("--out", help="结果 JSON 路径（默认 bench_results/retrieval_<commit>_<embedding>.json）")
+    parser.add_argument("--keep", action="store_true", help="保留临时语料和索引目录")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    result = run_benchmark(args)
+
+    out = args.out or os.path.join("bench_results", f"retrieval_{result['commit']}_{args.embedding}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    ingest = result["ingest"]
+    print(f"\n📥 导入：{ingest['chunks']} chunks，{ingest['chunks_per_sec']} chunks/s，索引 {ingest['index_bytes'] / 1024 / 1024:.2f} MB")
+    print(f"💾 结果已写入 {out}")
+
+
+if __name__ == "__main__":
+    main()
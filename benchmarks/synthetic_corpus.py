@@ -0,0 +1,69 @@
+"""
+合成中文语料
+按固定随机种子生成章回体风格的文本，每份文档埋入若干条唯一“事实”，
+事实对应的问题作为带标注的查询集（用于计算 recall@k）
+"""
+import os
+import random
+from typing import Dict, List
+
+SURNAMES = "赵钱孙李周吴郑王冯陈褚卫蒋沈韩杨朱秦尤许何吕施张孔曹严华金魏陶姜谢邹喻柏水窦章云苏潘葛范彭郎鲁韦昌马苗凤花方俞任袁柳"
+GIVEN_CHARS = "宝玉黛钗凤云霞明德文武忠义仁智信安康宁泰春秋冬夏兰竹梅菊松柏山水江河湖海天星月日风雷雨雪"
+PLACES = ["大观园", "荣国府", "花果山", "景阳冈", "赤壁", "五丈原", "潇湘馆", "水帘洞", "梁山泊", "长坂坡",
+          "东京城", "长安城", "金陵", "姑苏", "洛阳", "成都", "建业", "许都", "流沙河", "火焰山"]
+OBJECTS = ["宝剑", "玉佩", "兵书", "金锁", "诗稿", "锦囊", "令牌", "药方", "画卷", "铜镜",
+           "琵琶", "折扇", "酒壶", "绣帕", "印信", "古琴", "盔甲", "灵丹", "经卷", "手札"]
+FILLER = ("话说那日天色微明，众人起身梳洗已毕，各自散去。一路上山高水远，风景甚是可观。"
+          "却说府中上下忙乱了一日，至晚方歇。有诗为证，单道这一段光景。"
+          "看官听说，此事原委甚长，且听下回分解。")
+# 文件名带书名，DocumentTagger 会据此打上 book 标签（search_by_book 基准需要）
+BOOKS = ["红楼梦", "三国演义", "西游记", "水浒传"]
+
+
+def _name(rng: random.Random, used: set) -> str:
+    while True:
+        name = rng.choice(SURNAMES) + rng.choice(GIVEN_CHARS) + rng.choice(GIVEN_CHARS)
+        if name not in used:
+            used.add(name)
+            return name
+
+
+def generate_corpus(out_dir: str, num_docs: int = 20, paragraphs_per_doc: int = 40,
+                    facts_per_doc: int = 5, seed: int = 42) -> List[Dict]:
+    """
+    生成合成语料到 out_dir，返回查询集
+
+    返回:
+        [{"query": 问题, "fact": 事实原文, "key": 人名（用于判断检索结果是否相关）, "book": 书名, "file": 文件名}, ...]
+    """
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    used_names = set()
+    queries = []
+
+    for doc_index in range(num_docs):
+        book = BOOKS[doc_index % len(BOOKS)]
+        filename = f"{book}_synthetic_{doc_index:04d}.txt"
+
+        paragraphs = []
+        for _ in range(paragraphs_per_doc):
+            start = rng.randrange(len(FILLER) - 40)
+            paragraphs.append(FILLER[start:] + FILLER[:start])
+
+        for _ in range(facts_per_doc):
+            person, place, obj = _name(rng, used_names), rng.choice(PLACES), rng.choice(OBJECTS)
+            fact = f"{person}在{place}得到了一件{obj}。"
+            position = rng.randrange(len(paragraphs))
+            paragraphs[position] = paragraphs[position] + fact
+            queries.append({
+                "query": f"{person}在{place}得到了什么？",
+                "fact": fact,
+                "key": person,
+                "book": book,
+                "file": filename,
+            })
+
+        with open(os.path.join(out_dir, filename), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(paragraphs))
+
+    return queries
@@ -62,8 +62,19 @@ if [ -d "vector_store" ]; then
     echo "如果向量数据库是用其他 Embedding 建立的，会导致检索完全错误。"
     echo ""
     echo "解决方法："
-    echo "  1. 删除旧数据库: rm -rf vector_store"
-    echo "  2. 重新导入: python scripts/ingest.py"
+    echo "  重新导入: python scripts/ingest.py（构建新版本并原子切换）"
+    echo "  旧布局遗留的 Chroma 文件不会自动删除，确认新版本可用后手动清理:"
+    echo "    python scripts/rebuild_db.py --remove-legacy"
+fi
+
+# 6. 内存诊断（可选，需要加载 Embedding 模型，耗时较长）
+if [ "$1" == "--memory" ]; then
+    echo ""
+    echo "🧠 内存诊断："
+    echo "----------------------------------------"
+    PYTHON=python
+    [ -f "venv/bin/python" ] && PYTHON=venv/bin/python
+    $PYTHON scripts/diagnose_memory.py --requests "${2:-50}"
 fi
 
 echo ""
@@ -72,3 +83,4 @@ echo ""
 echo "💡 提示："
 echo "  - 查看详细说明: cat docs/ACCURACY_ISSUES.md"
 echo "  - 重新导入文档: ./fix_accuracy.sh"
+echo "  - 内存诊断: ./diagnose.sh --memory [合成请求数]"
@@ -1,6 +1,6 @@
 #!/bin/bash
 # 重建向量数据库脚本
-# 用于删除旧数据库并重新导入文档
+# 重新导入文档到新的版本目录，校验通过后原子切换（重建期间旧版本继续可用）
 
 echo "🔄 重建向量数据库"
 echo "========================================"
@@ -60,7 +60,7 @@ echo ""
 
 # 询问是否继续
 echo "⚠️  警告："
-echo "  此操作将删除现有的向量数据库并重新导入所有文档"
+echo "  此操作将重新导入所有文档（构建新版本，校验通过后切换，失败时保留当前版本）"
 echo ""
 read -p "是否继续？(y/n): " confirm
 
@@ -70,16 +70,15 @@ if [ "$confirm" != "y" ] && [ "$confirm" != "Y" ]; then
 fi
 
 echo ""
-echo "🗑️  删除旧的向量数据库..."
+echo "📦 当前向量数据库..."
 echo "----------------------------------------"
 
-if [ -d "vector_store" ]; then
-    SIZE=$(du -sh vector_store | cut -f1)
-    echo "  旧数据库大小: $SIZE"
-    rm -rf vector_store
-    echo "  ✅ 已删除"
+if [ -f "vector_store/CURRENT" ]; then
+    echo "  当前版本: $(cat vector_store/CURRENT)"
+elif [ -d "vector_store" ]; then
+    echo "  当前版本: 旧布局（未版本化），切换后保留（python scripts/rebuild_db.py --remove-legacy 删除）"
 else
-    echo "  ℹ️  向量数据库不存在，跳过删除"
+    echo "  ℹ️  向量数据库不存在，将创建第一个版本"
 fi
 
 echo ""
@@ -116,10 +115,12 @@ if [ $RESULT -eq 0 ]; then
     echo ""
     
     # 显示结果统计
-    if [ -d "vector_store" ]; then
-        SIZE=$(du -sh vector_store | cut -f1)
-        FILE_COUNT=$(find vector_store -type f | wc -l)
+    if [ -f "vector_store/CURRENT" ]; then
+        VERSION=$(cat vector_store/CURRENT)
+        SIZE=$(du -sh "vector_store/versions/$VERSION" | cut -f1)
+        FILE_COUNT=$(find "vector_store/versions/$VERSION" -type f | wc -l)
         echo "📊 向量数据库统计："
+        echo "  版本: $VERSION"
         echo "  大小: $SIZE"
         echo "  文件数: $FILE_COUNT"
         echo ""
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+为已有向量库构建实体倒排索引（无需重新导入文档）
+扫描每个切片中出现的 config/keywords.json 实体，回写 entities 元数据并保存 实体 → 切片 id 索引
+
+用法:
+    python scripts/build_entity_index.py                  # 重新扫描切片文本
+    python scripts/build_entity_index.py --from-metadata  # 切片已有 entities 元数据，只重建索引
+    python scripts/build_entity_index.py --query 林黛玉    # 查看某个实体的切片数
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建实体倒排索引")
+    parser.add_argument("--persist-dir", default="vector_store")
+    parser.add_argument("--from-metadata", action="store_true", help="使用已有的 entities 元数据，不重新扫描")
+    parser.add_argument("--query", help="打印问题中识别出的实体及对应切片数")
+    args = parser.parse_args()
+
+    from app.core.entity_index import EntityIndex
+    from app.core.rag import RAGManager
+    rag = RAGManager(persist_dir=args.persist_dir)
+    if args.query:
+        # 不受 ENTITY_RETRIEVAL 开关影响，直接读当前版本的索引文件
+        index = EntityIndex.load(rag.persist_dir)
+        for name in rag.entity_extractor.find(args.query):
+            count = len(index.postings.get(name, ())) if index else 0
+            print(f"  {name}: {count} 个切片")
+        return
+
+    index = rag.build_entity_index(retag=not args.from_metadata)
+    for name, size in index.statistics()["top"].items():
+        print(f"  {name}: {size} 个切片")
+    if rag.projection_dim and not args.from_metadata:
+        # 投影集合复制了原集合的元数据，需要重新生成
+        rag.build_projection()
+        if rag.quantization:
+            rag.build_quantized_index()
+
+
+if __name__ == "__main__":
+    main()
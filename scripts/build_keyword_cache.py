@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+为当前向量库预计算关键词检索结果（无需重新导入文档）
+
+用法:
+    python scripts/build_keyword_cache.py
+    python scripts/build_keyword_cache.py --query 贾宝玉是谁     # 查看某个问题是否命中缓存
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="预计算关键词检索结果")
+    parser.add_argument("--persist-dir", default="vector_store")
+    parser.add_argument("--query", help="检查问题是否命中缓存并打印切片来源")
+    args = parser.parse_args()
+
+    from app.core.rag import RAGManager
+    rag = RAGManager(persist_dir=args.persist_dir)
+    if not rag.keyword_cache_enabled:
+        print("ℹ️  KEYWORD_CACHE 未开启，服务不会使用该缓存（在 .env 中设置 KEYWORD_CACHE=true）")
+    if args.query:
+        docs = rag.cached_search(args.query, k=rag.keyword_cache_k)
+        if docs is None:
+            print("❌ 未命中缓存")
+            return
+        for doc in docs:
+            print(f"  - {doc.metadata.get('source', '未知')} 第 {doc.metadata.get('page', '?')} 页: {doc.page_content[:60]}")
+        return
+    rag.build_keyword_cache()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+为已有向量库拟合降维投影（无需重新导入文档）
+
+用法:
+    python scripts/build_projection.py                 # 使用 VECTOR_PROJECTION_DIM（默认 256）
+    python scripts/build_projection.py --dim 384
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="拟合降维投影")
+    parser.add_argument("--dim", type=int, default=int(os.getenv("VECTOR_PROJECTION_DIM", "0") or 256))
+    parser.add_argument("--persist-dir", default="vector_store")
+    args = parser.parse_args()
+
+    from app.core.rag import RAGManager
+    rag = RAGManager(persist_dir=args.persist_dir)
+    rag.build_projection(args.dim)
+    if rag.quantization:
+        rag.build_quantized_index()
+    print(f"\n💡 在 .env 中设置 VECTOR_PROJECTION_DIM={args.dim} 后重启服务即可使用")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+为已有向量库构建量化索引（无需重新导入文档）
+
+用法:
+    python scripts/build_quantized_index.py            # 使用 VECTOR_QUANTIZATION（默认 int8）
+    python scripts/build_quantized_index.py --mode pq
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建量化索引")
+    parser.add_argument("--mode", choices=["int8", "pq"], default=os.getenv("VECTOR_QUANTIZATION") or "int8")
+    parser.add_argument("--persist-dir", default="vector_store")
+    args = parser.parse_args()
+
+    from app.core.rag import RAGManager
+    rag = RAGManager(persist_dir=args.persist_dir)
+    rag.build_quantized_index(args.mode)
+    print(f"\n💡 在 .env 中设置 VECTOR_QUANTIZATION={args.mode} 后重启服务即可使用")
+
+
+if __name__ == "__main__":
+    main()
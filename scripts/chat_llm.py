@@ -9,34 +9,42 @@ import sys
 import os
 sys.path.append(os.getcwd())
 
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage
+from app.core.llm_provider import get_provider_pool
+from app.core.profiler import RequestProfiler, print_summary
+from langchain_core.messages import HumanMessage
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# 检查是否使用 --profile 模式（对每次提问做性能分析）
+PROFILE = "--profile" in sys.argv
+if PROFILE:
+    sys.argv.remove("--profile")
+last_profile = None
+
 def get_llm():
     """获取 LLM 实例"""
-    provider = os.getenv("MODEL_PROVIDER", "aliyun").lower()
+    pool = get_provider_pool()
     
-    if provider == "groq":
-        llm = ChatOpenAI(
-            model=os.getenv("GROQ_LLM_MODEL", "llama-3.3-70b-versatile"),
-            openai_api_base="https://api.groq.com/openai/v1",
-            openai_api_key=os.getenv("GROQ_API_KEY")
-        )
-        print(f"✅ 使用 Groq 模型: {os.getenv('GROQ_LLM_MODEL', 'llama-3.3-70b-versatile')}")
+    if pool.primary == "groq":
+        print(f"✅ 使用 Groq 模型: {pool.model_name()}")
         print("💰 完全免费模式（不使用知识库）")
     else:
-        llm = ChatOpenAI(
-            model=os.getenv("LLM_MODEL", "qwen-plus"),
-            openai_api_base="https://dashscope.aliyuncs.com/compatible-mode/v1",
-            openai_api_key=os.getenv("DASHSCOPE_API_KEY")
-        )
-        print(f"✅ 使用阿里云模型: {os.getenv('LLM_MODEL', 'qwen-plus')}")
+        print(f"✅ 使用阿里云模型: {pool.model_name()}")
         print("💰 按 Token 计费（不使用知识库）")
     
-    return llm
+    # 连接池与 ChatOpenAI 一样提供 invoke()，额外带重试预算和对冲请求
+    return pool
+
+def profiled(label, func, *args):
+    """--profile 时用 cProfile 分析本次调用，并在回答之后打印耗时最多的函数"""
+    global last_profile
+    if not PROFILE:
+        return func(*args)
+    profiler = RequestProfiler(label)
+    result = profiler.run(func, *args)
+    last_profile = profiler.summary
+    return result
 
 def print_separator():
     print("\n" + "=" * 70 + "\n")
@@ -51,13 +59,14 @@ def single_question_mode(llm, query):
     
     try:
         messages = [HumanMessage(content=query)]
-        response = llm.invoke(messages)
+        response = profiled(query, llm.invoke, messages)
         
         print("🤖 回答：")
         print("-" * 70)
         print(response.content)
         print("-" * 70)
         print("\n📊 数据来源：❌ 纯 LLM（未使用知识库）")
+        print_summary(last_profile)
         print("\n" + "=" * 70)
         
     except Exception as e:
@@ -108,7 +117,7 @@ def interactive_mode(llm):
             try:
                 # 构建消息（包含历史）
                 messages = conversation_history + [HumanMessage(content=query)]
-                response = llm.invoke(messages)
+                response = profiled(query, llm.invoke, messages)
                 
                 # 保存到历史
                 conversation_history.append(HumanMessage(content=query))
@@ -123,6 +132,7 @@ def interactive_mode(llm):
                 print(response.content)
                 print("-" * 70)
                 print("\n📊 数据来源：❌ 纯 LLM（未使用知识库）")
+                print_summary(last_profile)
                 
             except Exception as e:
                 print(f"❌ 处理问题时出错：{e}")
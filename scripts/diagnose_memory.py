@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+内存诊断脚本
+按组件统计内存（Embedding 模型、Chroma、配置、LLM 客户端、Agent 图等），
+可选列出 tracemalloc 分配最多的代码位置，并连续执行 N 次合成请求观察内存增长
+
+用法:
+    python scripts/diagnose_memory.py                      # 组件内存
+    python scripts/diagnose_memory.py --requests 200       # 加上 200 次合成请求的增长测试
+    python scripts/diagnose_memory.py --tracemalloc 20     # 从启动开始追踪，列出前 20 个分配位置
+    python scripts/diagnose_memory.py --requests 50 --with-llm   # 合成请求调用 LLM（建议配合 fake_llm_server.py）
+"""
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def print_section(text):
+    print("\n" + text)
+    print("-" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="内存诊断")
+    parser.add_argument("--requests", type=int, default=0, help="合成请求数（0 表示不做增长测试）")
+    parser.add_argument("--with-llm", action="store_true", help="合成请求调用 LLM")
+    parser.add_argument("--tracemalloc", type=int, default=0, metavar="N",
+                        help="从启动开始开启 tracemalloc，并列出分配最多的前 N 个代码位置")
+    parser.add_argument("--agent-graph", action="store_true", help="统计 Agent 图大小")
+    parser.add_argument("--json", help="同时把完整结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    if args.tracemalloc:
+        tracemalloc.start(10)
+
+    from app.core import memory_diagnostics
+    baseline = memory_diagnostics.process_memory()
+
+    print("⏳ 正在初始化 AgentManager（加载 Embedding 模型）...")
+    from app.core.agent import AgentManager
+    agent = AgentManager()
+    after_init = memory_diagnostics.process_memory()
+    agent.rag._ensure_vector_store()
+    after_store = memory_diagnostics.process_memory()
+
+    report = memory_diagnostics.component_report(agent, include_agent_graph=args.agent_graph)
+    report["startup"] = {
+        "baseline_rss_mb": baseline.get("rss_mb"),
+        "after_agent_init_rss_mb": after_init.get("rss_mb"),
+        "after_vector_store_rss_mb": after_store.get("rss_mb"),
+    }
+
+    print_section("🧠 进程内存")
+    for name, value in report["process"].items():
+        print(f"  {name}: {value} MB")
+    startup = report["startup"]
+    print(f"  启动前 {startup['baseline_rss_mb']} MB → AgentManager 初始化后 {startup['after_agent_init_rss_mb']} MB "
+          f"→ 打开向量库后 {startup['after_vector_store_rss_mb']} MB")
+
+    print_section("📦 各组件")
+    components = report["components"]
+    embedding = components["embedding_model"]
+    if "parameters_mb" in embedding:
+        print(f"  Embedding 模型 ({embedding['type']}): 参数 {embedding['parameters_mb']} MB, "
+              f"buffer {embedding['buffers_mb']} MB, 设备 {embedding['device']}")
+    else:
+        print(f"  Embedding 模型 ({embedding['type']}): {embedding.get('note') or str(embedding.get('python_objects_mb')) + ' MB'}")
+    chroma = components["chroma"]
+    print(f"  Chroma: {chroma.get('vectors', 0)} 个向量, 向量约 {chroma.get('vectors_mb', 0)} MB, "
+          f"HNSW 索引 {chroma.get('hnsw_index_mb', 0)} MB, 磁盘 {chroma['disk_mb']} MB")
+    for name in ("keyword_matcher_mb", "few_shot_manager_mb", "document_tagger_mb", "llm_clients_mb",
+                 "in_flight_documents_mb", "agent_graph_mb"):
+        if name in components:
+            print(f"  {name[:-3]}: {components[name]} MB")
+    print(f"  Python 对象数: {report['gc_objects']}")
+
+    if args.tracemalloc:
+        report["top_allocators"] = memory_diagnostics.top_allocators(args.tracemalloc)
+        print_section(f"🔎 tracemalloc 分配最多的 {args.tracemalloc} 个位置")
+        for item in report["top_allocators"]:
+            print(f"  {item['size_kb']:>10.1f} KB  {item['count']:>8}  {item['location']}")
+
+    if args.requests:
+        print_section(f"📈 连续 {args.requests} 次合成请求的内存增长")
+        growth = memory_diagnostics.measure_growth(agent, args.requests, with_llm=args.with_llm)
+        report["growth"] = growth
+        for sample in growth["samples"]:
+            print(f"  {sample['requests']:>6} 次: RSS {sample['rss_mb']} MB, Python 堆 {sample['python_heap_mb']} MB")
+        print(f"\n  RSS 增长: {growth['rss_growth_mb']} MB, Python 堆增长: {growth['python_heap_growth_mb']} MB "
+              f"（每次请求 {growth['python_heap_growth_per_request_kb']} KB）")
+        if growth["top_growth"]:
+            print("  增长最多的代码位置:")
+            for item in growth["top_growth"]:
+                print(f"    +{item['size_diff_kb']} KB ({item['count_diff']:+d})  {item['location']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
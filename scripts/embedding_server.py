@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+共享 Embedding 服务
+一个进程加载 Embedding 模型，同一台机器上的所有 uvicorn worker 共用
+
+用法:
+    python scripts/embedding_server.py --url unix:///tmp/kb_embedding.sock
+    EMBEDDING_SERVICE_URL=unix:///tmp/kb_embedding.sock venv/bin/python -m uvicorn app.main:app --workers 8
+"""
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共享 Embedding 服务")
+    parser.add_argument("--url", default=os.getenv("EMBEDDING_SERVICE_URL", "unix:///tmp/kb_embedding.sock"),
+                        help="监听地址：unix:///path/to.sock 或 http://127.0.0.1:8765")
+    parser.add_argument("--max-batch", type=int, default=64, help="单批最多文本数")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="凑批最多等待毫秒数")
+    args = parser.parse_args()
+
+    from app.core.rag import load_local_embeddings
+    from app.core.embedding_service import EmbeddingServer
+
+    model_name = os.getenv("LOCAL_EMBEDDING_MODEL", "BAAI/bge-large-zh-v1.5")
+    server = EmbeddingServer(
+        load_local_embeddings(),
+        model_name=model_name,
+        max_batch=args.max_batch,
+        max_wait_ms=args.max_wait_ms,
+    )
+
+    print(f"🚀 Embedding 服务已启动: {args.url}")
+    print(f"   批大小上限 {args.max_batch}，凑批等待 {args.max_wait_ms}ms")
+    print(f"💡 worker 端设置: EMBEDDING_SERVICE_URL={args.url}")
+    try:
+        server.serve(args.url)
+    except KeyboardInterrupt:
+        print("\n👋 已停止")
+
+
+if __name__ == "__main__":
+    main()
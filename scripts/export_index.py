@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+导出当前向量库为便携包（切片、元数据、向量），供新节点直接导入，无需重新计算 Embedding
+
+用法:
+    python scripts/export_index.py                        # 写入 exports/index_<版本>.zip
+    python scripts/export_index.py --out /tmp/kb.zip
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出向量库")
+    parser.add_argument("--persist-dir", default="vector_store")
+    parser.add_argument("--out", help="输出路径（默认 exports/index_<版本>.zip）")
+    args = parser.parse_args()
+
+    from app.core.rag import RAGManager
+    rag = RAGManager(persist_dir=args.persist_dir)
+    out = args.out or os.path.join("exports", f"index_{rag.index_version or time.strftime('%Y%m%d_%H%M%S')}.zip")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+
+    started = time.perf_counter()
+    manifest = rag.export_bundle(out)
+    print(f"✅ 已导出 {manifest['count']} 个切片（{manifest['dim']} 维，{manifest['embedding_model']}）"
+          f"→ {out}（{os.path.getsize(out) / 1024 / 1024:.1f} MB，耗时 {time.perf_counter() - started:.1f}s）")
+    print(f"💡 新节点上运行: python scripts/import_index.py {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+本地 OpenAI 兼容测试桩
+模拟 /v1/chat/completions（流式和非流式），用于连接池 / 压测，不消耗付费 API
+
+用法:
+    python scripts/fake_llm_server.py --port 9000 --first-token-latency 0.3 --tokens-per-sec 50
+    GROQ_API_BASE=http://127.0.0.1:9000/v1 MODEL_PROVIDER=groq python scripts/chat_llm.py "你好"
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 回答内容：循环输出这段文字，每个字符算一个 token
+ANSWER_TEXT = "这是本地测试桩返回的回答。林黛玉是《红楼梦》中的主要人物，贾宝玉的表妹，居住在大观园潇湘馆。"
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive
+    config = None  # 由 build_server() 注入 argparse 参数
+
+    def log_message(self, format, *args):
+        if self.config.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json({"object": "list", "data": [{"id": "fake-model", "object": "model"}]})
+        else:
+            self._send_json({"error": {"message": "not found"}}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json({"error": {"message": "not found"}}, status=404)
+            return
+
+        if random.random() < self.config.fail_rate:
+            self._send_json({"error": {"message": "injected failure", "type": "server_error"}}, status=500)
+            return
+
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+        max_tokens = body.get("max_tokens") or self.config.max_tokens
+        completion_tokens = min(self.config.max_tokens, max_tokens)
+        tokens = [ANSWER_TEXT[i % len(ANSWER_TEXT)] for i in range(completion_tokens)]
+        model = body.get("model", "fake-model")
+
+        time.sleep(self._jitter(self.config.first_token_latency))
+
+        if body.get("stream"):
+            self._stream(model, tokens, prompt_tokens, body.get("stream_options") or {})
+        else:
+            time.sleep(len(tokens) / self.config.tokens_per_sec)
+            self._send_json({
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(tokens),
+                    "total_tokens": prompt_tokens + len(tokens),
+                },
+            })
+
+    def _jitter(self, seconds):
+        return max(seconds * (1 + random.uniform(-self.config.jitter, self.config.jitter)), 0)
+
+    def _stream(self, model, tokens, prompt_tokens, stream_options):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        def event(delta, finish_reason=None, usage=None):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+            }
+            if usage is not None:
+                payload["usage"] = usage
+            self._write_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n")
+
+        try:
+            event({"role": "assistant", "content": ""})
+            interval = 1.0 / self.config.tokens_per_sec
+            for token in tokens:
+                event({"content": token})
+                time.sleep(self._jitter(interval))
+            event({}, finish_reason="stop")
+            if stream_options.get("include_usage"):
+                event(None, usage={
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(tokens),
+                    "total_tokens": prompt_tokens + len(tokens),
+                })
+            self._write_chunk("data: [DONE]\n\n")
+            self._write_chunk("")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端中途断开（取消生成 / 对冲落败）
+            pass
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容测试桩")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--first-token-latency", type=float, default=0.2, help="首 token 延迟（秒）")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0, help="输出速率（token/秒）")
+    parser.add_argument("--max-tokens", type=int, default=100, help="每次回答的 token 数")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟随机抖动比例（0~1）")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="返回 500 的概率（0~1）")
+    parser.add_argument("--verbose", action="store_true", help="打印访问日志")
+    return parser
+
+
+def build_server(config):
+    """创建测试桩服务器（调用 serve_forever() 开始服务）"""
+    handler = type("ConfiguredFakeLLMHandler", (FakeLLMHandler,), {"config": config})
+    server = ThreadingHTTPServer((config.host, config.port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    config = build_parser().parse_args()
+    server = build_server(config)
+    print(f"🧪 Fake LLM 服务: http://{config.host}:{config.port}/v1")
+    print(f"   首 token 延迟 {config.first_token_latency}s，{config.tokens_per_sec} token/s，失败率 {config.fail_rate}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+从便携包导入向量库（批量写入向量，不重新计算 Embedding）
+导入到新的版本目录，校验通过后切换；运行中的服务自动切换到新版本
+
+用法:
+    python scripts/import_index.py exports/index_20250101_120000.zip
+    python scripts/import_index.py kb.zip --inspect       # 只查看包信息
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导入向量库")
+    parser.add_argument("bundle", help="export_index.py 导出的 zip 包")
+    parser.add_argument("--persist-dir", default="vector_store")
+    parser.add_argument("--inspect", action="store_true", help="只打印包信息，不导入")
+    args = parser.parse_args()
+
+    from app.core.index_bundle import read_manifest
+    manifest = read_manifest(args.bundle)
+    if args.inspect:
+        print(json.dumps(manifest, ensure_ascii=False, indent=2))
+        return
+
+    from app.core.rag import RAGManager
+    rag = RAGManager(persist_dir=args.persist_dir)
+    started = time.perf_counter()
+    result = rag.import_bundle(args.bundle)
+    if result["status"] != "success":
+        print("❌ 导入未通过校验，当前向量库保持不变")
+        sys.exit(1)
+    print(f"\n✅ 导入完成，版本 {result['version']}，总耗时 {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,9 +19,12 @@ def main():
     print("=" * 50)
     
     rag = RAGManager()
-    rag.load_and_index()
+    result = rag.rebuild_index()
+    if result["status"] != "success":
+        print("\n❌ 新版本未通过校验，当前向量库保持不变")
+        sys.exit(1)
     
-    print("\n✅ 文档已成功导入并向量化到 vector_store/ 目录")
+    print(f"\n✅ 文档已成功导入并向量化到 vector_store/ 目录（版本 {result['version']}）")
     print("💡 现在可以运行 step2_search.py 测试检索功能")
 
 if __name__ == "__main__":
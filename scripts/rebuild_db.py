@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 """
 重建向量数据库脚本
-删除旧数据库并重新导入所有文档
+重新导入所有文档到新的版本目录，校验通过后原子切换（旧版本在切换前一直可用）
+
+用法:
+    python scripts/rebuild_db.py
+    python scripts/rebuild_db.py --remove-legacy    # 切换后删除旧布局遗留的 Chroma 文件
 """
+import argparse
 import os
 import sys
-import shutil
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -111,29 +115,25 @@ def check_data_files():
     
     return True
 
-def delete_old_database():
-    """删除旧数据库"""
-    print_section("🗑️  删除旧的向量数据库")
+def show_current_version():
+    """显示当前版本（重建期间继续使用）"""
+    print_section("📦 当前向量数据库")
     
-    vector_store = Path("vector_store")
+    from app.core.index_versions import current_version, list_versions, resolve_store_dir
     
-    if vector_store.exists():
-        size = get_file_size(vector_store)
-        print(f"  旧数据库大小: {format_size(size)}")
-        
-        try:
-            shutil.rmtree(vector_store)
-            print("  ✅ 已删除")
-            return True
-        except Exception as e:
-            print(f"  ❌ 删除失败: {e}")
-            return False
-    else:
-        print("  ℹ️  向量数据库不存在，跳过删除")
-        return True
+    if not Path("vector_store").exists():
+        print("  ℹ️  向量数据库不存在，将创建第一个版本")
+        return
+    
+    version = current_version("vector_store")
+    print(f"  当前版本: {version or '旧布局（未版本化），切换后保留，可用 --remove-legacy 删除'}")
+    print(f"  大小: {format_size(get_file_size(resolve_store_dir('vector_store')))}")
+    versions = list_versions("vector_store")
+    if versions:
+        print(f"  已有版本: {', '.join(versions)}")
 
 def import_documents():
-    """导入文档"""
+    """导入文档到新版本，校验通过后切换"""
     print_section("📥 开始导入文档")
     print()
     
@@ -141,7 +141,12 @@ def import_documents():
         from app.core.rag import RAGManager
         
         rag = RAGManager()
-        rag.load_and_index()
+        result = rag.rebuild_index()
+        if result["status"] != "success":
+            for error in result.get("validation", {}).get("errors", []):
+                print(f"  ❌ {error}")
+            print("  ℹ️  当前版本保持不变")
+            return False
         
         return True
     except Exception as e:
@@ -154,9 +159,12 @@ def show_statistics():
     """显示统计信息"""
     print_section("📊 向量数据库统计")
     
-    vector_store = Path("vector_store")
+    from app.core.index_versions import current_version, resolve_store_dir
+    
+    vector_store = Path(resolve_store_dir("vector_store"))
     
     if vector_store.exists():
+        print(f"  版本: {current_version('vector_store') or '旧布局'}")
         size = get_file_size(vector_store)
         file_count = sum(1 for _ in vector_store.rglob("*") if _.is_file())
         
@@ -165,8 +173,25 @@ def show_statistics():
     else:
         print("  ❌ 向量数据库不存在")
 
+def remove_legacy_store():
+    """删除旧布局遗留的 Chroma 文件（需 --remove-legacy）"""
+    print_section("🧹 清理旧布局")
+    
+    from app.core.index_versions import remove_legacy_store as remove
+    
+    removed = remove("vector_store")
+    if removed:
+        print(f"  已删除: {', '.join(removed)}")
+    else:
+        print("  ℹ️  没有旧布局遗留的 Chroma 文件")
+
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="重建向量数据库")
+    parser.add_argument("--remove-legacy", action="store_true",
+                        help="切换后删除 vector_store/ 下旧布局遗留的 chroma.sqlite3 和 UUID 段目录")
+    args = parser.parse_args()
+    
     print_header("🔄 重建向量数据库")
     
     # 1. 检查配置
@@ -179,7 +204,8 @@ def main():
     # 3. 确认操作
     print("\n" + "="*60)
     print("⚠️  警告:")
-    print("  此操作将删除现有的向量数据库并重新导入所有文档")
+    print("  此操作将重新导入所有文档（构建新版本，校验通过后切换，旧版本按 INDEX_KEEP_VERSIONS 保留）")
+    print("  运行中的服务会自动切换到新版本，无需重启")
     print("="*60)
     
     confirm = input("\n是否继续？(y/n): ").strip().lower()
@@ -188,10 +214,8 @@ def main():
         print("\n❌ 操作已取消")
         sys.exit(0)
     
-    # 4. 删除旧数据库
-    if not delete_old_database():
-        print("\n❌ 删除旧数据库失败")
-        sys.exit(1)
+    # 4. 当前版本
+    show_current_version()
     
     # 5. 导入文档
     print_header("📥 导入文档")
@@ -210,6 +234,9 @@ def main():
     # 6. 显示统计
     show_statistics()
     
+    if args.remove_legacy:
+        remove_legacy_store()
+    
     # 7. 完成
     print_header("✅ 导入完成！")
     
@@ -42,8 +42,7 @@ if [ -d "vector_store" ]; then
     
     if [ "$reimport" = "y" ] || [ "$reimport" = "Y" ]; then
         echo ""
-        echo "🗑️  删除旧的向量数据库..."
-        rm -rf vector_store/
+        echo "🔄 将构建新版本，导入完成并校验通过后替换当前版本"
         need_import=true
     else
         echo ""
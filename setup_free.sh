@@ -35,11 +35,11 @@ fi
 echo "✅ 依赖安装完成"
 echo ""
 
-# 步骤 2：删除旧向量库
+# 步骤 2：旧向量库（导入成功后切换到新版本；旧布局遗留的文件需手动清理）
 if [ -d "vector_store" ]; then
-    echo "🗑️  步骤 2/3：删除旧向量库..."
-    rm -rf vector_store/
-    echo "✅ 旧向量库已删除"
+    echo "📦 步骤 2/3：保留旧向量库，新版本校验通过后自动切换"
+    echo "   旧布局遗留的 Chroma 文件不会自动删除，确认新版本可用后运行:"
+    echo "   python scripts/rebuild_db.py --remove-legacy"
 else
     echo "⏭️  步骤 2/3：跳过（无旧向量库）"
 fi
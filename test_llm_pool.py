@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+测试 LLM 连接池（对冲请求 / 重试 / 延迟预算）
+使用本地 OpenAI 兼容测试桩，不需要 API Key，也不消耗 token
+"""
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from scripts.fake_llm_server import build_server
+from langchain_core.messages import HumanMessage
+
+
+def start_fake_server(port, first_token_latency, fail_rate=0.0):
+    """在后台线程启动测试桩"""
+    config = SimpleNamespace(
+        host="127.0.0.1", port=port, first_token_latency=first_token_latency,
+        tokens_per_sec=200.0, max_tokens=20, jitter=0.0, fail_rate=fail_rate, verbose=False,
+    )
+    server = build_server(config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_pool(primary_port, secondary_port, hedge_after, latency_budget=10):
+    os.environ["DASHSCOPE_API_BASE"] = f"http://127.0.0.1:{primary_port}/v1"
+    os.environ["GROQ_API_BASE"] = f"http://127.0.0.1:{secondary_port}/v1"
+    os.environ["DASHSCOPE_API_KEY"] = "fake"
+    os.environ["GROQ_API_KEY"] = "fake"
+    os.environ["LLM_HEDGE_AFTER"] = str(hedge_after)
+    os.environ["LLM_LATENCY_BUDGET"] = str(latency_budget)
+
+    from app.core.llm_provider import LLMProviderPool
+    return LLMProviderPool(primary="aliyun", secondary="groq")
+
+
+def run_case(name, pool, expect_hedge_wins, expect_error=None):
+    print(f"\n{'='*60}")
+    print(f"测试：{name}")
+    print('='*60)
+
+    started = time.monotonic()
+    try:
+        text = "".join(chunk.content for chunk in pool.stream([HumanMessage(content="林黛玉是谁？")]))
+    except Exception as e:
+        if expect_error and isinstance(e, expect_error):
+            print(f"✅ 按预期抛出 {type(e).__name__}: {e}")
+            return True
+        print(f"❌ 意外错误：{e}")
+        return False
+
+    elapsed = time.monotonic() - started
+    stats = pool.get_statistics()
+    print(f"  回答：{text}")
+    print(f"  耗时：{elapsed:.2f}s")
+    print(f"  统计：{stats}")
+
+    ok = bool(text) and stats["对冲胜出数"] == expect_hedge_wins and not expect_error
+    print("✅ 通过" if ok else "❌ 失败")
+    return ok
+
+
+if __name__ == "__main__":
+    fast = start_fake_server(9101, first_token_latency=0.05)
+    slow = start_fake_server(9102, first_token_latency=3.0)
+    broken = start_fake_server(9103, first_token_latency=0.05, fail_rate=1.0)
+
+    results = [
+        run_case("主提供商正常，不触发对冲", make_pool(9101, 9102, hedge_after=0.5), expect_hedge_wins=0),
+        run_case("主提供商慢，对冲到备用提供商", make_pool(9102, 9101, hedge_after=0.5), expect_hedge_wins=1),
+        run_case("主提供商失败，切换到备用提供商", make_pool(9103, 9101, hedge_after=0), expect_hedge_wins=1),
+    ]
+
+    from app.core.llm_provider import LLMTimeoutError
+    results.append(run_case(
+        "超出延迟预算", make_pool(9102, 9102, hedge_after=0, latency_budget=1),
+        expect_hedge_wins=0, expect_error=LLMTimeoutError,
+    ))
+
+    print(f"\n{'='*60}")
+    print(f"通过 {sum(results)}/{len(results)}")
+    sys.exit(0 if all(results) else 1)
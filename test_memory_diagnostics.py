@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+测试内存增长诊断（measure_growth 默认的不调用 LLM 路径）
+用真实的 AgentManager 提示词构建流程，检索换成固定结果，不需要向量库、Embedding 模型和 API Key
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from langchain_core.documents import Document
+
+
+class FakeRAG:
+    """返回固定切片的检索桩"""
+
+    def embed_query(self, query, trace=None):
+        return [0.0] * 8
+
+    def search(self, query, k=5, trace=None, query_vector=None, filters=None):
+        return [Document(page_content=f"{query} 相关段落 {i}", metadata={"source": "data/红楼梦.epub", "page": i})
+                for i in range(k)]
+
+    def cached_search(self, query, k=5, trace=None):
+        return None
+
+
+def make_agent_manager():
+    from app.core.agent import AgentManager, RequestState
+    from app.core.prompt_builder import PromptBuilder
+
+    # 不走 __init__（会加载 Embedding 模型和 LLM 客户端），只设置提示词构建需要的字段
+    agent_manager = AgentManager.__new__(AgentManager)
+    agent_manager.rag = FakeRAG()
+    agent_manager.few_shot_manager = None
+    agent_manager.prompt_builder = PromptBuilder(None)
+    agent_manager.last_state = RequestState()
+    return agent_manager
+
+
+def test_measure_growth():
+    from app.core.memory_diagnostics import measure_growth
+
+    report = measure_growth(make_agent_manager(), requests=5)
+    assert report["requests"] == 5
+    assert report["with_llm"] is False
+    assert report["samples"] and report["samples"][-1]["requests"] == 5
+    print(f"✅ measure_growth: {report['requests']} 次请求，"
+          f"Python 堆增长 {report['python_heap_growth_per_request_kb']} KB/请求")
+
+
+if __name__ == "__main__":
+    test_measure_growth()
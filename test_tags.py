@@ -138,7 +138,7 @@ def main():
     print("💡 提示:")
     print("  - 查看文档: cat docs/DOCUMENT_TAGS.md")
     print("  - 配置标签: vim config/document_tags.json")
-    print("  - 重新导入: rm -rf vector_store && python scripts/ingest.py")
+    print("  - 重新导入: python scripts/ingest.py")
     print("  - 启动服务: ./start_web.sh")
     print()
 